@@ -0,0 +1,439 @@
+import argparse
+import datetime
+import os
+import threading
+import time
+
+import inventory_feed
+from inventory_batches import unalerted_expiring
+from instrumentation import traced
+from db_pool import DB_ERRORS
+from migrate import ensure_migrated
+from stores import get_store_registry
+
+
+# Transient failures worth reconnecting for; anything else (e.g. a rejected recipient) is not retried.
+# smtplib and email are only imported once there is mail to send, keeping them out of the app's cold start.
+def retryable_smtp_errors():
+    import smtplib
+    return smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError
+
+
+# SMTP settings from the environment; the defaults point at a local sink such as
+# `python -m aiosmtpd -n -l localhost:1025`
+def smtp_config_from_env():
+    env = os.environ
+    return {
+        "host": env.get("PHARMACY_SMTP_HOST", "localhost"),
+        "port": int(env.get("PHARMACY_SMTP_PORT", "1025")),
+        "username": env.get("PHARMACY_SMTP_USER", ""),
+        "password": env.get("PHARMACY_SMTP_PASSWORD", ""),
+        "starttls": env.get("PHARMACY_SMTP_STARTTLS", "0") == "1",
+        "sender": env.get("PHARMACY_SMTP_SENDER", "pharmacy@localhost"),
+        "timeout": float(env.get("PHARMACY_SMTP_TIMEOUT", "10")),
+    }
+
+
+def compose_alert(manager_name, drugs, recipient_email, sender):
+    body = (
+        f"Dear {manager_name},\n\n"
+        f"The following drugs are at or below their reorder level: {', '.join(drugs)}.\n"
+        "Please take the necessary action to reorder these drugs as soon as possible.\n\n"
+        "Regards,\n"
+        "Pharmacy Management System"
+    )
+    from email.mime.text import MIMEText
+    msg = MIMEText(body)
+    msg['Subject'] = "Low Stock Notification - Pharmacy Management System"
+    msg['From'] = sender
+    msg['To'] = recipient_email
+    return msg
+
+
+def compose_expiry_alert(manager_name, batches, recipient_email, sender):
+    lines = "\n".join(f"- {d_name}: {qty} units (batch {batch_id}) expiring {expiry_date}"
+                      for batch_id, d_name, expiry_date, qty in batches)
+    body = (
+        f"Dear {manager_name},\n\n"
+        f"The following stock is expiring soon:\n{lines}\n\n"
+        "Please sell, return or write off these batches before they expire.\n\n"
+        "Regards,\n"
+        "Pharmacy Management System"
+    )
+    from email.mime.text import MIMEText
+    msg = MIMEText(body)
+    msg['Subject'] = "Expiring Stock Notification - Pharmacy Management System"
+    msg['From'] = sender
+    msg['To'] = recipient_email
+    return msg
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+# (D_ID, D_name, M_ID, M_name, Email, units) for every stock row whose unexpired units are at or below its drug's
+# reorder threshold (optionally only for the given drug IDs). Rem_qty is not used since it also counts expired
+# lots, which are never sold. Thresholds, drugs and managers are read with `cursor` on the primary database,
+# the stock with `store_cursor` on the database holding it (default: the same).
+def low_stock(cursor, default_threshold=0, drug_ids=None, store_cursor=None):
+    if drug_ids is not None and not drug_ids:
+        return []
+    query = "SELECT D_ID, Threshold FROM ReorderThreshold"
+    if drug_ids is not None:
+        query += f" WHERE D_ID IN ({_placeholders(drug_ids)})"
+    cursor.execute(query, list(drug_ids or []))
+    thresholds = dict(cursor.fetchall())
+
+    # Rows at or below the highest threshold, then each against its own drug's
+    query = ("SELECT Inventory.D_ID, Inventory.M_ID, COALESCE(SUM(InventoryBatch.Qty), 0) FROM Inventory "
+             "LEFT JOIN InventoryBatch ON InventoryBatch.D_ID = Inventory.D_ID AND InventoryBatch.M_ID = Inventory.M_ID "
+             "AND InventoryBatch.Expiry_date >= %s AND InventoryBatch.Qty > 0")
+    params = [datetime.date.today()]
+    if drug_ids is not None:
+        query += f" WHERE Inventory.D_ID IN ({_placeholders(drug_ids)})"
+        params.extend(drug_ids)
+    query += " GROUP BY Inventory.D_ID, Inventory.M_ID HAVING COALESCE(SUM(InventoryBatch.Qty), 0) <= %s"
+    params.append(max([default_threshold] + list(thresholds.values())))
+    (store_cursor or cursor).execute(query, params)
+    stock = [(d_id, m_id, rem_qty) for d_id, m_id, rem_qty in (store_cursor or cursor).fetchall()
+             if rem_qty <= thresholds.get(d_id, default_threshold)]
+    if not stock:
+        return []
+
+    d_ids = sorted({row[0] for row in stock})
+    cursor.execute(f"SELECT D_ID, D_name FROM Drugs WHERE D_ID IN ({_placeholders(d_ids)})", d_ids)
+    names = dict(cursor.fetchall())
+    m_ids = sorted({row[1] for row in stock})
+    cursor.execute(f"SELECT M_ID, M_name, Email FROM Manager WHERE M_ID IN ({_placeholders(m_ids)})", m_ids)
+    managers = {m_id: (m_name, email) for m_id, m_name, email in cursor.fetchall()}
+    return [(d_id, names[d_id], m_id, *managers[m_id], rem_qty) for d_id, m_id, rem_qty in stock
+            if d_id in names and m_id in managers]
+
+
+# Sends batches of messages over one SMTP session, reconnecting with exponential backoff on transient errors
+class SMTPMailer:
+    def __init__(self, config, max_retries=3, backoff=1.0, sleep=time.sleep):
+        self.config = config
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._sleep = sleep
+        self._server = None
+        self.connections = 0
+
+    def _session(self):
+        import smtplib
+        if self._server is None:
+            server = smtplib.SMTP(self.config["host"], self.config["port"], timeout=self.config["timeout"])
+            try:
+                if self.config["starttls"]:
+                    server.starttls()
+                if self.config["username"]:
+                    server.login(self.config["username"], self.config["password"])
+            except BaseException:
+                server.close()
+                raise
+            self._server = server
+            self.connections += 1
+        return self._server
+
+    def _send(self, msg):
+        retryable = retryable_smtp_errors()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._session().send_message(msg)
+                return
+            except retryable:
+                self.close()
+                if attempt == self.max_retries:
+                    raise
+                self._sleep(self.backoff * 2 ** attempt)
+
+    # Send every message; returns (sent, failed) lists. The session stays open for the next batch.
+    @traced("smtp.send_batch")
+    def send_batch(self, messages):
+        import smtplib
+        sent, failed = [], []
+        for msg in messages:
+            try:
+                self._send(msg)
+                sent.append(msg)
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"Error sending email to {msg['To']}:", e)
+                failed.append(msg)
+        return sent, failed
+
+    def close(self):
+        import smtplib
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+
+# Emails each store's manager once per shortage of a drug at or below its reorder threshold. Stock changes
+# from the inventory feed are evaluated as they happen; a full reconcile every `interval` seconds catches
+# anything the feed missed (failed sends, events from other processes). An alert is not repeated until the
+# stock has recovered above the threshold and dropped again. Each reconcile also alerts once per batch
+# expiring within `expiry_days` days. Every database holding stores (see stores.py) is checked in turn; its
+# alert logs and feed offset are kept in it, next to the stock they are about.
+class AlertScheduler:
+    CONSUMER = "low-stock-alerts"
+
+    def __init__(self, mailer, interval=300, default_threshold=0, default_recipient=None, batch_delay=1.0,
+                 expiry_days=30):
+        self.mailer = mailer
+        self.interval = interval
+        self.default_threshold = default_threshold
+        self.default_recipient = default_recipient
+        self.expiry_days = expiry_days
+        self.batch_delay = batch_delay
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {"reconciles": 0, "events": 0, "queued": 0, "sent": 0, "suppressed": 0, "failed": 0,
+                       "resolved": 0, "expiring_batches": 0}
+
+    # Send alerts for `low` rows not alerted yet, and forget alerts among `touched` (D_ID, M_ID) pairs that
+    # are no longer low (touched=None means `low` covers every pair). AlertLog is written after the mail has
+    # gone out and is left for the caller to commit, so inventory_feed.consume commits it together with the
+    # feed offset. A crash between sending and that commit sends those alerts again. Returns the number of
+    # alerts sent.
+    def _evaluate(self, conn, cursor, low, touched=None):
+        cursor.execute("SELECT D_ID, M_ID FROM AlertLog")
+        already_sent = {(d_id, m_id) for d_id, m_id in cursor.fetchall()}
+
+        current = {(row[0], row[2]) for row in low}
+        resolved = (already_sent if touched is None else already_sent & touched) - current
+
+        pending = {}
+        suppressed = 0
+        for d_id, d_name, m_id, m_name, email, rem_qty in low:
+            if (d_id, m_id) in already_sent:
+                suppressed += 1
+                continue
+            recipient = email or self.default_recipient
+            if not recipient:
+                suppressed += 1
+                continue
+            batch = pending.setdefault((m_id, recipient), {"name": m_name, "drugs": [], "rows": []})
+            batch["drugs"].append(d_name)
+            batch["rows"].append((d_id, m_id, rem_qty))
+
+        messages = {}
+        for (m_id, recipient), batch in pending.items():
+            msg = compose_alert(batch["name"], batch["drugs"], recipient, self.mailer.config["sender"])
+            messages[id(msg)] = (msg, batch["rows"])
+        with self._lock:
+            self._stats["queued"] += len(messages)
+            self._stats["suppressed"] += suppressed
+            self._stats["resolved"] += len(resolved)
+
+        sent, failed = self.mailer.send_batch([msg for msg, rows in messages.values()])
+        now = datetime.datetime.now().replace(microsecond=0)
+        logged = [(d_id, m_id, rem_qty, now) for msg in sent for d_id, m_id, rem_qty in messages[id(msg)][1]]
+        if resolved:
+            cursor.executemany("DELETE FROM AlertLog WHERE D_ID = %s AND M_ID = %s", sorted(resolved))
+        if logged:
+            cursor.executemany("INSERT INTO AlertLog (D_ID, M_ID, Rem_qty, Sent_at) VALUES (%s, %s, %s, %s)", logged)
+        with self._lock:
+            self._stats["sent"] += len(sent)
+            self._stats["failed"] += len(failed)
+        return len(sent)
+
+    # Alert each store's manager once per batch in the store database expiring within expiry_days; managers
+    # are read from the primary database. Returns the number of alerts sent.
+    def _expiry_alerts(self, conn, cursor, store_conn, store_cursor):
+        batches = unalerted_expiring(store_cursor, self.expiry_days)
+        store_conn.rollback()
+        if not batches:
+            return 0
+        m_ids = sorted({row[3] for row in batches})
+        cursor.execute(f"SELECT M_ID, M_name, Email FROM Manager WHERE M_ID IN ({_placeholders(m_ids)})", m_ids)
+        managers = {m_id: (m_name, email) for m_id, m_name, email in cursor.fetchall()}
+        conn.rollback()
+
+        pending = {}
+        suppressed = 0
+        for batch_id, d_id, d_name, m_id, expiry_date, qty in batches:
+            m_name, email = managers.get(m_id, (None, None))
+            recipient = email or self.default_recipient
+            if not recipient:
+                suppressed += 1
+                continue
+            pending.setdefault((m_id, recipient), {"name": m_name, "batches": []})["batches"].append(
+                (batch_id, d_name, expiry_date, qty))
+
+        messages = {}
+        for (m_id, recipient), batch in pending.items():
+            msg = compose_expiry_alert(batch["name"], batch["batches"], recipient, self.mailer.config["sender"])
+            messages[id(msg)] = (msg, [row[0] for row in batch["batches"]])
+        with self._lock:
+            self._stats["queued"] += len(messages)
+            self._stats["suppressed"] += suppressed
+
+        sent, failed = self.mailer.send_batch([msg for msg, batch_ids in messages.values()])
+        now = datetime.datetime.now().replace(microsecond=0)
+        logged = [(batch_id, now) for msg in sent for batch_id in messages[id(msg)][1]]
+        if logged:
+            store_cursor.executemany("INSERT INTO ExpiryAlertLog (Batch_ID, Sent_at) VALUES (%s, %s)", logged)
+            store_conn.commit()
+        with self._lock:
+            self._stats["sent"] += len(sent)
+            self._stats["failed"] += len(failed)
+            self._stats["expiring_batches"] += len(logged)
+        return len(sent)
+
+    # Full pass over every stock row and the expiring batches of every database; returns the number of alerts sent
+    def reconcile(self):
+        registry = get_store_registry()
+        sent = 0
+        with registry.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for group in registry.groups():
+                    with registry.group_connection(group, conn) as store_conn:
+                        store_cursor = store_conn.cursor()
+                        try:
+                            latest = inventory_feed.latest_event_id(store_cursor)
+                            sent += self._evaluate(store_conn, store_cursor,
+                                                   low_stock(cursor, self.default_threshold, store_cursor=store_cursor))
+                            # The scan already covers every earlier event, so a new consumer starts from here
+                            if inventory_feed.consumer_offset(store_cursor, self.CONSUMER) is None:
+                                inventory_feed.set_consumer_offset(store_conn, store_cursor, self.CONSUMER, latest)
+                            store_conn.commit()
+                            if self.expiry_days:
+                                sent += self._expiry_alerts(conn, cursor, store_conn, store_cursor)
+                        finally:
+                            store_cursor.close()
+            finally:
+                cursor.close()
+        with self._lock:
+            self._stats["reconciles"] += 1
+        return sent
+
+    # Evaluate only the (drug, store) pairs changed since the last pass, reading each database's feed from its
+    # own offset; returns the number of alerts sent
+    def process_changes(self):
+        registry = get_store_registry()
+        sent = handled = 0
+        with registry.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for group in registry.groups():
+                    with registry.group_connection(group, conn) as store_conn:
+                        store_cursor = store_conn.cursor()
+
+                        def handle(events):
+                            nonlocal sent
+                            touched = {(event.D_ID, event.M_ID) for event in events}
+                            low = [row for row in low_stock(cursor, self.default_threshold,
+                                                            sorted({d for d, m in touched}), store_cursor)
+                                   if (row[0], row[2]) in touched]
+                            sent += self._evaluate(store_conn, store_cursor, low, touched)
+
+                        try:
+                            handled += inventory_feed.consume(store_conn, self.CONSUMER, handle)
+                        finally:
+                            store_cursor.close()
+            finally:
+                cursor.close()
+        with self._lock:
+            self._stats["events"] += handled
+        return sent
+
+    def _loop(self):
+        next_reconcile = 0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_reconcile:
+                    next_reconcile = time.monotonic() + self.interval
+                    self.reconcile()
+                else:
+                    self.process_changes()
+            except DB_ERRORS as err:
+                print("Alert scheduler database error:", err)
+            except Exception as e:
+                print("Alert scheduler error:", e)
+            self._wake.wait(max(0, next_reconcile - time.monotonic()))
+            self._wake.clear()
+            # Let a burst of stock changes accumulate into one batch
+            self._stop.wait(self.batch_delay)
+        self.mailer.close()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="low-stock-alerts", daemon=True)
+            inventory_feed.listeners.append(self._wake.set)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                inventory_feed.listeners.remove(self._wake.set)
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["smtp_connections"] = self.mailer.connections
+        return stats
+
+
+# The app starts the scheduler only with PHARMACY_ALERTS=1; otherwise it runs as `python alert_scheduler.py`
+def alerts_enabled_from_env():
+    return os.environ.get("PHARMACY_ALERTS", "0") == "1"
+
+
+def alert_scheduler_from_env():
+    env = os.environ
+    return AlertScheduler(
+        SMTPMailer(smtp_config_from_env(), max_retries=int(env.get("PHARMACY_SMTP_RETRIES", "3"))),
+        interval=float(env.get("PHARMACY_ALERT_INTERVAL", "300")),
+        default_threshold=int(env.get("PHARMACY_ALERT_THRESHOLD", "0")),
+        default_recipient=env.get("PHARMACY_ALERT_RECIPIENT") or None,
+        expiry_days=int(env.get("PHARMACY_EXPIRY_ALERT_DAYS", "30")),
+    )
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_alert_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = alert_scheduler_from_env()
+        return _scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Email managers about low and expiring stock")
+    parser.add_argument("--once", action="store_true", help="Run a single pass and exit")
+    args = parser.parse_args()
+
+    ensure_migrated()
+    scheduler = get_alert_scheduler()
+    if args.once:
+        scheduler.reconcile()
+        scheduler.mailer.close()
+    else:
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(scheduler.interval)
+                print(scheduler.stats())
+        except KeyboardInterrupt:
+            scheduler.stop()
+    print(scheduler.stats())
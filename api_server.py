@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import datetime
+import decimal
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import db_pool
+import pharmacy_service as service
+from auth import get_authenticator
+from db_pool import DB_ERRORS
+from instrumentation import get_instrumentation
+from migrate import ensure_migrated
+from order_pipeline import InsufficientStockError
+from paged_queries import INVENTORY_COLUMNS, INVENTORY_SORTS, ORDERS_COLUMNS, SALES_COLUMNS, SALES_SORTS
+
+MAX_PAGE_SIZE = 500
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.timedelta):
+        # MySQL returns TIME columns as timedelta objects
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+_dumps = functools.partial(json.dumps, default=_json_default)
+
+
+def _json(data, status=200):
+    return web.json_response(data, status=status, dumps=_dumps)
+
+
+def _error(status, message):
+    return _json({"error": message}, status)
+
+
+def _int_param(request, name, default=None, minimum=1, maximum=None):
+    value = request.query.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number")
+    if number < minimum or (maximum is not None and number > maximum):
+        raise ValueError(f"{name} must be between {minimum} and {maximum}" if maximum else f"{name} must be at least {minimum}")
+    return number
+
+
+def _date_param(request, name):
+    value = request.query.get(name)
+    return datetime.date.fromisoformat(value) if value else None
+
+
+async def _body(request):
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise ValueError("The request body must be a JSON object")
+    return body
+
+
+def _required_int(body, name):
+    try:
+        return int(body[name])
+    except KeyError:
+        raise ValueError(f"{name} is required")
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a whole number")
+
+
+def _optional_str(body, name, default=None):
+    value = body.get(name, default)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{name} must be a string")
+    return value
+
+
+def _supplier_fields(body):
+    return [_optional_str(body, name) for name in ("S_name", "S_address", "S_phone")]
+
+
+def _page(page, columns):
+    return {"rows": [dict(zip(columns, row)) for row in page.rows],
+            "next_after": service.encode_cursor(page.next_after), "incomplete": page.failed}
+
+
+# JSON API over pharmacy_service. Handlers run on the event loop; each service call runs on a worker thread
+# with a pooled connection, and the worker count matches the pool size so no request waits for a checkout
+# while holding a thread.
+class PharmacyApi:
+    def __init__(self, workers=None):
+        workers = workers or db_pool.db_config_from_env()["pool_size"]
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-db")
+
+    async def call(self, fn, *args):
+        def run():
+            with db_pool.connection() as conn:
+                return fn(conn, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+
+    # (user_type, user_id) of the request's bearer token; the same tokens the Streamlit app issues at login
+    def user(self, request, user_type):
+        header = request.headers.get("Authorization", "")
+        claims = get_authenticator().verify_token(header[7:] if header.startswith("Bearer ") else None)
+        if claims is None:
+            raise web.HTTPUnauthorized(text=_dumps({"error": "Missing or expired token"}),
+                                       content_type="application/json")
+        if user_type is not None and claims[0] != user_type:
+            raise web.HTTPForbidden(text=_dumps({"error": f"{user_type} login required"}),
+                                    content_type="application/json")
+        return claims
+
+    @web.middleware
+    async def errors(self, request, handler):
+        route = request.match_info.route.name or "unmatched"
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = await handler(request)
+            failed = response.status >= 500
+            return response
+        except web.HTTPException:
+            failed = False
+            raise
+        except InsufficientStockError as err:
+            failed = False
+            return _error(409, str(err))
+        except service.NotFoundError as err:
+            failed = False
+            return _error(404, str(err))
+        except ValueError as err:
+            failed = False
+            return _error(400, str(err))
+        except DB_ERRORS as err:
+            print(f"API {request.method} {request.path}: database error: {err}")
+            return _error(503, "Database unavailable")
+        finally:
+            get_instrumentation().record(f"api.{route}", time.perf_counter() - start, failed)
+
+    async def health(self, request):
+        return _json({"status": "ok"})
+
+    async def login(self, request):
+        body = await _body(request)
+        token = await self.call(service.login, _optional_str(body, "username", ""),
+                                _optional_str(body, "password", ""), _optional_str(body, "user_type", "Customer"))
+        if token is None:
+            return _error(401, "Invalid credentials")
+        return _json({"token": token, "expires_in": get_authenticator().session_ttl})
+
+    async def drugs(self, request):
+        self.user(request, None)
+        rows = await self.call(service.drug_stock)
+        return _json([{"D_ID": d_id, "D_name": name, "Rem_qty": rem_qty} for d_id, name, rem_qty in rows])
+
+    async def drug(self, request):
+        self.user(request, None)
+        drug_id = int(request.match_info["drug_id"])
+        details = await self.call(service.drug_details, [drug_id])
+        if drug_id not in details:
+            raise service.NotFoundError(f"Drug {drug_id} not found")
+        return _json(details[drug_id])
+
+    async def scan(self, request):
+        self.user(request, None)
+        image = await request.read()
+        if not image:
+            raise ValueError("Send the QR code image as the request body")
+        results = await self.call(service.scan_qr, image)
+        return _json([{"payload": result.payload, "D_ID": result.drug_id, "details": result.details}
+                      for result in results])
+
+    async def place_order(self, request):
+        _, customer_id = self.user(request, "Customer")
+        body = await _body(request)
+        lines = body.get("lines")
+        if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+            raise ValueError("lines must be a list of {drug_id, quantity} objects")
+        items = [(_required_int(line, "drug_id"), _required_int(line, "quantity")) for line in lines]
+        store_id, allocations = await self.call(service.place_order, customer_id, items)
+        return _json({"store_id": store_id,
+                      "lines": [{"D_ID": line.drug_id, "D_name": line.drug_name, "Qty": line.quantity, "M_ID": m_id}
+                                for line, m_id in allocations]}, 201)
+
+    async def orders(self, request):
+        _, customer_id = self.user(request, "Customer")
+        page = await self.call(service.customer_orders, customer_id,
+                               service.decode_cursor(request.query.get("after"), 1),
+                               _int_param(request, "page_size", 50, maximum=MAX_PAGE_SIZE))
+        return _json(_page(page, ORDERS_COLUMNS))
+
+    async def inventory(self, request):
+        self.user(request, "Manager")
+        sort = request.query.get("sort", "Drug ID")
+        if sort not in INVENTORY_SORTS:
+            raise ValueError(f"sort must be one of: {', '.join(INVENTORY_SORTS)}")
+        page = await self.call(service.inventory_page,
+                               service.decode_cursor(request.query.get("after"), len(INVENTORY_SORTS[sort][0])),
+                               _int_param(request, "page_size", 50, maximum=MAX_PAGE_SIZE),
+                               _int_param(request, "store"), sort)
+        return _json(_page(page, INVENTORY_COLUMNS))
+
+    async def movements(self, request):
+        self.user(request, "Manager")
+        events = await self.call(service.stock_movements, _int_param(request, "store"),
+                                 _int_param(request, "limit", 50, maximum=MAX_PAGE_SIZE))
+        return _json([event._asdict() for event in events])
+
+    async def expiring(self, request):
+        self.user(request, "Manager")
+        rows = await self.call(service.expiring_batches, _int_param(request, "days", 30, minimum=0),
+                               _int_param(request, "store"))
+        return _json([dict(zip(["Batch_ID", "D_ID", "D_name", "M_ID", "Expiry_date", "Qty"], row)) for row in rows])
+
+    # Restock the calling manager's own store
+    async def restock(self, request):
+        _, manager_id = self.user(request, "Manager")
+        body = await _body(request)
+        drug_id = _required_int(body, "drug_id")
+        expiry = body.get("expiry_date")
+        rem_qty = await self.call(service.restock_store, manager_id, drug_id, _required_int(body, "quantity"),
+                                  datetime.date.fromisoformat(str(expiry)) if expiry else None)
+        return _json({"D_ID": drug_id, "M_ID": manager_id, "Rem_qty": rem_qty})
+
+    async def write_off(self, request):
+        _, manager_id = self.user(request, "Manager")
+        units = await self.call(service.write_off_store, manager_id)
+        return _json({"M_ID": manager_id, "written_off": units})
+
+    async def stock(self, request):
+        self.user(request, "Manager")
+        drug_name = request.query.get("drug", "").strip()
+        if not drug_name:
+            raise ValueError("drug is required")
+        result = await self.call(service.find_stock, drug_name, _int_param(request, "quantity", 1))
+        return _json({"stores": [stock._asdict() for stock in result.rows], "incomplete": result.failed,
+                      "seconds": round(result.seconds, 6)})
+
+    async def sales(self, request):
+        self.user(request, "Manager")
+        sort = request.query.get("sort", "Newest first")
+        if sort not in SALES_SORTS:
+            raise ValueError(f"sort must be one of: {', '.join(SALES_SORTS)}")
+        page = await self.call(service.sales_page,
+                               service.decode_cursor(request.query.get("after"), len(SALES_SORTS[sort][0])),
+                               _int_param(request, "page_size", 50, maximum=MAX_PAGE_SIZE),
+                               _date_param(request, "from"), _date_param(request, "to"), _int_param(request, "store"),
+                               sort)
+        return _json(_page(page, SALES_COLUMNS))
+
+    async def suppliers(self, request):
+        self.user(request, "Manager")
+        rows = await self.call(service.list_suppliers)
+        return _json([dict(zip(["S_ID", "S_name", "S_address", "S_phone"], row)) for row in rows])
+
+    async def add_supplier(self, request):
+        self.user(request, "Manager")
+        body = await _body(request)
+        supplier_id = await self.call(service.add_supplier, *_supplier_fields(body))
+        return _json({"S_ID": supplier_id}, 201)
+
+    async def update_supplier(self, request):
+        self.user(request, "Manager")
+        body = await _body(request)
+        changed = await self.call(service.update_supplier, int(request.match_info["supplier_id"]),
+                                  *_supplier_fields(body))
+        return _json({"changed": changed})
+
+    async def delete_supplier(self, request):
+        self.user(request, "Manager")
+        name = await self.call(service.delete_supplier, int(request.match_info["supplier_id"]))
+        return _json({"deleted": name})
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def create_app(workers=None):
+    api = PharmacyApi(workers)
+    app = web.Application(middlewares=[api.errors], client_max_size=MAX_UPLOAD_BYTES)
+    app.router.add_get("/api/health", api.health, name="health")
+    app.router.add_post("/api/login", api.login, name="login")
+    app.router.add_get("/api/drugs", api.drugs, name="drugs")
+    app.router.add_get("/api/drugs/{drug_id:\\d+}", api.drug, name="drug")
+    app.router.add_post("/api/qr", api.scan, name="qr")
+    app.router.add_post("/api/orders", api.place_order, name="place_order")
+    app.router.add_get("/api/orders", api.orders, name="orders")
+    app.router.add_get("/api/inventory", api.inventory, name="inventory")
+    app.router.add_get("/api/inventory/movements", api.movements, name="movements")
+    app.router.add_get("/api/inventory/expiring", api.expiring, name="expiring")
+    app.router.add_post("/api/inventory/restock", api.restock, name="restock")
+    app.router.add_post("/api/inventory/write-off", api.write_off, name="write_off")
+    app.router.add_get("/api/stock", api.stock, name="stock")
+    app.router.add_get("/api/sales", api.sales, name="sales")
+    app.router.add_get("/api/suppliers", api.suppliers, name="suppliers")
+    app.router.add_post("/api/suppliers", api.add_supplier, name="add_supplier")
+    app.router.add_patch("/api/suppliers/{supplier_id:\\d+}", api.update_supplier, name="update_supplier")
+    app.router.add_delete("/api/suppliers/{supplier_id:\\d+}", api.delete_supplier, name="delete_supplier")
+
+    async def start(app):
+        await asyncio.get_running_loop().run_in_executor(api.executor, ensure_migrated)
+
+    async def stop(app):
+        api.close()
+
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the pharmacy operations as a JSON HTTP API")
+    parser.add_argument("--host", default=os.environ.get("PHARMACY_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PHARMACY_API_PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PHARMACY_API_WORKERS", "0")) or None,
+                        help="Threads running database calls (default: the pool size)")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.workers), host=args.host, port=args.port)
@@ -0,0 +1,218 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+import db_pool
+
+ALGORITHM = "pbkdf2_sha256"
+DEFAULT_ITERATIONS = 600_000  # OWASP's 2023 recommendation for PBKDF2-HMAC-SHA256
+SESSION_TTL = 8 * 3600
+
+# (table, id column, login column, password column) per user type
+USER_TABLES = {
+    "Customer": ("Customer", "C_ID", "EmailID", "Pwd"),
+    "Manager": ("Manager", "M_ID", "M_name", "M_pwd"),
+}
+
+
+class EmailTakenError(Exception):
+    def __init__(self, email):
+        super().__init__(f"{email} is already registered")
+        self.email = email
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+# Salted PBKDF2 hash stored as "pbkdf2_sha256$<iterations>$<salt>$<hash>"
+def hash_password(password, iterations=DEFAULT_ITERATIONS, salt=None):
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{ALGORITHM}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+# (matches, needs_rehash). Rows from before hashing hold the plain password; they match by constant-time
+# comparison and always need a rehash, as do hashes made with fewer iterations than `iterations`.
+def verify_password(password, stored, iterations=DEFAULT_ITERATIONS):
+    if not stored:
+        return False, False
+    if not stored.startswith(ALGORITHM + "$"):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+    # A malformed hash matches nothing
+    try:
+        _, rounds, salt, digest = stored.split("$")
+        rounds = int(rounds)
+        if rounds <= 0:
+            return False, False
+        candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), _b64decode(salt), rounds)
+        return hmac.compare_digest(candidate, _b64decode(digest)), rounds < iterations
+    except ValueError:
+        return False, False
+
+
+# Checks credentials and returns the user's ID, or None. A matching row whose password is still plain text or
+# hashed at a lower cost is rehashed on the spot. Unknown users cost one hash too, so response times do not
+# reveal which accounts exist.
+class Authenticator:
+    def __init__(self, iterations=DEFAULT_ITERATIONS, secret=None, session_ttl=SESSION_TTL, clock=time.time):
+        self.iterations = iterations
+        self.session_ttl = session_ttl
+        self._secret = secret or secrets.token_bytes(32)
+        self._clock = clock
+        self._dummy_hash = hash_password(secrets.token_hex(8), iterations)
+        self._lock = threading.Lock()
+        self._stats = {"logins": 0, "failures": 0, "rehashed": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def authenticate(self, conn, username, password, user_type):
+        table, id_column, login_column, password_column = USER_TABLES[user_type]
+        cursor = conn.cursor()
+        try:
+            # Manager names are not unique, so every row with the name is tried
+            cursor.execute(f"SELECT {id_column}, {password_column} FROM {table} WHERE {login_column} = %s",
+                           (username,))
+            rows = cursor.fetchall()
+            if not rows:
+                verify_password(password, self._dummy_hash, self.iterations)
+            for user_id, stored in rows:
+                matches, needs_rehash = verify_password(password, stored, self.iterations)
+                if not matches:
+                    continue
+                if needs_rehash:
+                    # Only replace the value that was verified, in case the password changed meanwhile
+                    cursor.execute(f"UPDATE {table} SET {password_column} = %s "
+                                   f"WHERE {id_column} = %s AND {password_column} = %s",
+                                   (hash_password(password, self.iterations), user_id, stored))
+                    conn.commit()
+                    self._count("rehashed")
+                self._count("logins")
+                return user_id
+            self._count("failures")
+            return None
+        finally:
+            cursor.close()
+
+    # Create a customer (and phone number) in one transaction; returns the new C_ID
+    def register_customer(self, conn, email, password, name, age, sex, phone, address):
+        hashed = hash_password(password, self.iterations)
+        conn.begin()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT C_ID FROM Customer WHERE EmailID = %s", (email,))
+            if cursor.fetchone():
+                raise EmailTakenError(email)
+            cursor.execute(
+                "INSERT INTO Customer (C_name, Age, Sex, Address, Pwd, EmailID) VALUES (%s, %s, %s, %s, %s, %s)",
+                (name, age, sex, address, hashed, email),
+            )
+            customer_id = cursor.lastrowid
+            if phone:
+                cursor.execute("INSERT INTO CustomerPhone (C_ID, Ph_no) VALUES (%s, %s)", (customer_id, phone))
+            conn.commit()
+            return customer_id
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    # Signed "<payload>.<signature>" token naming the user, valid for session_ttl seconds
+    def issue_token(self, user_type, user_id):
+        payload = _b64encode(json.dumps({"type": user_type, "id": user_id,
+                                         "exp": int(self._clock() + self.session_ttl)}).encode("utf-8"))
+        signature = hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).digest()
+        return f"{payload}.{_b64encode(signature)}"
+
+    # (user_type, user_id) for a valid, unexpired token; None otherwise. No database access.
+    def verify_token(self, token):
+        if not token or token.count(".") != 1:
+            return None
+        payload, signature = token.split(".")
+        # Non-ASCII text raises UnicodeEncodeError, a ValueError
+        try:
+            expected = hmac.new(self._secret, payload.encode("ascii"), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if not isinstance(claims, dict) or claims.get("exp", 0) < self._clock() or claims.get("type") not in USER_TABLES:
+            return None
+        return claims["type"], claims["id"]
+
+    # Hash every remaining plain-text password now instead of waiting for each user's next login
+    def hash_plaintext_passwords(self, conn, batch_size=500):
+        hashed = 0
+        for table, id_column, _, password_column in USER_TABLES.values():
+            cursor = conn.cursor()
+            last_id = 0
+            while True:
+                cursor.execute(f"SELECT {id_column}, {password_column} FROM {table} WHERE {id_column} > %s "
+                               f"ORDER BY {id_column} LIMIT %s", (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                updates = [(hash_password(stored, self.iterations), user_id, stored) for user_id, stored in rows
+                           if stored and not stored.startswith(ALGORITHM + "$")]
+                cursor.executemany(f"UPDATE {table} SET {password_column} = %s "
+                                   f"WHERE {id_column} = %s AND {password_column} = %s", updates)
+                conn.commit()
+                hashed += len(updates)
+                last_id = rows[-1][0]
+            cursor.close()
+        return hashed
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def authenticator_from_env():
+    env = os.environ
+    secret = env.get("PHARMACY_SESSION_SECRET")
+    if not secret:
+        print("PHARMACY_SESSION_SECRET is not set; sessions will not survive a restart")
+    return Authenticator(
+        iterations=int(env.get("PHARMACY_AUTH_ITERATIONS", str(DEFAULT_ITERATIONS))),
+        secret=secret.encode("utf-8") if secret else None,
+        session_ttl=float(env.get("PHARMACY_SESSION_TTL", str(SESSION_TTL))),
+    )
+
+
+_authenticator = None
+_authenticator_lock = threading.Lock()
+
+
+def get_authenticator():
+    global _authenticator
+    with _authenticator_lock:
+        if _authenticator is None:
+            _authenticator = authenticator_from_env()
+        return _authenticator
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password maintenance")
+    parser.add_argument("--hash-plaintext", action="store_true",
+                        help="Hash every password still stored as plain text")
+    args = parser.parse_args()
+
+    if args.hash_plaintext:
+        with db_pool.connection() as conn:
+            print(f"Hashed {get_authenticator().hash_plaintext_passwords(conn)} passwords.")
+    else:
+        parser.print_help()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+import db_pool
+from bench_queries import percentile
+from generate_synthetic_data import generate, sqlite_config
+from migrate import apply_migrations
+
+
+# A customer with orders, a manager, and a well-stocked drug of the generated database
+def sample_accounts(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT Customer.EmailID, Customer.Pwd FROM Customer JOIN Orders ON Customer.C_ID = Orders.C_ID "
+                   "GROUP BY Customer.C_ID, Customer.EmailID, Customer.Pwd ORDER BY COUNT(*) DESC LIMIT 1")
+    customer = cursor.fetchone()
+    cursor.execute("SELECT M_name, M_pwd FROM Manager WHERE M_name IN "
+                   "(SELECT M_name FROM Manager GROUP BY M_name HAVING COUNT(*) = 1) ORDER BY M_ID LIMIT 1")
+    manager = cursor.fetchone()
+    cursor.execute("SELECT Drugs.D_ID, Drugs.D_name FROM Drugs JOIN Inventory ON Drugs.D_ID = Inventory.D_ID "
+                   "ORDER BY Inventory.Rem_qty DESC LIMIT 1")
+    drug = cursor.fetchone()
+    cursor.close()
+    return customer, manager, drug
+
+
+# (name, method, path, user, JSON body) of each endpoint measured
+def endpoints(drug_id, drug_name):
+    return [
+        ("GET /api/drugs", "GET", "/api/drugs", "customer", None),
+        ("GET /api/drugs/{id}", "GET", f"/api/drugs/{drug_id}", "customer", None),
+        ("GET /api/orders", "GET", "/api/orders", "customer", None),
+        ("POST /api/orders", "POST", "/api/orders", "customer", {"lines": [{"drug_id": drug_id, "quantity": 1}]}),
+        ("GET /api/inventory", "GET", "/api/inventory?sort=Lowest+stock", "manager", None),
+        ("GET /api/sales", "GET", "/api/sales", "manager", None),
+        ("GET /api/stock", "GET", f"/api/stock?drug={drug_name}&quantity=1", "manager", None),
+        ("GET /api/suppliers", "GET", "/api/suppliers", "manager", None),
+    ]
+
+
+# Requests per second and latency of `count` requests, `concurrency` at a time
+async def bench_endpoint(session, url, method, body, headers, count, concurrency):
+    timings = []
+    errors = 0
+    queue = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for _ in queue:
+            start = time.perf_counter()
+            async with session.request(method, url, json=body, headers=headers) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors += 1
+            timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_sec": round(count / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+        "errors": errors,
+    }
+
+
+async def run(base_url, customer, manager, drug, requests, logins, concurrency):
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for _ in range(300):
+            try:
+                async with session.get(base_url + "/api/health") as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+
+        headers = {}
+        for user, (user_type, (username, password)) in {"customer": ("Customer", customer),
+                                                         "manager": ("Manager", manager)}.items():
+            async with session.post(base_url + "/api/login", json={"user_type": user_type, "username": username,
+                                                                   "password": password}) as response:
+                headers[user] = {"Authorization": f"Bearer {(await response.json())['token']}"}
+
+        results = {}
+        # Each login hashes the password, so fewer are sent
+        results["POST /api/login"] = await bench_endpoint(
+            session, base_url + "/api/login", "POST",
+            {"user_type": "Customer", "username": customer[0], "password": customer[1]}, {}, logins, concurrency)
+        for name, method, path, user, body in endpoints(*drug):
+            results[name] = await bench_endpoint(session, base_url + path, method, body, headers[user], requests,
+                                                 concurrency)
+        return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the JSON API (api_server.py) on a synthetic database")
+    parser.add_argument("--scale", type=int, default=20_000, help="Rows in Orders and Sales")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint")
+    parser.add_argument("--logins", type=int, default=20, help="Login requests (each hashes a password)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--workers", type=int, default=8, help="Server threads running database calls")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    config = sqlite_config(os.path.join(directory, "bench_api.db"))
+    pool = db_pool.ConnectionPool(config)
+    with pool.get_connection() as conn:
+        apply_migrations(conn)
+        generate(conn, args.scale, log=lambda *a: None)
+        customer, manager, drug = sample_accounts(conn)
+    pool.close_all()
+
+    # The server runs in its own process, as in production, on the generated database
+    port = free_port()
+    env = dict(os.environ, PHARMACY_DB_BACKEND="sqlite", PHARMACY_DB_SQLITE_PATH=config["sqlite_path"],
+               PHARMACY_DB_POOL_SIZE=str(args.workers), PHARMACY_SESSION_SECRET=secrets.token_hex(16),
+               PHARMACY_REFERENCE_CACHE=os.path.join(directory, "reference_cache.db"))
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_server.py"),
+                               "--port", str(port), "--workers", str(args.workers)],
+                              env=env, stdout=subprocess.DEVNULL, cwd=directory)
+    try:
+        results = asyncio.run(run(f"http://127.0.0.1:{port}", customer, manager, drug, args.requests, args.logins,
+                                  args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'Endpoint':<22} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in results.items():
+        print(f"{name:<22} {result['requests_per_sec']:>9.1f} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+              f"{result['errors']:>7}")
@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+from auth import DEFAULT_ITERATIONS, Authenticator, hash_password
+from bench_queries import percentile
+from generate_synthetic_data import generate, sqlite_config
+from migrate import apply_migrations
+
+
+# Store `users` not yet hashed customers' passwords hashed at `iterations`; returns their (email, password) pairs
+def prepare_users(conn, users, iterations, seed=1):
+    cursor = conn.cursor()
+    cursor.execute("SELECT C_ID, EmailID, Pwd FROM Customer WHERE Pwd NOT LIKE %s", ("pbkdf2%",))
+    rows = random.Random(seed).sample(cursor.fetchall(), users)
+    cursor.executemany("UPDATE Customer SET Pwd = %s WHERE C_ID = %s",
+                       [(hash_password(pwd, iterations), c_id) for c_id, _, pwd in rows])
+    conn.commit()
+    cursor.close()
+    return [(email, pwd) for _, email, pwd in rows]
+
+
+# Logins per second and per-login latency with `threads` concurrent logins, each on its own pooled connection
+def bench_logins(pool, authenticator, credentials, logins, threads):
+    def login(i):
+        email, pwd = credentials[i % len(credentials)]
+        if i % 10 == 9:
+            pwd += "-wrong"
+        start = time.perf_counter()
+        with pool.get_connection() as conn:
+            authenticator.authenticate(conn, email, pwd, "Customer")
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        timings = list(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    return {
+        "logins_per_sec": round(logins / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+    }
+
+
+def bench_tokens(authenticator, count=20_000):
+    tokens = [authenticator.issue_token("Customer", i) for i in range(100)]
+    start = time.perf_counter()
+    for i in range(count):
+        authenticator.verify_token(tokens[i % len(tokens)])
+    return round(count / (time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure login throughput at different password hash costs")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[DEFAULT_ITERATIONS],
+                        help="PBKDF2 iteration counts to compare")
+    parser.add_argument("--logins", type=int, default=100, help="Logins per iteration count")
+    parser.add_argument("--threads", type=int, default=4, help="Concurrent logins")
+    parser.add_argument("--users", type=int, default=50, help="Distinct accounts logging in")
+    args = parser.parse_args()
+
+    # hashlib releases the GIL while hashing, so concurrent logins use several cores
+    config = sqlite_config(os.path.join(tempfile.mkdtemp(), "bench_auth.db"))
+    config["pool_size"] = args.threads
+    pool = db_pool.ConnectionPool(config)
+    with pool.get_connection() as conn:
+        apply_migrations(conn)
+        # Each iteration count logs in a fresh set of accounts (one customer per 10 generated orders)
+        generate(conn, max(1000, 10 * args.users * len(args.iterations)), log=lambda *a: None)
+
+    for iterations in args.iterations:
+        authenticator = Authenticator(iterations=iterations)
+        with pool.get_connection() as conn:
+            credentials = prepare_users(conn, args.users, iterations)
+        result = bench_logins(pool, authenticator, credentials, args.logins, args.threads)
+        print(f"{iterations:>9} iterations: {result['logins_per_sec']:>8.1f} logins/s   "
+              f"p50 {result['p50_ms']:>8.2f} ms   p95 {result['p95_ms']:>8.2f} ms")
+    print(f"Token checks: {bench_tokens(Authenticator()):,} verifies/s (no database access)")
+    pool.close_all()
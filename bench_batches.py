@@ -0,0 +1,103 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+import db_pool
+from bench_queries import percentile
+from db_pool import bulk_insert
+from generate_synthetic_data import generate, sqlite_config
+from inventory_batches import allocate_fefo, expiring_within
+from migrate import apply_migrations
+
+TODAY = datetime.date(2026, 1, 1)
+
+
+def _timed(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return percentile(timings, 50), percentile(timings, 95)
+
+
+# Add lots until InventoryBatch holds `target` rows, spread over the existing (drug, store) pairs
+def grow_batches(conn, pairs, target, rng, batch_size=5000):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM InventoryBatch")
+    missing = target - cursor.fetchone()[0]
+
+    def lots():
+        for _ in range(missing):
+            d_id, m_id = rng.choice(pairs)
+            yield (d_id, m_id, TODAY + datetime.timedelta(days=rng.randint(-60, 1100)), rng.randint(1, 200))
+
+    if missing > 0:
+        bulk_insert(cursor, "InventoryBatch", ["D_ID", "M_ID", "Expiry_date", "Qty"], lots(), batch_size)
+        cursor.execute("ANALYZE" if conn.backend == "sqlite" else "ANALYZE TABLE InventoryBatch")
+        if conn.backend == "mysql":
+            cursor.fetchall()
+        conn.commit()
+    cursor.close()
+
+
+def bench(conn, pairs, managers, iterations, rng):
+    def allocate():
+        d_id, m_id = rng.choice(pairs)
+        conn.begin()
+        cursor = conn.cursor()
+        try:
+            allocate_fefo(conn, cursor, d_id, m_id, rng.randint(1, 50), today=TODAY)
+        except Exception:
+            pass
+        finally:
+            cursor.close()
+            conn.rollback()
+
+    def expiring_store():
+        expiring_within(conn, 30, rng.choice(managers), today=TODAY, limit=100)
+
+    def expiring_all():
+        expiring_within(conn, 30, today=TODAY, limit=100)
+
+    return {
+        "fefo_allocate": _timed(allocate, iterations),
+        "expiring_store": _timed(expiring_store, iterations),
+        "expiring_all": _timed(expiring_all, iterations),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time FEFO allocation and expiry queries as the lot count grows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="InventoryBatch row counts to measure at")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    pool = db_pool.ConnectionPool(sqlite_config(os.path.join(tempfile.mkdtemp(), "bench_batches.db")))
+    rng = random.Random(args.seed)
+    results = {}
+    with pool.get_connection() as conn:
+        apply_migrations(conn)
+        generate(conn, 100_000, seed=args.seed, log=lambda message: None)
+        cursor = conn.cursor()
+        cursor.execute("SELECT D_ID, M_ID FROM Inventory")
+        pairs = cursor.fetchall()
+        cursor.execute("SELECT M_ID FROM Manager")
+        managers = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+
+        print(f"{'lots':>10} {'fefo p50/p95 (us)':>20} {'store expiring':>20} {'all expiring':>20}")
+        for size in sorted(args.sizes):
+            grow_batches(conn, pairs, size, rng)
+            results[size] = bench(conn, pairs, managers, args.iterations, rng)
+            print(f"{size:>10} " + " ".join(f"{p50:>10.0f}/{p95:<9.0f}" for p50, p95 in results[size].values()))
+    pool.close_all()
+
+    smallest, largest = results[min(results)], results[max(results)]
+    for name in largest:
+        print(f"{name:>16}: p50 x{largest[name][0] / smallest[name][0]:.2f} from {min(results)} to {max(results)} lots")
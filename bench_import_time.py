@@ -0,0 +1,163 @@
+import argparse
+import ast
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_queries import percentile
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pharma_app.py")
+
+# Subsystems that only their own page needs; none of them may be loaded by pharma_app.py's startup imports
+LAZY_MODULES = ["google.generativeai", "googletrans", "pyzbar", "PIL", "qrcode", "requests", "smtplib",
+                "chatbot_service", "retrieval", "qr_lookup", "drug_interactions", "interaction_engine",
+                "reorder_forecast", "sales_analytics", "bulk_io", "aiohttp"]
+
+IMPORT_SCRIPT = """
+import sys
+for name in sys.argv[1:]:
+    try:
+        __import__(name)
+    except ImportError as e:
+        print(f"missing {name}: {e}")
+"""
+
+
+# Modules imported at the top level of a script, in order
+def startup_imports(path=APP_FILE):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+# Import `modules` in a fresh interpreter under -X importtime. Returns (total ms, {top-level package: ms},
+# set of every module loaded, [missing modules]); modules the interpreter loads on its own are left out.
+def profile_imports(modules, interpreter=frozenset()):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT, *modules],
+                            capture_output=True, text=True, cwd=os.path.dirname(APP_FILE))
+    packages = {}
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() in interpreter:
+            continue
+        loaded.add(name.strip())
+        if len(name) - len(name.lstrip()) == 1:  # imported directly, not by another module
+            packages[name.strip()] = int(cumulative) / 1000
+    missing = [line.split()[1].rstrip(":") for line in result.stdout.splitlines() if line.startswith("missing ")]
+    return sum(packages.values()), packages, loaded, missing
+
+
+def _loaded_lazy(loaded):
+    return [name for name in LAZY_MODULES if name in loaded]
+
+
+# Cold-start import cost of pharma_app.py's top-level imports, on top of what `import streamlit` costs alone
+def measure_imports(repeat=5, modules=None):
+    modules = modules or startup_imports()
+    framework = [name for name in modules if name.split(".")[0] == "streamlit"]
+    interpreter = frozenset(profile_imports([])[2])
+    totals, framework_totals, packages = [], [], {}
+    for _ in range(repeat):
+        framework_total, _, framework_loaded, _ = profile_imports(framework, interpreter)
+        total, run_packages, loaded, missing = profile_imports(modules, interpreter)
+        totals.append(total)
+        framework_totals.append(framework_total)
+        for name, ms in run_packages.items():
+            packages.setdefault(name, []).append(ms)
+    return {
+        "modules": modules,
+        "missing": missing,
+        "total_ms": round(min(totals), 1),
+        "streamlit_ms": round(min(framework_totals), 1),
+        "app_ms": round(min(totals) - min(framework_totals), 1),
+        "packages_ms": {name: round(statistics.median(values), 1)
+                        for name, values in sorted(packages.items(), key=lambda item: -statistics.median(item[1]))},
+        "lazy_loaded_at_startup": _loaded_lazy(loaded - framework_loaded),
+    }
+
+
+# Time the first render and later reruns of the Pharmacy Management page with Streamlit's AppTest
+# (uses the PHARMACY_DB_* database)
+def measure_reruns(reruns=20):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_FILE, default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    first = (time.perf_counter() - start) * 1000
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "first_render_ms": round(first, 1),
+        "rerun_p50_ms": round(percentile(timings, 50), 1),
+        "rerun_p95_ms": round(percentile(timings, 95), 1),
+        "lazy_loaded_after_render": _loaded_lazy(set(sys.modules)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile pharma_app.py's cold-start imports and page reruns")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to take the fastest import time from")
+    parser.add_argument("--reruns", type=int, default=0,
+                        help="Also time this many reruns of the Pharmacy Management page (needs streamlit)")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest startup imports to list")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed import time slowdown versus the baseline")
+    parser.add_argument("--check", action="store_true", help="Fail if a page-only subsystem is loaded at startup")
+    args = parser.parse_args()
+
+    report = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "imports": measure_imports(args.repeat),
+    }
+    imports = report["imports"]
+    print(f"Startup imports: {imports['total_ms']:.1f} ms "
+          f"(streamlit {imports['streamlit_ms']:.1f} ms, app on top {imports['app_ms']:.1f} ms)")
+    for name, ms in list(imports["packages_ms"].items())[:args.top]:
+        print(f"{name:>28}: {ms:8.1f} ms")
+    if imports["missing"]:
+        print("Not installed (not measured): " + ", ".join(imports["missing"]))
+    if imports["lazy_loaded_at_startup"]:
+        print("Loaded at startup but only needed by one page: " + ", ".join(imports["lazy_loaded_at_startup"]))
+
+    if args.reruns:
+        report["reruns"] = measure_reruns(args.reruns)
+        print(f"First render {report['reruns']['first_render_ms']:.1f} ms, rerun p50 "
+              f"{report['reruns']['rerun_p50_ms']:.1f} ms / p95 {report['reruns']['rerun_p95_ms']:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    failures = []
+    if args.check and imports["lazy_loaded_at_startup"]:
+        failures.append("page-only subsystems loaded at startup")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            before = json.load(f)["imports"]["total_ms"]
+        ratio = imports["total_ms"] / before if before else 1.0
+        print(f"Startup imports: {ratio:.2f}x baseline")
+        if ratio > 1 + args.tolerance:
+            failures.append(f"startup imports {ratio:.2f}x slower than the baseline")
+    if failures:
+        raise SystemExit("; ".join(failures))
@@ -0,0 +1,122 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+from migrate import apply_migrations
+from order_pipeline import InsufficientStockError, OrderLine, submit_order
+
+
+# Fire many concurrent orders at one drug and check the stock never goes negative
+def run_benchmark(pool, orders, workers, stock, drug_id, max_qty, seed):
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT D_name FROM Drugs WHERE D_ID = %s", (drug_id,))
+    drug_name = cursor.fetchone()[0]
+    cursor.execute("SELECT M_ID FROM Inventory WHERE D_ID = %s", (drug_id,))
+    stores = [row[0] for row in cursor.fetchall()]
+    cursor.execute("UPDATE Inventory SET Rem_qty = %s WHERE D_ID = %s", (stock, drug_id))
+    # One unexpired lot per store so first-expiring-first-out allocation can fill every order
+    cursor.execute("DELETE FROM InventoryBatch WHERE D_ID = %s", (drug_id,))
+    expiry = datetime.date.today() + datetime.timedelta(days=365)
+    cursor.executemany("INSERT INTO InventoryBatch (D_ID, M_ID, Expiry_date, Qty) VALUES (%s, %s, %s, %s)",
+                       [(drug_id, m_id, expiry, stock) for m_id in stores])
+    cursor.execute("SELECT COUNT(*) FROM Orders WHERE Item = %s", (drug_name,))
+    orders_before = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(-SUM(Delta), 0) FROM InventoryEvent WHERE D_ID = %s AND Reason = 'order'",
+                   (drug_id,))
+    events_before = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    rng = random.Random(seed)
+    quantities = [rng.randint(1, max_qty) for _ in range(orders)]
+
+    def place(quantity):
+        conn = pool.get_connection()
+        try:
+            submit_order(conn, 1, [OrderLine(drug_id, drug_name, quantity)])
+            return quantity
+        except InsufficientStockError:
+            return 0
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sold = list(executor.map(place, quantities))
+    elapsed = time.perf_counter() - start
+
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT SUM(Rem_qty), MIN(Rem_qty) FROM Inventory WHERE D_ID = %s", (drug_id,))
+    remaining, lowest = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(Qty), 0) FROM Orders WHERE Item = %s", (drug_name,))
+    order_rows, ordered_qty = cursor.fetchone()
+    cursor.execute("SELECT COALESCE(-SUM(Delta), 0) FROM InventoryEvent WHERE D_ID = %s AND Reason = 'order'",
+                   (drug_id,))
+    event_units = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(Qty), 0), COALESCE(MIN(Qty), 0) FROM InventoryBatch WHERE D_ID = %s",
+                   (drug_id,))
+    batch_units, lowest_batch = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    accepted = sum(1 for quantity in sold if quantity)
+    total_stock = stock * len(stores)
+    report = {
+        "orders": orders,
+        "accepted": accepted,
+        "rejected": orders - accepted,
+        "seconds": round(elapsed, 3),
+        "orders_per_sec": round(orders / elapsed, 1),
+        "sold_units": sum(sold),
+        "remaining_units": remaining,
+    }
+    problems = []
+    if lowest < 0:
+        problems.append(f"stock went negative ({lowest})")
+    if sum(sold) + remaining != total_stock:
+        problems.append(f"sold {sum(sold)} + remaining {remaining} != initial {total_stock}")
+    if order_rows - orders_before != accepted:
+        problems.append(f"{order_rows - orders_before} order rows for {accepted} accepted orders")
+    if batch_units != remaining or lowest_batch < 0:
+        problems.append(f"batches hold {batch_units} units (lowest lot {lowest_batch}) for {remaining} in stock")
+    if event_units - events_before != sum(sold):
+        problems.append(f"inventory feed recorded {event_units - events_before} units for {sum(sold)} sold")
+    return report, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent order placement stress benchmark")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--stock", type=int, default=4000, help="Initial Rem_qty for every Inventory row of the drug")
+    parser.add_argument("--drug-id", type=int, default=1)
+    parser.add_argument("--max-qty", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--use-configured-db", action="store_true",
+                        help="Run against the PHARMACY_DB_* database instead of a throwaway SQLite copy")
+    args = parser.parse_args()
+
+    config = db_pool.db_config_from_env()
+    if not args.use_configured_db:
+        config.update(backend="sqlite", sqlite_path=os.path.join(tempfile.mkdtemp(), "bench_orders.db"))
+    config["pool_size"] = args.workers
+    config["checkout_timeout"] = 60
+    pool = db_pool.ConnectionPool(config)
+    with pool.get_connection() as conn:
+        apply_migrations(conn)
+
+    report, problems = run_benchmark(pool, args.orders, args.workers, args.stock, args.drug_id, args.max_qty, args.seed)
+    pool.close_all()
+    for key, value in report.items():
+        print(f"{key:>16}: {value}")
+    if problems:
+        raise SystemExit("Oversell check FAILED: " + "; ".join(problems))
+    print("Oversell check passed.")
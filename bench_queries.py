@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+
+import db_pool
+from alert_scheduler import low_stock
+from generate_synthetic_data import generate, sqlite_config
+from migrate import apply_migrations
+from order_pipeline import InsufficientStockError, OrderLine, submit_order
+from paged_queries import INVENTORY_SORTS, SALES_SORTS, fetch_inventory_page, fetch_orders_page, fetch_sales_page
+from stores import STORE_STOCK_QUERY
+
+TABLES = ["Customer", "CustomerPhone", "Manager", "Drugs", "Supplier", "Inventory", "Supplies", "Sale_Item",
+          "Orders", "Sales"]
+
+
+def _fetch(conn, query, params=()):
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+# Sample keys the query paths pick their parameters from
+def load_samples(conn, rng, size=1000):
+    customers = _fetch(conn, "SELECT C_ID, EmailID, Pwd FROM Customer")
+    managers = _fetch(conn, "SELECT M_ID, M_name, M_pwd FROM Manager")
+    drugs = _fetch(conn, "SELECT Drugs.D_ID, Drugs.D_name FROM Drugs JOIN Inventory ON Drugs.D_ID = Inventory.D_ID")
+    suppliers = _fetch(conn, "SELECT S_ID FROM Supplier")
+    return {
+        "customers": rng.sample(customers, min(size, len(customers))),
+        "managers": managers,
+        "drugs": rng.sample(drugs, min(size, len(drugs))),
+        "suppliers": [row[0] for row in suppliers],
+    }
+
+
+# The credential lookups only; password hashing cost is measured by bench_auth.py
+def bench_login(conn, rng, samples):
+    c_id, email, pwd = rng.choice(samples["customers"])
+    _fetch(conn, "SELECT C_ID, Pwd FROM Customer WHERE EmailID = %s", (email,))
+    m_id, name, m_pwd = rng.choice(samples["managers"])
+    _fetch(conn, "SELECT M_ID, M_pwd FROM Manager WHERE M_name = %s", (name,))
+
+
+def bench_place_order(conn, rng, samples):
+    c_id = rng.choice(samples["customers"])[0]
+    d_id, name = rng.choice(samples["drugs"])
+    _fetch(conn, STORE_STOCK_QUERY.format(""), (datetime.date.today(),))
+    try:
+        submit_order(conn, c_id, [OrderLine(d_id, name, 1)])
+    except InsufficientStockError:
+        pass
+
+
+def bench_view_orders(conn, rng, samples):
+    fetch_orders_page(conn, rng.choice(samples["customers"])[0], page_size=50)
+
+
+def bench_view_inventory(conn, rng, samples):
+    manager_id = rng.choice(samples["managers"])[0]
+    fetch_inventory_page(conn, page_size=50, manager_id=manager_id, sort=rng.choice(list(INVENTORY_SORTS)))
+
+
+def bench_view_sales(conn, rng, samples):
+    manager_id = rng.choice(samples["managers"])[0]
+    fetch_sales_page(conn, page_size=50, manager_id=manager_id, sort=rng.choice(list(SALES_SORTS)))
+
+
+def bench_manage_suppliers(conn, rng, samples):
+    _fetch(conn, "SELECT S_ID, S_name, S_address, S_phone FROM Supplier")
+    _fetch(conn, "SELECT S_name, S_address, S_phone FROM Supplier WHERE S_ID = %s", (rng.choice(samples["suppliers"]),))
+
+
+def bench_check_inventory_and_notify(conn, rng, samples):
+    cursor = conn.cursor()
+    low_stock(cursor)
+    cursor.close()
+
+
+QUERY_PATHS = {
+    "login": bench_login,
+    "place_order": bench_place_order,
+    "view_orders": bench_view_orders,
+    "view_inventory": bench_view_inventory,
+    "view_sales": bench_view_sales,
+    "manage_suppliers": bench_manage_suppliers,
+    "check_inventory_and_notify": bench_check_inventory_and_notify,
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(conn, iterations, seed=1, paths=QUERY_PATHS):
+    rng = random.Random(seed)
+    samples = load_samples(conn, rng)
+    results = {}
+    for name, path in paths.items():
+        path(conn, rng, samples)  # warm-up
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            path(conn, rng, samples)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            "iterations": iterations,
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "max_ms": round(max(timings), 3),
+        }
+        print(f"{name:>28}: p50 {results[name]['p50_ms']:>9.3f} ms   p95 {results[name]['p95_ms']:>9.3f} ms")
+    return results
+
+
+def table_counts(conn):
+    return {table: _fetch(conn, f"SELECT COUNT(*) FROM {table}")[0][0] for table in TABLES}
+
+
+# Paths whose p50 got slower than the baseline by more than `tolerance` (0.2 = 20%)
+def compare(report, baseline, tolerance):
+    regressions = {}
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+        print(f"{name:>28}: {ratio:6.2f}x baseline p50")
+        if ratio > 1 + tolerance:
+            regressions[name] = ratio
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each of the app's query paths and write a JSON report")
+    parser.add_argument("--generate", type=int, metavar="SCALE",
+                        help="Benchmark a fresh SQLite database generated at this scale")
+    parser.add_argument("--sqlite", metavar="PATH", help="Benchmark an existing SQLite file")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown versus the baseline")
+    args = parser.parse_args()
+
+    if args.generate:
+        config = sqlite_config(os.path.join(tempfile.mkdtemp(), "bench_queries.db"))
+    elif args.sqlite:
+        config = sqlite_config(args.sqlite)
+    else:
+        config = db_pool.db_config_from_env()
+    pool = db_pool.ConnectionPool(config)
+    with pool.get_connection() as conn:
+        apply_migrations(conn)
+        if args.generate:
+            generate(conn, args.generate)
+        report = {
+            "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "backend": conn.backend,
+            "python": platform.python_version(),
+            "table_rows": table_counts(conn),
+            "results": run(conn, args.iterations),
+        }
+    pool.close_all()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit("Regressed: " + ", ".join(f"{name} ({ratio:.2f}x)" for name, ratio in regressions.items()))
@@ -0,0 +1,429 @@
+import argparse
+import csv
+import datetime
+import io
+import os
+import time
+from collections import namedtuple
+
+import db_pool
+import inventory_feed
+from db_pool import bulk_insert, upsert_sql
+from paged_queries import fetch_page
+from reference_cache import get_reference_cache
+from stores import STORE_TABLES, get_store_registry
+from validators import validate_phone
+
+ImportResult = namedtuple("ImportResult", ["rows", "imported", "rejected", "seconds"])
+
+# Columns holding credentials are never exported
+SECRET_COLUMNS = {"Pwd", "M_pwd"}
+
+# Key columns of every exportable table, used to page through it
+EXPORT_KEYS = {
+    "Customer": ["C_ID"],
+    "CustomerPhone": ["C_ID", "Ph_no"],
+    "Drugs": ["D_ID"],
+    "Manager": ["M_ID"],
+    "Supplier": ["S_ID"],
+    "Sales": ["Sale_ID"],
+    "Inventory": ["D_ID", "M_ID"],
+    "InventoryBatch": ["Batch_ID"],
+    "InventoryEvent": ["Event_ID"],
+    "Orders": ["Order_ID"],
+    "Supplies": ["D_ID", "S_ID"],
+    "Sale_Item": ["D_ID", "S_ID"],
+}
+
+# Referenced tables checked before a chunk is written, so one bad row does not fail the whole chunk
+REFERENCES = {"D_ID": ("Drugs", "D_ID"), "S_ID": ("Supplier", "S_ID"), "M_ID": ("Manager", "M_ID"),
+              "C_ID": ("Customer", "C_ID")}
+
+
+# Field parsers: take the raw CSV string (or Parquet value), return the value to store or None when blank,
+# and raise ValueError with the message shown for rejected rows
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_text(value):
+    return None if _blank(value) else str(value).strip()
+
+
+def parse_int(value):
+    if _blank(value):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"not a whole number: {value!r}")
+
+
+def parse_quantity(value):
+    quantity = parse_int(value)
+    if quantity is not None and quantity <= 0:
+        raise ValueError(f"quantity must be positive: {quantity}")
+    return quantity
+
+
+def parse_date(value):
+    if _blank(value):
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"not a YYYY-MM-DD date: {value!r}")
+
+
+def parse_phone(value):
+    phone = parse_text(value)
+    if phone is not None:
+        is_valid, error = validate_phone(phone)
+        if not is_valid:
+            raise ValueError(error)
+    return phone
+
+
+def _check_drug_dates(row):
+    if row.get("Mnf_date") and row.get("Expiry_date") and row["Expiry_date"] < row["Mnf_date"]:
+        raise ValueError("Expiry_date is before Mnf_date")
+
+
+# table, key columns (new rows get generated IDs when a file has no key column), {column: (parser, required)},
+# extra whole-row check, and reference data cached by the app that the import changes
+ImportSpec = namedtuple("ImportSpec", ["table", "keys", "columns", "check", "invalidates"])
+
+IMPORT_SPECS = {
+    "suppliers": ImportSpec("Supplier", ["S_ID"], {
+        "S_ID": (parse_int, False),
+        "S_name": (parse_text, True),
+        "S_address": (parse_text, False),
+        "S_phone": (parse_phone, False),
+        "M_ID": (parse_int, False),
+    }, None, ["suppliers"]),
+    "drugs": ImportSpec("Drugs", ["D_ID"], {
+        "D_ID": (parse_int, False),
+        "D_name": (parse_text, True),
+        "Mnf_date": (parse_date, False),
+        "Expiry_date": (parse_date, False),
+        "D_use": (parse_text, False),
+        "C_ID": (parse_int, False),
+    }, _check_drug_dates, ["drug_stock"]),
+    # Quantity each supplier supplies; existing pairs are overwritten
+    "supplies": ImportSpec("Supplies", ["D_ID", "S_ID"], {
+        "D_ID": (parse_int, True),
+        "S_ID": (parse_int, True),
+        "Qty": (parse_quantity, True),
+    }, None, []),
+    # Received stock: each row is a lot added to a store (see inventory_batches.restock); the expiry defaults
+    # to the drug's Expiry_date
+    "inventory": ImportSpec("Inventory", ["D_ID", "M_ID"], {
+        "D_ID": (parse_int, True),
+        "M_ID": (parse_int, True),
+        "Qty": (parse_quantity, True),
+        "Expiry_date": (parse_date, False),
+    }, None, ["drug_stock"]),
+}
+
+
+def detect_format(path):
+    return "parquet" if str(path).lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for Parquet files (pip install pyarrow)")
+    return pyarrow
+
+
+# Yield the rows of a CSV or Parquet file as lists of dicts, `chunk_size` rows at a time, so memory use does
+# not depend on the file size. `source` is a path or a binary file object.
+def read_chunks(source, fmt, chunk_size=5000):
+    if fmt == "parquet":
+        pyarrow = _import_pyarrow()
+        for batch in pyarrow.parquet.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    f = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        reader = csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig", newline=""))
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        if f is not source:
+            f.close()
+
+
+# Parse and check one row; returns {column: value} for the file's `columns`
+def _parse_row(spec, columns, raw):
+    # csv.DictReader puts the fields beyond the header in a list under the key None
+    if raw.get(None):
+        raise ValueError(f"{len(raw[None])} more fields than the header has columns")
+    row = {}
+    for column in columns:
+        parser, required = spec.columns[column]
+        try:
+            row[column] = parser(raw.get(column))
+        except ValueError as e:
+            raise ValueError(f"{column}: {e}")
+        if required and row[column] is None:
+            raise ValueError(f"{column} is required")
+    if spec.check:
+        spec.check(row)
+    return row
+
+
+# IDs among `ids` that exist in table.column
+def _existing(cursor, table, column, ids, batch_size=500):
+    ids = list(ids)
+    found = set()
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(batch))})", batch)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+# Receive a chunk of lots: one InventoryBatch row per lot, Inventory incremented per (drug, store), and one
+# feed event per (drug, store)
+def _receive_lots(conn, cursor, rows):
+    drug_ids = sorted({row["D_ID"] for row in rows})
+    cursor.execute(f"SELECT D_ID, COALESCE(Expiry_date, '9999-12-31') FROM Drugs "
+                   f"WHERE D_ID IN ({', '.join(['%s'] * len(drug_ids))})", drug_ids)
+    default_expiry = dict(cursor.fetchall())
+    received_at = datetime.datetime.now().replace(microsecond=0)
+    cursor.executemany(
+        "INSERT INTO InventoryBatch (D_ID, M_ID, Expiry_date, Qty, Received_at) VALUES (%s, %s, %s, %s, %s)",
+        [(row["D_ID"], row["M_ID"], row.get("Expiry_date") or default_expiry[row["D_ID"]], row["Qty"], received_at)
+         for row in rows],
+    )
+    totals = {}
+    for row in rows:
+        totals[(row["D_ID"], row["M_ID"])] = totals.get((row["D_ID"], row["M_ID"]), 0) + row["Qty"]
+    cursor.executemany(upsert_sql(conn.backend, "Inventory", ["Rem_qty", "D_ID", "M_ID"], ["D_ID", "M_ID"],
+                                  increment=("Rem_qty",)),
+                       [(qty, d_id, m_id) for (d_id, m_id), qty in totals.items()])
+    cursor.execute(f"SELECT D_ID, M_ID, Rem_qty FROM Inventory WHERE D_ID IN ({', '.join(['%s'] * len(drug_ids))})",
+                   drug_ids)
+    rem_qty = {(d_id, m_id): qty for d_id, m_id, qty in cursor.fetchall()}
+    inventory_feed.record_events(cursor, [(d_id, m_id, qty, rem_qty[(d_id, m_id)], "import")
+                                          for (d_id, m_id), qty in totals.items()], received_at)
+
+
+# Write one chunk of parsed rows in its own transaction
+def _write_chunk(conn, spec, columns, rows):
+    conn.begin()
+    cursor = conn.cursor()
+    try:
+        if spec.table == "Inventory":
+            _receive_lots(conn, cursor, rows)
+        else:
+            keyed = [row for row in rows if all(row.get(key) is not None for key in spec.keys)]
+            new = [row for row in rows if not all(row.get(key) is not None for key in spec.keys)]
+            if keyed:
+                cursor.executemany(upsert_sql(conn.backend, spec.table, columns, spec.keys),
+                                   [[row[column] for column in columns] for row in keyed])
+            if new:
+                new_columns = [column for column in columns if column not in spec.keys]
+                bulk_insert(cursor, spec.table, new_columns, ([row[column] for column in new_columns] for row in new))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Receive lots into the database of each store they are for, one transaction per database. The drugs are
+# copied to store databases first (see stores.StoreRegistry.replicate).
+def _write_lots(conn, spec, columns, rows):
+    registry = get_store_registry()
+    by_store = {}
+    for row in rows:
+        by_store.setdefault(row["M_ID"], []).append(row)
+    for group in registry.groups(sorted(by_store)):
+        group_rows = [row for store_id in group.store_ids for row in by_store[store_id]]
+        with registry.connection(group.store_ids[0], conn) as store_conn:
+            registry.replicate(conn, group.store_ids[0], store_conn, "Drugs", [row["D_ID"] for row in group_rows])
+            _write_chunk(store_conn, spec, columns, group_rows)
+
+
+# Validate and upsert a CSV or Parquet file into the table behind `kind` (see IMPORT_SPECS), one transaction
+# per chunk. Invalid rows and rows referencing unknown drugs, suppliers or stores are skipped and, when
+# `rejects` is a path, written there with the reason. With `store`, stock is only received into that store.
+# Returns an ImportResult.
+def import_file(conn, kind, source, fmt=None, chunk_size=5000, rejects=None, store=None, log=print):
+    spec = IMPORT_SPECS[kind]
+    fmt = fmt or detect_format(source)
+    start = last_report = time.perf_counter()
+    total = imported = rejected = 0
+    rejects_file = rejects_writer = None
+    try:
+        for chunk in read_chunks(source, fmt, chunk_size):
+            columns = [column for column in spec.columns if column in chunk[0]]
+            unknown = [column for column in chunk[0] if column is not None and column not in spec.columns]
+            missing = [column for column, (_, required) in spec.columns.items() if required and column not in columns]
+            if unknown or missing:
+                raise ValueError(f"{kind} files need columns {', '.join(spec.columns)}"
+                                 f"{'; unknown: ' + ', '.join(unknown) if unknown else ''}"
+                                 f"{'; missing: ' + ', '.join(missing) if missing else ''}")
+
+            parsed, errors = [], []  # (line, raw row, parsed row) and (line, raw row, reason)
+            for line, raw in enumerate(chunk, start=total + 1):
+                try:
+                    parsed.append((line, raw, _parse_row(spec, columns, raw)))
+                except ValueError as e:
+                    errors.append((line, raw, str(e)))
+            if store is not None and spec.table == "Inventory":
+                errors += [(line, raw, f"M_ID: only store {store} can be restocked")
+                           for line, raw, row in parsed if row["M_ID"] != store]
+                parsed = [entry for entry in parsed if entry[2]["M_ID"] == store]
+            cursor = conn.cursor()
+            for column, (table, key) in REFERENCES.items():
+                if column in columns and table != spec.table:
+                    known = _existing(cursor, table, key, {row[column] for _, _, row in parsed} - {None})
+                    errors += [(line, raw, f"{column}: no {table} row {row[column]}")
+                               for line, raw, row in parsed if row[column] is not None and row[column] not in known]
+                    parsed = [entry for entry in parsed if entry[2][column] is None or entry[2][column] in known]
+            cursor.close()
+
+            rows = [row for _, _, row in parsed]
+            if rows and spec.table == "Inventory":
+                _write_lots(conn, spec, columns, rows)
+            elif rows:
+                _write_chunk(conn, spec, columns, rows)
+            total += len(chunk)
+            imported += len(rows)
+            rejected += len(errors)
+            if errors and rejects:
+                if rejects_writer is None:
+                    rejects_file = open(rejects, "w", encoding="utf-8", newline="")
+                    rejects_writer = csv.writer(rejects_file)
+                    rejects_writer.writerow(["row"] + list(spec.columns) + ["error"])
+                rejects_writer.writerows([[line] + [raw.get(column) for column in spec.columns] + [error]
+                                          for line, raw, error in sorted(errors, key=lambda error: error[0])])
+            if time.perf_counter() - last_report >= 5:
+                last_report = time.perf_counter()
+                log(f"{spec.table}: {total:,} rows read, {total / (last_report - start):,.0f} rows/s")
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    if imported:
+        if spec.table == "Inventory":
+            inventory_feed.notify()
+        if spec.invalidates:
+            get_reference_cache().invalidate(*spec.invalidates)
+    seconds = time.perf_counter() - start
+    log(f"{spec.table}: imported {imported:,} of {total:,} rows ({rejected:,} rejected) in {seconds:.1f} s, "
+        f"{total / seconds if seconds else 0:,.0f} rows/s")
+    return ImportResult(total, imported, rejected, seconds)
+
+
+# The next chunk of `table` in key order after `after`: a Page, or a stores.StorePage for tables whose rows
+# are spread over the store databases
+def _next_chunk(conn, table, columns, keys, after, chunk_size):
+    if table not in STORE_TABLES:
+        return fetch_page(conn, table, columns, [], [], keys, False, after, chunk_size)
+    page = get_store_registry().fan_out_page(
+        lambda store_conn, group, cursor: fetch_page(store_conn, table, columns, [], [], keys, False, cursor,
+                                                     chunk_size),
+        columns, keys, False, after, chunk_size, conn=conn,
+    )
+    if page.failed:
+        raise RuntimeError(f"Store databases did not answer: {', '.join(page.failed)}")
+    return page
+
+
+# Stream a table to a CSV or Parquet file, `chunk_size` rows per keyset-paginated query; returns the row count.
+# Store tables are read from every store database and merged in key order.
+def export_table(conn, table, destination, fmt=None, chunk_size=5000, log=print):
+    keys = EXPORT_KEYS[table]
+    fmt = fmt or detect_format(destination)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+    columns = [column[0] for column in cursor.description if column[0] not in SECRET_COLUMNS]
+    cursor.fetchall()
+    cursor.close()
+
+    start = time.perf_counter()
+    count = 0
+    after = None
+    writer = None
+    f = open(destination, "w", encoding="utf-8", newline="") if fmt == "csv" else None
+    try:
+        while True:
+            page = _next_chunk(conn, table, columns, keys, after, chunk_size)
+            rows = page.rows
+            if not rows:
+                break
+            if fmt == "csv":
+                if writer is None:
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                writer.writerows(rows)
+            else:
+                pyarrow = _import_pyarrow()
+                data = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+                if writer is None:
+                    schema = pyarrow.Table.from_pydict(data).schema
+                    # A column that is all NULL in the first chunk is typed as text
+                    schema = pyarrow.schema([field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type)
+                                             else field for field in schema])
+                    writer = pyarrow.parquet.ParquetWriter(destination, schema)
+                writer.write_table(pyarrow.Table.from_pydict(data, schema=writer.schema))
+            count += len(rows)
+            if page.next_after is None:
+                break
+            after = page.next_after
+        if fmt == "csv" and writer is None:
+            csv.writer(f).writerow(columns)
+    finally:
+        if f:
+            f.close()
+        elif writer is not None:
+            writer.close()
+    seconds = time.perf_counter() - start
+    log(f"{table}: exported {count:,} rows in {seconds:.1f} s, {count / seconds if seconds else 0:,.0f} rows/s")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import or export pharmacy data as CSV or Parquet")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Validate and upsert a file")
+    import_parser.add_argument("kind", choices=sorted(IMPORT_SPECS))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--rejects", help="Write rejected rows and the reason to this CSV file")
+    import_parser.add_argument("--store", type=int, help="Only receive inventory into this store (M_ID)")
+    export_parser = subparsers.add_parser("export", help="Write a table to a file")
+    export_parser.add_argument("table", choices=sorted(EXPORT_KEYS))
+    export_parser.add_argument("path")
+    for sub in (import_parser, export_parser):
+        sub.add_argument("--format", choices=["csv", "parquet"], help="Defaults to the file extension")
+        sub.add_argument("--chunk-size", type=int, default=5000, help="Rows per read and per transaction")
+    args = parser.parse_args()
+
+    with db_pool.connection() as conn:
+        if args.command == "import":
+            result = import_file(conn, args.kind, args.path, args.format, args.chunk_size, args.rejects, args.store)
+            if result.rejected and not args.rejects:
+                print("Pass --rejects to see which rows were skipped and why.")
+        else:
+            export_table(conn, args.table, args.path, args.format, args.chunk_size)
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+# Thread-safe LRU cache with hit/miss counters
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# LRU cache whose entries also expire after a time-to-live (in seconds)
+class TTLCache(LRUCache):
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self._clock = clock
+
+    def get(self, key, default=None):
+        entry = super().get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at < self._clock():
+            self.pop(key)
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def put(self, key, value, ttl=None):
+        super().put(key, (self._clock() + (self.ttl if ttl is None else ttl), value))
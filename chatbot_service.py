@@ -0,0 +1,225 @@
+import argparse
+import os
+import re
+import threading
+
+from cache_utils import TTLCache
+
+SYSTEM_PROMPT = ("You are the virtual assistant of a pharmacy. Answer questions about medicines, orders and the "
+                 "pharmacy briefly and clearly, and advise seeing a doctor or pharmacist for anything serious.")
+SUMMARY_PROMPT = ("Summarize this conversation between a pharmacy customer and the assistant in at most {words} "
+                  "words. Keep medicine names, doses and anything the customer said about themselves.")
+FALLBACK_REPLY = "Sorry, I couldn't process that."
+CONTEXT_PROMPT = ("Current pharmacy data that may help (answer from it when it is relevant, and do not invent "
+                  "stock levels or prices that are not listed):\n{context}\n\nQuestion: {question}")
+
+# Filler that does not change what is being asked; dropped when building cache keys
+FILLER_WORDS = {"a", "an", "the", "please", "pls", "hi", "hello", "hey", "can", "could", "you", "me", "tell", "i",
+                "would", "like", "to", "know", "kindly", "thanks", "thank"}
+
+
+# Cache key for a prompt: case, punctuation, extra whitespace and filler words are ignored, so
+# "What are your opening hours?" and "what are your opening hours" share one cached answer
+def normalize_prompt(text):
+    words = re.findall(r"[\w']+", text.casefold())
+    kept = [word for word in words if word not in FILLER_WORDS]
+    return " ".join(kept or words)
+
+
+# Google Gemini; the SDK is only imported and configured on first use. Messages are (role, text) pairs
+# with role "user" or "assistant".
+class GeminiChatBackend:
+    def __init__(self, api_key, model_name="gemini-pro", timeout=30):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def stream(self, messages):
+        contents = [{"role": "model" if role == "assistant" else "user", "parts": [text]} for role, text in messages]
+        response = self._get_model().generate_content(contents, stream=True,
+                                                      request_options={"timeout": self.timeout})
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:  # chunk without text, e.g. blocked by the safety filters
+                continue
+            if text:
+                yield text
+
+    def complete(self, prompt):
+        response = self._get_model().generate_content(prompt, request_options={"timeout": self.timeout})
+        return response.text
+
+
+# Offline stand-in for tests and local development: answers from a canned dict keyed by normalized prompt,
+# otherwise echoes the question, streaming word by word
+class StubChatBackend:
+    def __init__(self, replies=None):
+        self.replies = {normalize_prompt(prompt): reply for prompt, reply in (replies or {}).items()}
+        self.calls = []
+
+    def stream(self, messages):
+        self.calls.append(list(messages))
+        question = messages[-1][1]
+        reply = self.replies.get(normalize_prompt(question), f"You asked: {question}")
+        for word in reply.split(" "):
+            yield word + " "
+
+    def complete(self, prompt):
+        self.calls.append([("user", prompt)])
+        return " ".join(prompt.split()[-60:])
+
+
+CHAT_BACKENDS = {
+    "gemini": lambda env: GeminiChatBackend(env.get("PHARMACY_GEMINI_API_KEY", ""),
+                                            env.get("PHARMACY_GEMINI_MODEL", "gemini-pro"),
+                                            float(env.get("PHARMACY_CHAT_TIMEOUT", "30"))),
+    "stub": lambda env: StubChatBackend(),
+}
+
+
+# One user's conversation: the most recent turns verbatim and a running summary of everything older
+class ChatSession:
+    def __init__(self):
+        self.turns = []
+        self.summary = ""
+
+    def is_empty(self):
+        return not self.turns and not self.summary
+
+
+# Chat front end shared by all sessions. Replies are streamed; opening questions are answered from a
+# cache of normalized prompts when possible; once a session holds more than max_turns messages the oldest
+# are folded into its summary, so prompt size and session memory stay bounded.
+class ChatService:
+    def __init__(self, backend, cache_ttl=86400, cache_size=1024, max_turns=12, summary_words=150,
+                 max_summary_chars=2000):
+        self.backend = backend
+        self.max_turns = max_turns
+        self.summary_words = summary_words
+        self.max_summary_chars = max_summary_chars
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "backend_calls": 0, "summaries": 0, "errors": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    # Retrieved context is only attached to the current question; the session keeps the question as asked
+    def _messages(self, session, user_input, context=None):
+        preamble = SYSTEM_PROMPT
+        if session.summary:
+            preamble += f"\n\nSummary of the conversation so far: {session.summary}"
+        messages = [("user", preamble), ("assistant", "Understood.")]
+        if context:
+            user_input = CONTEXT_PROMPT.format(context=context, question=user_input)
+        return messages + session.turns + [("user", user_input)]
+
+    # Yield the reply to user_input in pieces as they arrive, then record the exchange in the session.
+    # context is pharmacy data retrieved for the question (see retrieval.py).
+    def stream_reply(self, session, user_input, context=None):
+        self._count("requests")
+        # A cached answer is only reused for a conversation's opening question when no live data was retrieved
+        # for it, where nothing else could change what the answer should be
+        key = normalize_prompt(user_input) if session.is_empty() and not context else None
+        reply = self._cache.get(key) if key else None
+        if reply is not None:
+            yield reply
+        else:
+            self._count("backend_calls")
+            parts = []
+            try:
+                for part in self.backend.stream(self._messages(session, user_input, context)):
+                    parts.append(part)
+                    yield part
+            except Exception:
+                self._count("errors")
+                raise
+            reply = "".join(parts).strip()
+            if not reply:
+                reply = FALLBACK_REPLY
+                yield reply
+            elif key:
+                self._cache.put(key, reply)
+        session.turns += [("user", user_input), ("assistant", reply)]
+        self._compact(session)
+
+    def reply(self, session, user_input, context=None):
+        return "".join(self.stream_reply(session, user_input, context)).strip()
+
+    # Fold the oldest turns into the summary, keeping the newest half of max_turns verbatim
+    def _compact(self, session):
+        if len(session.turns) <= self.max_turns:
+            return
+        keep = max(2, self.max_turns // 2) // 2 * 2  # whole user/assistant exchanges
+        old, session.turns = session.turns[:-keep], session.turns[-keep:]
+        transcript = "\n".join(f"{role.title()}: {text}" for role, text in old)
+        if session.summary:
+            transcript = f"Earlier summary: {session.summary}\n{transcript}"
+        self._count("summaries")
+        try:
+            summary = self.backend.complete(SUMMARY_PROMPT.format(words=self.summary_words) + "\n\n" + transcript)
+        except Exception as e:
+            print(f"Chat summary failed, keeping the newest part of the transcript: {e}")
+            summary = transcript
+        session.summary = summary.strip()[-self.max_summary_chars:]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(cache_hits=self._cache.hits, cache_size=len(self._cache))
+        return stats
+
+
+def chat_service_from_env():
+    env = os.environ
+    backend = CHAT_BACKENDS[env.get("PHARMACY_CHAT_BACKEND", "gemini").lower()](env)
+    return ChatService(
+        backend,
+        cache_ttl=float(env.get("PHARMACY_CHAT_CACHE_TTL", "86400")),
+        max_turns=int(env.get("PHARMACY_CHAT_MAX_TURNS", "12")),
+    )
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_chat_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = chat_service_from_env()
+        return _service
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat with the pharmacy assistant from the terminal")
+    parser.add_argument("--backend", choices=sorted(CHAT_BACKENDS), help="Overrides PHARMACY_CHAT_BACKEND")
+    args = parser.parse_args()
+
+    if args.backend:
+        os.environ["PHARMACY_CHAT_BACKEND"] = args.backend
+    service = get_chat_service()
+    session = ChatSession()
+    while True:
+        try:
+            user_input = input("> ").strip()
+        except EOFError:
+            break
+        if user_input:
+            for part in service.stream_reply(session, user_input):
+                print(part, end="", flush=True)
+            print()
+    print(service.stats())
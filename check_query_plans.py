@@ -0,0 +1,165 @@
+import argparse
+import os
+import tempfile
+
+import db_pool
+import retrieval
+from generate_synthetic_data import generate
+from migrate import apply_migrations
+
+# The app's filtered queries, with sample parameters and the tables that must be read through an index
+APP_QUERIES = {
+    "login_customer": (
+        "SELECT C_ID, Pwd FROM Customer WHERE EmailID = %s",
+        ("user500@example.com",), {"Customer"},
+    ),
+    "login_manager": (
+        "SELECT M_ID, M_pwd FROM Manager WHERE M_name = %s",
+        ("Manager 1",), {"Manager"},
+    ),
+    "view_orders": (
+        "SELECT Order_ID, Qty, Name, Item FROM Orders WHERE C_ID = %s",
+        (500,), {"Orders"},
+    ),
+    "order_history": (
+        "SELECT DISTINCT Item FROM Orders WHERE C_ID = %s",
+        (500,), {"Orders"},
+    ),
+    "reserve_stock": (
+        "SELECT M_ID FROM InventoryBatch WHERE D_ID = %s AND Expiry_date >= %s AND Qty > 0 "
+        "GROUP BY M_ID HAVING SUM(Qty) >= %s ORDER BY SUM(Qty) DESC, M_ID LIMIT 1",
+        (50, "2024-01-15", 1), {"InventoryBatch"},
+    ),
+    "store_stock": (
+        "SELECT M_ID, D_ID, SUM(CASE WHEN Expiry_date >= %s THEN Qty ELSE 0 END) FROM InventoryBatch "
+        "WHERE Qty > 0 AND D_ID IN (%s, %s) GROUP BY M_ID, D_ID",
+        ("2024-01-15", 50, 51), {"InventoryBatch"},
+    ),
+    "decrement_stock": (
+        "UPDATE Inventory SET Rem_qty = Rem_qty - %s WHERE D_ID = %s AND M_ID = %s AND Rem_qty >= %s",
+        (1, 50, 1, 1), {"Inventory"},
+    ),
+    # The alert scheduler's periodic reconcile reads every stock row by design; only its per-change queries are checked
+    "reorder_thresholds": (
+        "SELECT D_ID, Threshold FROM ReorderThreshold WHERE D_ID IN (%s, %s)",
+        (50, 51), {"ReorderThreshold"},
+    ),
+    "low_stock_changed": (
+        "SELECT Inventory.D_ID, Inventory.M_ID, COALESCE(SUM(InventoryBatch.Qty), 0) FROM Inventory "
+        "LEFT JOIN InventoryBatch ON InventoryBatch.D_ID = Inventory.D_ID AND InventoryBatch.M_ID = Inventory.M_ID "
+        "AND InventoryBatch.Expiry_date >= %s AND InventoryBatch.Qty > 0 WHERE Inventory.D_ID IN (%s, %s) "
+        "GROUP BY Inventory.D_ID, Inventory.M_ID HAVING COALESCE(SUM(InventoryBatch.Qty), 0) <= %s",
+        ("2024-01-15", 50, 51, 0), {"Inventory", "InventoryBatch"},
+    ),
+    "inventory_events": (
+        "SELECT Event_ID, D_ID, M_ID, Delta, Rem_qty, Reason, Created_at FROM InventoryEvent "
+        "WHERE Event_ID > %s ORDER BY Event_ID LIMIT %s",
+        (100, 1000), {"InventoryEvent"},
+    ),
+    "store_events": (
+        "SELECT Event_ID, D_ID, M_ID, Delta, Rem_qty, Reason, Created_at FROM InventoryEvent "
+        "WHERE M_ID = %s ORDER BY Event_ID DESC LIMIT %s",
+        (3, 50), {"InventoryEvent"},
+    ),
+    "fefo_batches": (
+        "SELECT Batch_ID, Expiry_date, Qty FROM InventoryBatch WHERE D_ID = %s AND M_ID = %s AND Qty > 0 "
+        "AND (Expiry_date > %s OR (Expiry_date = %s AND Batch_ID > %s)) ORDER BY Expiry_date, Batch_ID LIMIT %s",
+        (50, 3, "2026-01-01", "2026-01-01", 0, 8), {"InventoryBatch"},
+    ),
+    "expiring_batches": (
+        "SELECT InventoryBatch.Batch_ID, InventoryBatch.D_ID, Drugs.D_name, InventoryBatch.M_ID, "
+        "InventoryBatch.Expiry_date, InventoryBatch.Qty "
+        "FROM InventoryBatch JOIN Drugs ON InventoryBatch.D_ID = Drugs.D_ID "
+        "WHERE InventoryBatch.Expiry_date <= %s AND InventoryBatch.Qty > 0 AND InventoryBatch.M_ID = %s "
+        "ORDER BY InventoryBatch.Expiry_date, InventoryBatch.Batch_ID LIMIT %s",
+        ("2026-04-01", 3, 500), {"InventoryBatch", "Drugs"},
+    ),
+    "qr_drug_details": (
+        "SELECT D_ID, D_name, D_use, Expiry_date FROM Drugs WHERE D_ID IN (%s, %s, %s)",
+        (1, 50, 99), {"Drugs"},
+    ),
+    "retrieval_drugs": (
+        retrieval.DRUG_QUERY + " WHERE D_ID IN (%s, %s, %s)", (1, 50, 99), {"Drugs", "Sale_Item"},
+    ),
+    "retrieval_new_suppliers": (
+        retrieval.SUPPLIER_QUERY + " WHERE Supplier.S_ID > %s ORDER BY Supplier.S_ID LIMIT %s", (10, 5000),
+        {"Supplier", "Supplies", "Drugs"},
+    ),
+    "retrieval_customer_orders": (
+        "SELECT Item, COUNT(*), SUM(Qty), MAX(Order_ID) AS Latest FROM Orders WHERE C_ID = %s "
+        "GROUP BY Item ORDER BY Latest DESC LIMIT 200", (7,), {"Orders"},
+    ),
+    "sales_by_date": (
+        "SELECT Sale_ID, Total_amt, Date, Time FROM Sales WHERE Date BETWEEN %s AND %s",
+        ("2025-02-01", "2025-02-07"), {"Sales"},
+    ),
+    "sales_page": (
+        "SELECT Sale_ID, Total_amt, Date, Time, M_ID FROM Sales WHERE M_ID = %s "
+        "AND (((Date < %s OR Date IS NULL)) OR (Date = %s AND Sale_ID < %s)) ORDER BY Date DESC, Sale_ID DESC LIMIT 51",
+        (3, "2025-02-07", "2025-02-07", 100), {"Sales"},
+    ),
+    "inventory_page": (
+        "SELECT D_ID, Rem_qty, M_ID FROM Inventory WHERE M_ID = %s "
+        "AND ((Rem_qty > %s) OR (Rem_qty = %s AND D_ID > %s) OR (Rem_qty = %s AND D_ID = %s AND M_ID > %s)) "
+        "ORDER BY Rem_qty ASC, D_ID ASC, M_ID ASC LIMIT 51",
+        (3, 10, 10, 5, 10, 5, 3), {"Inventory"},
+    ),
+    "expiring_drugs": (
+        "SELECT D_ID, D_name FROM Drugs WHERE Expiry_date <= %s",
+        ("2024-01-15",), {"Drugs"},
+    ),
+    "supplier_by_id": (
+        "SELECT S_name, S_address, S_phone FROM Supplier WHERE S_ID = %s",
+        (1,), {"Supplier"},
+    ),
+}
+
+
+# Tables the plan reads with a full scan
+def full_scans(conn, query, params):
+    cursor = conn.cursor(dictionary=True)
+    if conn.backend == "sqlite":
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        # e.g. "SCAN Orders" or "SCAN Orders USING COVERING INDEX ..." for a full (index) scan
+        scanned = {row["detail"].split()[1] for row in cursor.fetchall() if row["detail"].startswith("SCAN ")}
+    else:
+        cursor.execute("EXPLAIN " + query, params)
+        scanned = {row["table"] for row in cursor.fetchall() if row["type"] in ("ALL", "index")}
+    cursor.close()
+    conn.rollback()
+    return {table.lower() for table in scanned}
+
+
+def check_plans(conn, queries=APP_QUERIES):
+    failures = {}
+    for name, (query, params, indexed_tables) in queries.items():
+        scanned = full_scans(conn, query, params) & {table.lower() for table in indexed_tables}
+        status = "FULL SCAN of " + ", ".join(sorted(scanned)) if scanned else "ok"
+        print(f"{name:>16}: {status}")
+        if scanned:
+            failures[name] = scanned
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if any app query plans a full table scan at scale")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows generated for Orders and Sales")
+    parser.add_argument("--use-configured-db", action="store_true",
+                        help="Check the PHARMACY_DB_* database as-is instead of a generated SQLite copy")
+    args = parser.parse_args()
+
+    config = db_pool.db_config_from_env()
+    if not args.use_configured_db:
+        config.update(backend="sqlite", sqlite_path=os.path.join(tempfile.mkdtemp(), "query_plans.db"))
+    pool = db_pool.ConnectionPool(config)
+    conn = pool.get_connection()
+    apply_migrations(conn)
+    if not args.use_configured_db:
+        print(f"Generating {args.rows} rows...")
+        generate(conn, args.rows)
+    failures = check_plans(conn)
+    conn.close()
+    pool.close_all()
+    if failures:
+        raise SystemExit(f"{len(failures)} query plan(s) regressed to a full table scan")
+    print("All query plans use indexes.")
@@ -0,0 +1,420 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import mysql.connector
+except ImportError:  # SQLite-only setups do not need the MySQL driver
+    mysql = None
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pharmacysql.sql")
+
+# Exceptions raised by either backend, for use in `except DB_ERRORS:`
+DB_ERRORS = (sqlite3.Error,) + ((mysql.connector.Error,) if mysql else ())
+
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+# Read the database settings from the environment (PHARMACY_DB_HOST, PHARMACY_DB_USER, ...)
+def db_config_from_env(prefix="PHARMACY_DB"):
+    env = os.environ
+    return {
+        "backend": env.get(f"{prefix}_BACKEND", "mysql").lower(),
+        "host": env.get(f"{prefix}_HOST", "localhost"),
+        "port": int(env.get(f"{prefix}_PORT", "3306")),
+        "user": env.get(f"{prefix}_USER", "root"),
+        "password": env.get(f"{prefix}_PASSWORD", ""),
+        "database": env.get(f"{prefix}_NAME", "PharmacyManagement"),
+        "sqlite_path": env.get(f"{prefix}_SQLITE_PATH", "pharmacy_local.db"),
+        "schema_file": env.get(f"{prefix}_SCHEMA_FILE", SCHEMA_FILE),
+        "pool_size": int(env.get(f"{prefix}_POOL_SIZE", "5")),
+        "checkout_timeout": float(env.get(f"{prefix}_CHECKOUT_TIMEOUT", "10")),
+        "idle_timeout": float(env.get(f"{prefix}_IDLE_TIMEOUT", "300")),
+        "health_check_interval": float(env.get(f"{prefix}_HEALTH_CHECK_INTERVAL", "30")),
+    }
+
+
+# Convert the MySQL dump in pharmacysql.sql into statements SQLite understands
+def sqlite_statements_from_mysql(script):
+    lines = [line.split("--", 1)[0] for line in script.splitlines()]
+    statements = []
+    for statement in "\n".join(lines).split(";"):
+        statement = statement.strip()
+        keyword = statement.upper()
+        if not statement or keyword.startswith(("CREATE DATABASE", "USE ", "SELECT")):
+            continue
+        statement = re.sub(r"\bINT\s+PRIMARY\s+KEY\s+AUTO_INCREMENT\b",
+                           "INTEGER PRIMARY KEY AUTOINCREMENT", statement, flags=re.IGNORECASE)
+        statements.append(statement.replace('"', "'"))
+    return statements
+
+
+# Create a local SQLite database from the MySQL schema and (unless sample_data is false) its sample data
+def build_sqlite_database(path, schema_file=SCHEMA_FILE, sample_data=True):
+    with open(schema_file, encoding="utf-8") as f:
+        statements = sqlite_statements_from_mysql(f.read())
+    if not sample_data:
+        statements = [statement for statement in statements if not statement.upper().startswith("INSERT")]
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        for statement in statements:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+# Cursor that accepts the MySQL-style %s placeholders used throughout the app
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {col[0]: value for col, value in zip(self._cursor.description, row)}
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(query.replace("%s", "?"), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size or self._cursor.arraysize)
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def close(self):
+        self._cursor.close()
+
+
+# Thin wrapper giving sqlite3 connections the subset of the mysql.connector API the app uses
+class SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def begin(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self):
+        self._conn.execute("SELECT 1").fetchone()
+
+    def close(self):
+        self._conn.close()
+
+
+def _connect_mysql(config):
+    if mysql is None:
+        raise RuntimeError("mysql-connector-python is required for the MySQL backend")
+    conn = mysql.connector.connect(
+        host=config["host"], port=config["port"], user=config["user"],
+        password=config["password"], database=config["database"],
+    )
+    return conn
+
+
+_build_lock = threading.Lock()
+
+
+def _connect_sqlite(config):
+    path = config["sqlite_path"]
+    with _build_lock:
+        if not os.path.exists(path):
+            build_sqlite_database(path, config["schema_file"], config.get("sample_data", True))
+    return SQLiteConnection(path)
+
+
+BACKENDS = {
+    "mysql": _connect_mysql,
+    "sqlite": _connect_sqlite,
+}
+
+
+# Connection handed out by the pool; close() returns it to the pool instead of disconnecting
+class PooledConnection:
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.backend = pool.backend
+
+    def begin(self):
+        if self.backend == "mysql":
+            if self._raw.in_transaction:
+                self._raw.rollback()
+            self._raw.start_transaction()
+        else:
+            self._raw.begin()
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise RuntimeError("Connection has already been returned to the pool")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Bounded pool with health checks on checkout and eviction of idle connections
+class ConnectionPool:
+    def __init__(self, config):
+        self.config = config
+        self.backend = config["backend"]
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown database backend: {self.backend}")
+        self._connect = BACKENDS[self.backend]
+        self.max_size = max(1, config["pool_size"])
+        self._idle = deque()  # (raw connection, last used, last checked)
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "exhausted": 0,
+            "timeouts": 0,
+            "created": 0,
+            "closed": 0,
+            "evicted": 0,
+            "health_check_failures": 0,
+        }
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _evict_idle_locked(self, now):
+        idle_timeout = self.config["idle_timeout"]
+        expired = []
+        # The oldest connections sit at the left end of the deque
+        while self._idle and now - self._idle[0][1] > idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        if expired:
+            self._size -= len(expired)
+            self._stats["evicted"] += len(expired)
+            self._cond.notify_all()
+        return expired
+
+    def _healthy(self, raw):
+        try:
+            if self.backend == "mysql":
+                raw.ping(reconnect=False)
+            else:
+                raw.ping()
+            return True
+        except Exception:
+            return False
+
+    def get_connection(self, timeout=None):
+        timeout = self.config["checkout_timeout"] if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        while True:
+            raw = None
+            create = False
+            expired = []
+            try:
+                with self._cond:
+                    while True:
+                        now = time.monotonic()
+                        expired.extend(self._evict_idle_locked(now))
+                        if self._idle:
+                            raw, last_used, last_checked = self._idle.pop()
+                            break
+                        if self._size < self.max_size:
+                            self._size += 1
+                            create = True
+                            break
+                        if not waited:
+                            self._stats["exhausted"] += 1
+                            waited = True
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolExhaustedError(
+                                f"No database connection available after {timeout:.1f}s "
+                                f"(pool size {self.max_size})"
+                            )
+                        self._cond.wait(remaining)
+            finally:
+                for conn in expired:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            if create:
+                try:
+                    raw = self._connect(self.config)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif time.monotonic() - last_checked > self.config["health_check_interval"]:
+                if not self._healthy(raw):
+                    with self._cond:
+                        self._stats["health_check_failures"] += 1
+                    self._discard(raw)
+                    continue
+
+            wait = time.monotonic() - start
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += wait
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait)
+            return PooledConnection(self, raw)
+
+    def release(self, raw):
+        # Never hand an open transaction to the next caller
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        now = time.monotonic()
+        with self._cond:
+            self._idle.append((raw, now, now))
+            self._cond.notify()
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["max_size"] = self.max_size
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def close_all(self):
+        with self._cond:
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for raw in idle:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Shared pool for this process; Streamlit reruns reuse it because imported modules are cached
+def get_pool(name="default", config=None):
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = ConnectionPool(config or db_config_from_env())
+            _pools[name] = pool
+        return pool
+
+
+def get_connection(name="default"):
+    return get_pool(name).get_connection()
+
+
+@contextmanager
+def connection(name="default"):
+    conn = get_connection(name)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_metrics():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.metrics() for name, pool in pools.items()}
+
+
+# Insert rows with multi-row VALUES statements, `batch_size` rows per statement
+def bulk_insert(cursor, table, columns, rows, batch_size=500):
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            cursor.execute(prefix + ", ".join([row_placeholder] * len(batch)), [v for r in batch for v in r])
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.execute(prefix + ", ".join([row_placeholder] * len(batch)), [v for r in batch for v in r])
+        count += len(batch)
+    return count
+
+
+# INSERT that updates the existing row on a key conflict. Columns in `increment` are added to the stored value,
+# the other non-key columns are overwritten.
+def upsert_sql(backend, table, columns, keys, increment=()):
+    placeholders = ", ".join(["%s"] * len(columns))
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    updates = [column for column in columns if column not in keys]
+    if backend == "mysql":
+        assignments = [f"{c} = {c} + VALUES({c})" if c in increment else f"{c} = VALUES({c})" for c in updates]
+        return f"{insert} ON DUPLICATE KEY UPDATE {', '.join(assignments)}"
+    assignments = [f"{c} = {c} + excluded.{c}" if c in increment else f"{c} = excluded.{c}" for c in updates]
+    action = f"DO UPDATE SET {', '.join(assignments)}" if assignments else "DO NOTHING"
+    return f"{insert} ON CONFLICT ({', '.join(keys)}) {action}"
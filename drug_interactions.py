@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import requests
+
+import db_pool
+from cache_utils import TTLCache
+
+OPENFDA_URL = "https://api.fda.gov/drug/label.json"
+# Label fields kept in the cache; full labels are tens of kilobytes
+LABEL_FIELDS = ("set_id", "version", "effective_time", "warnings", "drug_interactions")
+
+
+def normalize_drug_name(drug_name):
+    return re.sub(r"\s+", " ", drug_name).strip().lower()
+
+
+# Fetches drug labels from openFDA (or any server speaking the same API, e.g. a local fake)
+class OpenFDAFetcher:
+    def __init__(self, base_url=OPENFDA_URL, timeout=(3.05, 5)):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def fetch(self, drug_name):
+        response = requests.get(self.base_url, params={"search": drug_name, "limit": 1}, timeout=self.timeout)
+        # openFDA answers 404 when nothing matches the search
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        results = response.json().get("results") or [{}]
+        return {field: results[0][field] for field in LABEL_FIELDS if field in results[0]}
+
+
+# Reads labels from <fixture dir>/<drug name>.json so lookups work offline
+class FixtureFetcher:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, drug_name):
+        path = os.path.join(self.directory, f"{normalize_drug_name(drug_name)}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        results = data.get("results") or [data]
+        return {field: results[0][field] for field in LABEL_FIELDS if field in results[0]}
+
+
+# Persistent label cache shared by all sessions and restarts
+class LabelStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels (drug TEXT PRIMARY KEY, label TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, drug, max_age):
+        with self._lock:
+            row = self._conn.execute("SELECT label, fetched_at FROM labels WHERE drug = ?", (drug,)).fetchone()
+        if row is None or time.time() - row[1] > max_age:
+            return None
+        return json.loads(row[0])
+
+    def put(self, drug, label):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO labels (drug, label, fetched_at) VALUES (?, ?, ?)",
+                (drug, json.dumps(label), time.time()),
+            )
+            self._conn.commit()
+
+
+def format_warnings(drug_name, label):
+    warnings_list = label.get("warnings")
+    if not warnings_list:
+        return f"✅ *No known harmful interactions for {drug_name}.*"
+
+    # Clean and format warnings into multiple bullet points
+    formatted_warnings = "\n\n".join([
+        f"• {sentence.strip()}" for warning in warnings_list for sentence in warning.split(". ") if sentence
+    ])
+    return f"⚠ *Warning for {drug_name}:*\n\n{formatted_warnings}"
+
+
+# Label lookups with a TTL cache (memory + disk), coalesced upstream calls and background prefetch
+class InteractionLookupService:
+    def __init__(self, fetcher, store, ttl=86400, max_workers=4):
+        self.fetcher = fetcher
+        self.store = store
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=4096, ttl=ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openfda")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._prefetch_started = False
+        self.label_listeners = []  # called with (drug, label) whenever a label is loaded
+        self._stats = {"upstream_calls": 0, "coalesced": 0, "disk_hits": 0, "errors": 0}
+
+    def _load(self, drug):
+        label = self.store.get(drug, self.ttl)
+        if label is not None:
+            with self._lock:
+                self._stats["disk_hits"] += 1
+        else:
+            with self._lock:
+                self._stats["upstream_calls"] += 1
+            label = self.fetcher.fetch(drug)
+            self.store.put(drug, label)
+        self._memory.put(drug, label)
+        for listener in self.label_listeners:
+            try:
+                listener(drug, label)
+            except Exception as e:
+                print(f"Label listener failed for {drug}: {e}")
+        return label
+
+    def _finish(self, drug, future):
+        with self._lock:
+            self._inflight.pop(drug, None)
+            if future.exception() is not None:
+                self._stats["errors"] += 1
+
+    # Future for the label of a drug; concurrent callers share one upstream request
+    def get_label_async(self, drug_name):
+        drug = normalize_drug_name(drug_name)
+        with self._lock:
+            future = self._inflight.get(drug)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future
+            future = self._executor.submit(self._load, drug)
+            self._inflight[drug] = future
+        future.add_done_callback(lambda f: self._finish(drug, f))
+        return future
+
+    def get_label(self, drug_name, wait=None):
+        label = self._memory.get(normalize_drug_name(drug_name))
+        if label is not None:
+            return label
+        return self.get_label_async(drug_name).result(timeout=wait)
+
+    # Formatted warning text, or None if the label is still loading after `wait` seconds
+    def lookup(self, drug_name, wait=0.5):
+        try:
+            label = self.get_label(drug_name, wait=wait)
+        except FutureTimeoutError:
+            return None
+        except Exception as e:
+            return f"❌ *Error fetching data: {e}*"
+        return format_warnings(drug_name, label)
+
+    # Warm the cache for every drug in the Drugs table without blocking the caller
+    def start_prefetch(self):
+        with self._lock:
+            if self._prefetch_started:
+                return
+            self._prefetch_started = True
+        threading.Thread(target=self._prefetch_drugs_table, name="openfda-prefetch", daemon=True).start()
+
+    def _prefetch_drugs_table(self):
+        try:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT DISTINCT D_name FROM Drugs")
+                names = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+        except Exception as e:
+            print("Interaction prefetch failed:", e)
+            return
+        for name in names:
+            if self._memory.get(normalize_drug_name(name)) is None:
+                self.get_label_async(name)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["memory_hits"] = self._memory.hits
+        stats["memory_misses"] = self._memory.misses
+        return stats
+
+
+def interaction_service_from_env():
+    env = os.environ
+    fixtures = env.get("PHARMACY_OPENFDA_FIXTURES")
+    if fixtures:
+        fetcher = FixtureFetcher(fixtures)
+    else:
+        timeout = float(env.get("PHARMACY_OPENFDA_TIMEOUT", "5"))
+        fetcher = OpenFDAFetcher(env.get("PHARMACY_OPENFDA_URL", OPENFDA_URL), timeout=(min(3.05, timeout), timeout))
+    return InteractionLookupService(
+        fetcher,
+        LabelStore(env.get("PHARMACY_INTERACTION_CACHE", "interaction_cache.db")),
+        ttl=float(env.get("PHARMACY_INTERACTION_TTL", "86400")),
+    )
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_interaction_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = interaction_service_from_env()
+        return _service
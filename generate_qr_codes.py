@@ -1,14 +1,131 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
 import qrcode
+from PIL import Image
+
+import db_pool
+from generate_synthetic_data import sqlite_config
+
+
+# QR payload for a drug; qr_lookup.parse_payload reads the ID back out of it
+def label_payload(medicine_id, medicine_name):
+    return f"Medicine ID: {medicine_id}\nName: {medicine_name}"
+
+
+def label_filename(medicine_id):
+    return f"D_{medicine_id}.png"
+
+
+# Render one label to PNG bytes (runs in a worker process). Any mask pattern scans, so one is fixed instead of
+# letting qrcode score all eight, and the module matrix is scaled up in one resize rather than drawn box by box;
+# together that makes a label about 5x cheaper to render.
+def render_label(item, box_size=4):
+    medicine_id, payload = item
+    qr = qrcode.QRCode(border=2, error_correction=qrcode.constants.ERROR_CORRECT_M, mask_pattern=0)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    side = len(matrix)
+    image = Image.frombytes("L", (side, side), bytes(0 if dark else 255 for row in matrix for dark in row))
+    buffer = io.BytesIO()
+    image.resize((side * box_size, side * box_size), Image.NEAREST).convert("1").save(buffer, format="PNG")
+    return medicine_id, buffer.getvalue()
+
+
+# Yield (D_ID, payload) for every drug, reading the table in chunks
+def stream_drugs(conn, chunk_size=5000):
+    cursor = conn.cursor()
+    cursor.execute("SELECT D_ID, D_name FROM Drugs ORDER BY D_ID")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for d_id, d_name in rows:
+            yield d_id, label_payload(d_id, d_name)
+    cursor.close()
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _digest(payload):
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+# Write a QR label for every drug into a zip archive named by D_ID. With a manifest from an earlier run only
+# new or renamed drugs are rendered; unchanged labels are copied over from the previous archive.
+# Returns (rendered, kept, removed).
+def generate_labels(conn, output, manifest_path, workers=None, incremental=True, chunk_size=2000, log=print):
+    previous = load_manifest(manifest_path) if incremental and os.path.exists(output) else {}
+    manifest = {}
+    rendered = kept = 0
+    started = time.perf_counter()
+    tmp_output = f"{output}.tmp"
+
+    old_archive = zipfile.ZipFile(output) if previous else None
+    old_names = set(old_archive.namelist()) if old_archive else set()
+    try:
+        # PNGs are already compressed, so the archive stores them as-is
+        with zipfile.ZipFile(tmp_output, "w", compression=zipfile.ZIP_STORED) as archive, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = []
+
+            def flush():
+                nonlocal rendered
+                for medicine_id, png in executor.map(render_label, pending, chunksize=64):
+                    archive.writestr(label_filename(medicine_id), png)
+                    rendered += 1
+                pending.clear()
+                log(f"{rendered + kept:>10} labels ({rendered} rendered, {kept} unchanged)")
+
+            for medicine_id, payload in stream_drugs(conn):
+                digest = _digest(payload)
+                manifest[str(medicine_id)] = digest
+                if previous.get(str(medicine_id)) == digest and label_filename(medicine_id) in old_names:
+                    archive.writestr(label_filename(medicine_id), old_archive.read(label_filename(medicine_id)))
+                    kept += 1
+                    continue
+                pending.append((medicine_id, payload))
+                if len(pending) >= chunk_size:
+                    flush()
+            if pending:
+                flush()
+    finally:
+        if old_archive is not None:
+            old_archive.close()
+
+    os.replace(tmp_output, output)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    elapsed = time.perf_counter() - started
+    removed = len(set(previous) - set(manifest))
+    log(f"Rendered {rendered} labels in {elapsed:.1f}s ({rendered / elapsed if elapsed else 0:.0f} labels/sec); "
+        f"{kept} unchanged, {removed} removed")
+    return rendered, kept, removed
 
-# Function to generate QR Code for medicines
-def generate_qr_code(medicine_id, medicine_name):
-    qr_data = f"Medicine ID: {medicine_id}\nName: {medicine_name}"
-    qr = qrcode.make(qr_data)
-    qr.save(f"{medicine_name}.png")  # Save as image
 
-    print(f"✅ QR Code generated for {medicine_name}!")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a QR label for every drug into a zip archive")
+    parser.add_argument("--output", default="qr_labels.zip")
+    parser.add_argument("--manifest", help="Digest of each rendered label (default: <output>.manifest.json)")
+    parser.add_argument("--workers", type=int, help="Rendering processes (default: one per CPU)")
+    parser.add_argument("--full", action="store_true", help="Re-render every label instead of only changed drugs")
+    parser.add_argument("--sqlite", metavar="PATH", help="Read Drugs from this SQLite file instead of the PHARMACY_DB_* database")
+    args = parser.parse_args()
 
-# Generate QR codes for sample medicines
-generate_qr_code(1, "Paracetamol")
-generate_qr_code(2, "Aspirin")
-generate_qr_code(3, "Ibuprofen")
+    pool = db_pool.ConnectionPool(sqlite_config(args.sqlite) if args.sqlite else db_pool.db_config_from_env())
+    with pool.get_connection() as conn:
+        generate_labels(conn, args.output, args.manifest or f"{args.output}.manifest.json", args.workers,
+                        incremental=not args.full)
+    pool.close_all()
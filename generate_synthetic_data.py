@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import random
+import time
+
+import db_pool
+from db_pool import bulk_insert
+from migrate import apply_migrations
+
+DRUG_STEMS = ["Para", "Ibu", "Amoxi", "Ceti", "Aspi", "Metfor", "Atorva", "Omepra", "Losar", "Azithro",
+              "Cipro", "Doxy", "Predni", "Levo", "Sertra", "Amlo", "Panto", "Clopi", "Monte", "Gaba"]
+DRUG_SUFFIXES = ["cetamol", "profen", "cillin", "rizine", "rin", "min", "statin", "zole", "tan", "mycin"]
+USES = ["Pain Reliever", "Anti-inflammatory", "Antibiotic", "Antihistamine", "Antidiabetic",
+        "Cholesterol", "Antacid", "Blood Pressure", "Antidepressant", "Anticonvulsant"]
+CITIES = ["Blore", "Mysore", "Chennai", "Hyderabad", "Pune", "Mumbai", "Delhi", "Kochi"]
+
+
+# Row counts per table for a scale (the size of the two largest tables, Orders and Sales)
+def table_sizes(scale):
+    drugs = max(100, scale // 100)
+    return {
+        "Customer": max(100, scale // 10),
+        "Manager": max(5, scale // 200_000),
+        "Drugs": drugs,
+        "Supplier": max(20, drugs // 50),
+        "Orders": scale,
+        "Sales": scale,
+    }
+
+
+def _next_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+    return cursor.fetchone()[0] + 1
+
+
+# Deterministically populate every table; the same seed and scale always produce the same rows
+def generate(conn, scale, seed=42, start_date=datetime.date(2024, 1, 1), days=730, batch_size=500, log=print):
+    sizes = table_sizes(scale)
+    cursor = conn.cursor()
+    first = {
+        "Customer": _next_id(cursor, "Customer", "C_ID"),
+        "Manager": _next_id(cursor, "Manager", "M_ID"),
+        "Drugs": _next_id(cursor, "Drugs", "D_ID"),
+        "Supplier": _next_id(cursor, "Supplier", "S_ID"),
+        "Orders": _next_id(cursor, "Orders", "Order_ID"),
+        "Sales": _next_id(cursor, "Sales", "Sale_ID"),
+    }
+    customers = range(first["Customer"], first["Customer"] + sizes["Customer"])
+    managers = range(first["Manager"], first["Manager"] + sizes["Manager"])
+    drugs = range(first["Drugs"], first["Drugs"] + sizes["Drugs"])
+    suppliers = range(first["Supplier"], first["Supplier"] + sizes["Supplier"])
+    drug_names = {}
+    counts = {}
+
+    # Each table gets its own generator so its rows do not depend on the other tables
+    def rng_for(table):
+        return random.Random(f"{seed}:{table}")
+
+    def load(table, columns, rows):
+        start = time.perf_counter()
+        counts[table] = bulk_insert(cursor, table, columns, rows, batch_size)
+        conn.commit()
+        log(f"{table:>14}: {counts[table]:>10} rows in {time.perf_counter() - start:.1f}s")
+
+    def customer_rows():
+        rng = rng_for("Customer")
+        for i, c_id in enumerate(customers):
+            yield (c_id, f"Customer {i}", rng.randint(18, 90), rng.choice(["Male", "Female", "Other"]),
+                   f"{rng.randint(1, 999)} Main Road, {rng.choice(CITIES)}", f"Pwd{i}!x", f"user{i}@example.com")
+
+    def phone_rows():
+        rng = rng_for("CustomerPhone")
+        for c_id in customers:
+            for n in range(rng.choice([0, 1, 1, 2])):
+                yield (c_id, f"{6 + n}{c_id % 10**9:09d}")
+
+    def manager_rows():
+        for i, m_id in enumerate(managers):
+            yield (m_id, f"Manager {i}", f"8{m_id % 10**9:09d}", f"Mgr{i}!pass")
+
+    def drug_rows():
+        rng = rng_for("Drugs")
+        for i, d_id in enumerate(drugs):
+            name = f"{rng.choice(DRUG_STEMS)}{rng.choice(DRUG_SUFFIXES)} {i}"
+            drug_names[d_id] = name
+            mnf = start_date - datetime.timedelta(days=rng.randint(0, 365))
+            expiry = mnf + datetime.timedelta(days=rng.randint(180, 1460))
+            yield (d_id, name, mnf, expiry, rng.choice(USES), None)
+
+    def supplier_rows():
+        rng = rng_for("Supplier")
+        for i, s_id in enumerate(suppliers):
+            yield (s_id, f"Supplier {i}", f"{rng.randint(1, 999)} Industrial Area, {rng.choice(CITIES)}",
+                   f"7{s_id % 10**9:09d}", rng.choice(managers))
+
+    def inventory_rows():
+        rng = rng_for("Inventory")
+        for d_id in drugs:
+            for m_id in rng.sample(managers, min(len(managers), 3)):
+                yield (rng.randint(0, 500), d_id, m_id)
+
+    def batch_rows():
+        # Replays the Inventory generator and splits each store's stock into up to three lots expiring after
+        # the generated history
+        inventory_rng = rng_for("Inventory")
+        rng = rng_for("InventoryBatch")
+        history_end = start_date + datetime.timedelta(days=days)
+        for d_id in drugs:
+            for m_id in inventory_rng.sample(managers, min(len(managers), 3)):
+                qty = inventory_rng.randint(0, 500)
+                lots = rng.randint(1, 3)
+                for lot in range(lots):
+                    lot_qty = qty // lots + (qty % lots if lot == 0 else 0)
+                    if lot_qty:
+                        expiry = history_end + datetime.timedelta(days=rng.randint(90, 1460))
+                        yield (d_id, m_id, expiry, lot_qty)
+
+    def supplies_rows():
+        rng = rng_for("Supplies")
+        for d_id in drugs:
+            for s_id in rng.sample(suppliers, min(len(suppliers), 2)):
+                yield (d_id, s_id, rng.randint(50, 5000))
+
+    def sale_item_rows():
+        rng = rng_for("Sale_Item")
+        for d_id in drugs:
+            s_id = rng.choice(suppliers)
+            qty = rng.randint(1, 2000)
+            yield (d_id, s_id, qty, round(qty * rng.uniform(1, 50), 2))
+
+    def order_rows():
+        rng = rng_for("Orders")
+        for order_id in range(first["Orders"], first["Orders"] + sizes["Orders"]):
+            name = drug_names[rng.choice(drugs)]
+            yield (order_id, rng.choice(customers), rng.randint(1, 5), f"Order for {name}", name)
+
+    def event_rows():
+        # Replays the Orders generator so every generated order also gets a dated stock movement
+        orders_rng = rng_for("Orders")
+        rng = rng_for("InventoryEvent")
+        for _ in range(sizes["Orders"]):
+            d_id = orders_rng.choice(drugs)
+            orders_rng.choice(customers)
+            qty = orders_rng.randint(1, 5)
+            day = start_date + datetime.timedelta(days=rng.randrange(days))
+            created = datetime.datetime.combine(day, datetime.time(rng.randint(8, 21), rng.randint(0, 59)))
+            yield (d_id, rng.choice(managers), -qty, rng.randint(0, 500), "order", created)
+
+    def sale_rows():
+        rng = rng_for("Sales")
+        for sale_id in range(first["Sales"], first["Sales"] + sizes["Sales"]):
+            day = start_date + datetime.timedelta(days=rng.randrange(days))
+            moment = datetime.time(rng.randint(8, 21), rng.randint(0, 59), rng.randint(0, 59))
+            yield (sale_id, round(rng.uniform(20, 5000), 2), day, moment.strftime("%H:%M:%S"), rng.choice(managers))
+
+    load("Customer", ["C_ID", "C_name", "Age", "Sex", "Address", "Pwd", "EmailID"], customer_rows())
+    load("CustomerPhone", ["C_ID", "Ph_no"], phone_rows())
+    load("Manager", ["M_ID", "M_name", "Ph_no", "M_pwd"], manager_rows())
+    load("Drugs", ["D_ID", "D_name", "Mnf_date", "Expiry_date", "D_use", "C_ID"], drug_rows())
+    load("Supplier", ["S_ID", "S_name", "S_address", "S_phone", "M_ID"], supplier_rows())
+    load("Inventory", ["Rem_qty", "D_ID", "M_ID"], inventory_rows())
+    load("InventoryBatch", ["D_ID", "M_ID", "Expiry_date", "Qty"], batch_rows())
+    load("Supplies", ["D_ID", "S_ID", "Qty"], supplies_rows())
+    load("Sale_Item", ["D_ID", "S_ID", "Sale_qty", "Total_price"], sale_item_rows())
+    load("Orders", ["Order_ID", "C_ID", "Qty", "Name", "Item"], order_rows())
+    load("InventoryEvent", ["D_ID", "M_ID", "Delta", "Rem_qty", "Reason", "Created_at"], event_rows())
+    load("Sales", ["Sale_ID", "Total_amt", "Date", "Time", "M_ID"], sale_rows())
+
+    cursor.execute("ANALYZE" if conn.backend == "sqlite" else
+                   "ANALYZE TABLE Customer, CustomerPhone, Manager, Drugs, Supplier, Inventory, InventoryBatch, "
+                   "Supplies, Sale_Item, Orders, InventoryEvent, Sales")
+    if conn.backend == "mysql":
+        cursor.fetchall()
+    cursor.close()
+    return counts
+
+
+def sqlite_config(path):
+    config = db_pool.db_config_from_env()
+    config.update(backend="sqlite", sqlite_path=path)
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Populate the pharmacy schema with deterministic synthetic data")
+    parser.add_argument("--scale", type=int, default=10_000, help="Rows in Orders and Sales (10k to 10M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per multi-row INSERT")
+    parser.add_argument("--sqlite", metavar="PATH", help="Write to this SQLite file instead of the PHARMACY_DB_* database")
+    args = parser.parse_args()
+
+    pool = db_pool.ConnectionPool(sqlite_config(args.sqlite) if args.sqlite else db_pool.db_config_from_env())
+    with pool.get_connection() as conn:
+        apply_migrations(conn)
+        started = time.perf_counter()
+        counts = generate(conn, args.scale, seed=args.seed, batch_size=args.batch_size)
+    pool.close_all()
+    print(f"Inserted {sum(counts.values())} rows in {time.perf_counter() - started:.1f}s")
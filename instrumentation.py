@@ -0,0 +1,301 @@
+import functools
+import os
+import threading
+import time
+
+import db_pool
+import reference_cache
+
+# Upper bounds (seconds) of the latency histogram buckets in the exported metrics
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SPANS_PER_RERUN = 500
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Count, sum and bucket counts of one latency series
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds, error=False):
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+# Spans recorded during one Streamlit rerun (one run of the script for one session)
+class RerunTrace:
+    def __init__(self, label=None):
+        self.label = label
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.spans = []  # (name, start offset ms, duration ms, depth, error)
+        self.dropped = 0
+        self.depth = 0
+
+    def offset_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    # {span name: (calls, total ms)}, slowest first
+    def totals(self):
+        totals = {}
+        for name, _, duration, _, _ in self.spans:
+            calls, total = totals.get(name, (0, 0.0))
+            totals[name] = (calls + 1, total + duration)
+        return dict(sorted(totals.items(), key=lambda item: -item[1][1]))
+
+
+# Records timed spans around the app's slow paths. Spans go into the current thread's rerun trace (Streamlit
+# runs each session's script on its own thread) and into process-wide histograms that are exported in the
+# Prometheus text format. `enabled` is the default; a rerun may switch recording on or off for its own thread.
+# While disabled, traced functions cost one attribute check per call.
+class Instrumentation:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._spans = {}  # span name -> Histogram
+        self._reruns = {}  # rerun label -> Histogram
+        self._exporter = None
+        self._server = None
+
+    # Start the current thread's trace; `enabled` (None for the default) applies until end_rerun
+    def begin_rerun(self, label=None, enabled=None):
+        self._local.enabled = enabled
+        self._local.trace = RerunTrace(label) if self.active() else None
+
+    # Whether calls on the current thread are recorded
+    def active(self):
+        enabled = getattr(self._local, "enabled", None)
+        return self.enabled if enabled is None else enabled
+
+    def set_label(self, label):
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.label = label
+
+    # Finish the current thread's trace and return it (None when disabled)
+    def end_rerun(self):
+        trace = getattr(self._local, "trace", None)
+        self._local.trace = None
+        self._local.enabled = None
+        if trace is None:
+            return None
+        trace.duration = trace.offset_ms()
+        with self._lock:
+            self._reruns.setdefault(trace.label or "unknown", Histogram()).observe(trace.duration / 1000)
+        return trace
+
+    def record(self, name, seconds, error=False, start_ms=None, depth=0):
+        with self._lock:
+            self._spans.setdefault(name, Histogram()).observe(seconds, error)
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            if len(trace.spans) < MAX_SPANS_PER_RERUN:
+                trace.spans.append((name, round(start_ms, 3), round(seconds * 1000, 3), depth, error))
+            else:
+                trace.dropped += 1
+
+    # Time a block: `with get_instrumentation().span("openfda"):`
+    def span(self, name):
+        return _Span(self, name)
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            series = [("pharmacy_span_seconds", "Time spent in instrumented calls", "span", self._spans),
+                      ("pharmacy_rerun_seconds", "Duration of Streamlit reruns by page", "page", self._reruns)]
+            for metric, help_text, label, histograms in series:
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for key, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.buckets):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{label}="{_escape(key)}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{{label}="{_escape(key)}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{{label}="{_escape(key)}"}} {histogram.total:.6f}')
+                    lines.append(f'{metric}_count{{{label}="{_escape(key)}"}} {histogram.count}')
+            lines += ["# HELP pharmacy_span_errors_total Instrumented calls that raised",
+                      "# TYPE pharmacy_span_errors_total counter"]
+            lines += [f'pharmacy_span_errors_total{{span="{_escape(name)}"}} {histogram.errors}'
+                      for name, histogram in sorted(self._spans.items())]
+        for pool, metrics in sorted(db_pool.pool_metrics().items()):
+            for key, value in sorted(metrics.items()):
+                lines.append(f'pharmacy_db_pool_{key}{{pool="{_escape(pool)}"}} {value}')
+        for dataset, metrics in sorted(reference_cache.reference_cache_metrics().items()):
+            for key, value in sorted(metrics.items()):
+                lines.append(f'pharmacy_reference_cache_{key}{{dataset="{_escape(dataset)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    # Rewrite the metrics file every `interval` seconds from a daemon thread
+    def start_file_export(self, path, interval=15):
+        if self._exporter is not None:
+            return
+
+        def export():
+            while True:
+                try:
+                    self.write_metrics(path)
+                except OSError as e:
+                    print(f"Could not write metrics to {path}: {e}")
+                time.sleep(interval)
+
+        self._exporter = threading.Thread(target=export, name="metrics-export", daemon=True)
+        self._exporter.start()
+
+    # Serve the metrics at http://host:port/metrics from a daemon thread
+    def start_http_export(self, port, host="127.0.0.1"):
+        import http.server
+        if self._server is not None:
+            return
+        instrumentation = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = instrumentation.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+class _Span:
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        if not self._instrumentation.active():
+            self._start = None
+            return self
+        trace = getattr(self._instrumentation._local, "trace", None)
+        self._trace = trace
+        self._start_ms = trace.offset_ms() if trace is not None else 0.0
+        self._depth = trace.depth if trace is not None else 0
+        if trace is not None:
+            trace.depth += 1
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is None:
+            return
+        elapsed = time.perf_counter() - self._start
+        if self._trace is not None:
+            self._trace.depth -= 1
+        self._instrumentation.record(self._name, elapsed, exc_type is not None, self._start_ms, self._depth)
+
+
+# Decorator recording every call of the function as a span named `name`
+def traced(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            instrumentation = get_instrumentation()
+            if not instrumentation.active():
+                return fn(*args, **kwargs)
+            with instrumentation.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Cursor wrapper that records each statement as a "db.execute" span
+class TracedCursor:
+    def __init__(self, cursor, instrumentation):
+        self._cursor = cursor
+        self._instrumentation = instrumentation
+
+    def execute(self, *args, **kwargs):
+        with self._instrumentation.span("db.execute"):
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with self._instrumentation.span("db.execute"):
+            return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+# Pooled connection wrapper whose cursors are traced; commits and rollbacks are spans too
+class TracedConnection:
+    def __init__(self, conn, instrumentation):
+        self._conn = conn
+        self._instrumentation = instrumentation
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._conn.cursor(*args, **kwargs), self._instrumentation)
+
+    def commit(self):
+        with self._instrumentation.span("db.commit"):
+            return self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._conn.close()
+
+
+# The connection itself while disabled, otherwise one that records its statements
+def traced_connection(conn):
+    instrumentation = get_instrumentation()
+    return TracedConnection(conn, instrumentation) if instrumentation.active() else conn
+
+
+def instrumentation_from_env():
+    env = os.environ
+    instrumentation = Instrumentation(enabled=env.get("PHARMACY_INSTRUMENTATION", "0") == "1")
+    if env.get("PHARMACY_METRICS_FILE"):
+        instrumentation.start_file_export(env["PHARMACY_METRICS_FILE"],
+                                          float(env.get("PHARMACY_METRICS_INTERVAL", "15")))
+    if env.get("PHARMACY_METRICS_PORT"):
+        instrumentation.start_http_export(int(env["PHARMACY_METRICS_PORT"]))
+    return instrumentation
+
+
+_instrumentation = None
+_instrumentation_lock = threading.Lock()
+
+
+def get_instrumentation():
+    global _instrumentation
+    if _instrumentation is None:
+        with _instrumentation_lock:
+            if _instrumentation is None:
+                _instrumentation = instrumentation_from_env()
+    return _instrumentation
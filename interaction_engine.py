@@ -0,0 +1,218 @@
+import argparse
+import csv
+import itertools
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+import db_pool
+from drug_interactions import get_interaction_service, normalize_drug_name
+
+Interaction = namedtuple("Interaction", ["drug_a", "drug_b", "severity", "description", "source"])
+
+
+def pair_key(drug_a, drug_b):
+    a, b = normalize_drug_name(drug_a), normalize_drug_name(drug_b)
+    return (a, b) if a <= b else (b, a)
+
+
+# Interaction pairs persisted in a local SQLite file and mirrored in a dict for O(1) pair lookups
+class InteractionIndex:
+    def __init__(self, path):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS interactions (
+                drug_a TEXT NOT NULL,
+                drug_b TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                description TEXT,
+                source TEXT,
+                PRIMARY KEY (drug_a, drug_b)
+            );
+            CREATE TABLE IF NOT EXISTS imported_labels (
+                set_id TEXT PRIMARY KEY,
+                version TEXT
+            );
+            """
+        )
+        self._pairs = {}
+        for drug_a, drug_b, severity, description, source in self._conn.execute(
+            "SELECT drug_a, drug_b, severity, description, source FROM interactions"
+        ):
+            self._pairs[(drug_a, drug_b)] = Interaction(drug_a, drug_b, severity, description, source)
+        self._drug_names = {}  # D_ID -> normalized name, loaded from Drugs on first use and when an ID is missing
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def _names_by_id(self, reload=False):
+        if reload or not self._drug_names:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT D_ID, D_name FROM Drugs")
+                self._drug_names = {d_id: normalize_drug_name(name) for d_id, name in cursor.fetchall()}
+                cursor.close()
+        return self._drug_names
+
+    # Accepts drug names or D_IDs and returns normalized names. An unknown ID reloads the names once per call,
+    # for drugs added since they were loaded.
+    def resolve(self, drugs):
+        names = []
+        reloaded = False
+        for drug in drugs:
+            if isinstance(drug, int):
+                name = self._names_by_id().get(drug)
+                if name is None and not reloaded:
+                    reloaded = True
+                    name = self._names_by_id(reload=True).get(drug)
+                if name is None:
+                    continue
+                names.append(name)
+            else:
+                names.append(normalize_drug_name(drug))
+        return list(dict.fromkeys(names))
+
+    # Every known interaction between any two drugs of the basket
+    def check_basket(self, drugs):
+        names = self.resolve(drugs)
+        pairs = self._pairs
+        found = []
+        for drug_a, drug_b in itertools.combinations(names, 2):
+            interaction = pairs.get((drug_a, drug_b) if drug_a <= drug_b else (drug_b, drug_a))
+            if interaction is not None:
+                found.append(interaction)
+        return found
+
+    # Interactions between new items and each other or anything the customer has ordered before, at any store
+    def check_customer(self, customer_id, new_drugs):
+        from stores import get_store_registry
+
+        def ordered(conn, group):
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT Item FROM Orders WHERE C_ID = %s", (customer_id,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        history = self.resolve(row[0] for row in get_store_registry().fan_out(ordered).rows if row[0])
+        new_names = self.resolve(new_drugs)
+        pairs = self._pairs
+        found = {}
+        for new_name in new_names:
+            for other in itertools.chain(new_names, history):
+                if other == new_name:
+                    continue
+                key = (new_name, other) if new_name <= other else (other, new_name)
+                if key in pairs:
+                    found[key] = pairs[key]
+        return list(found.values())
+
+    def add_interactions(self, interactions):
+        rows = []
+        for drug_a, drug_b, severity, description, source in interactions:
+            drug_a, drug_b = pair_key(drug_a, drug_b)
+            if drug_a == drug_b:
+                continue
+            rows.append((drug_a, drug_b, severity, description, source))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO interactions (drug_a, drug_b, severity, description, source) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            for row in rows:
+                self._pairs[(row[0], row[1])] = Interaction(*row)
+        return len(rows)
+
+    # CSV with drug_a, drug_b, severity, description columns
+    def import_csv(self, path, source=None):
+        source = source or os.path.basename(path)
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = [
+                (row["drug_a"], row["drug_b"], row.get("severity") or "unknown", row.get("description"), source)
+                for row in csv.DictReader(f)
+            ]
+        return self.add_interactions(rows)
+
+    # Derive pairs from the drug_interactions section of an openFDA label; each label version is imported once
+    def import_label(self, drug_name, label):
+        sections = label.get("drug_interactions")
+        if not sections:
+            return 0
+        set_id, version = label.get("set_id"), str(label.get("version"))
+        with self._lock:
+            if set_id:
+                row = self._conn.execute("SELECT version FROM imported_labels WHERE set_id = ?", (set_id,)).fetchone()
+                if row and row[0] == version:
+                    return 0
+
+            known = set(self._names_by_id().values()) | {name for pair in self._pairs for name in pair}
+            drug = normalize_drug_name(drug_name)
+            known.discard(drug)
+            rows = []
+            if known:
+                alternatives = "|".join(re.escape(name) for name in sorted(known, key=len, reverse=True))
+                pattern = re.compile(rf"\b({alternatives})\b")
+                for section in sections:
+                    for sentence in re.split(r"(?<=\.)\s+", section):
+                        for other in set(pattern.findall(sentence.lower())):
+                            # Curated pairs (e.g. from CSV imports) take precedence over label text
+                            if pair_key(drug, other) not in self._pairs:
+                                rows.append((drug, other, "label", sentence.strip(), f"openfda:{set_id or drug}"))
+            added = self.add_interactions(rows)
+            if set_id:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO imported_labels (set_id, version) VALUES (?, ?)", (set_id, version)
+                )
+                self._conn.commit()
+        return added
+
+
+def format_interaction(interaction):
+    return f"⚠ *{interaction.drug_a.title()} + {interaction.drug_b.title()}* ({interaction.severity}): {interaction.description}"
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_interaction_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = InteractionIndex(os.environ.get("PHARMACY_INTERACTION_INDEX", "interaction_index.db"))
+            # Labels fetched by the openFDA lookup service feed the index as they arrive
+            get_interaction_service().label_listeners.append(_index.import_label)
+        return _index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local drug interaction index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_csv = commands.add_parser("import-csv", help="Import interaction pairs from a CSV file")
+    import_csv.add_argument("path")
+    commands.add_parser("import-labels", help="Import openFDA labels for every drug in the Drugs table")
+    check = commands.add_parser("check", help="Check a basket of drug names")
+    check.add_argument("drugs", nargs="+")
+    args = parser.parse_args()
+
+    index = get_interaction_index()
+    if args.command == "import-csv":
+        print(f"Imported {index.import_csv(args.path)} interactions.")
+    elif args.command == "import-labels":
+        service = get_interaction_service()
+        added = 0
+        for name in sorted(set(index._names_by_id().values())):
+            try:
+                added += index.import_label(name, service.get_label(name))
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
+        print(f"Imported {added} interactions.")
+    else:
+        for interaction in index.check_basket(args.drugs):
+            print(format_interaction(interaction))
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+
+import db_pool
+import inventory_feed
+from db_pool import upsert_sql
+
+EXPIRING_COLUMNS = ("InventoryBatch.Batch_ID, InventoryBatch.D_ID, Drugs.D_name, InventoryBatch.M_ID, "
+                    "InventoryBatch.Expiry_date, InventoryBatch.Qty")
+
+
+class ExpiredStockError(Exception):
+    def __init__(self, drug_id, manager_id, quantity):
+        super().__init__(f"Only expired stock left for drug {drug_id} in store {manager_id} (requested {quantity})")
+        self.drug_id = drug_id
+        self.manager_id = manager_id
+        self.quantity = quantity
+
+
+# Take `quantity` units of a drug in a store from its unexpired batches, first-expiring first, inside the
+# caller's open transaction. Each step is an index seek on (D_ID, M_ID, Expiry_date), so the cost does not
+# grow with the number of lots. Returns [(Batch_ID, units taken), ...].
+def allocate_fefo(conn, cursor, drug_id, manager_id, quantity, today=None, fetch=8):
+    today = today or datetime.date.today()
+    lock = " FOR UPDATE" if conn.backend == "mysql" else ""
+    taken = []
+    remaining = quantity
+    after = (today, 0)
+    while remaining > 0:
+        cursor.execute(
+            "SELECT Batch_ID, Expiry_date, Qty FROM InventoryBatch WHERE D_ID = %s AND M_ID = %s AND Qty > 0 "
+            "AND (Expiry_date > %s OR (Expiry_date = %s AND Batch_ID > %s)) "
+            "ORDER BY Expiry_date, Batch_ID LIMIT %s" + lock,
+            (drug_id, manager_id, after[0], after[0], after[1], fetch),
+        )
+        batches = cursor.fetchall()
+        if not batches:
+            raise ExpiredStockError(drug_id, manager_id, quantity)
+        for batch_id, expiry_date, qty in batches:
+            units = min(qty, remaining)
+            cursor.execute("UPDATE InventoryBatch SET Qty = Qty - %s WHERE Batch_ID = %s AND Qty >= %s",
+                           (units, batch_id, units))
+            if cursor.rowcount != 1:
+                raise ExpiredStockError(drug_id, manager_id, quantity)
+            taken.append((batch_id, units))
+            remaining -= units
+            if remaining == 0:
+                break
+        after = batches[-1][1], batches[-1][0]
+    return taken
+
+
+# Record a received lot inside the caller's open transaction; the expiry defaults to the drug's Expiry_date
+def add_batch(cursor, drug_id, manager_id, quantity, expiry_date=None, received_at=None):
+    if expiry_date is None:
+        cursor.execute("SELECT COALESCE(Expiry_date, '9999-12-31') FROM Drugs WHERE D_ID = %s", (drug_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Unknown drug {drug_id}")
+        expiry_date = row[0]
+    received_at = received_at or datetime.datetime.now().replace(microsecond=0)
+    cursor.execute("INSERT INTO InventoryBatch (D_ID, M_ID, Expiry_date, Qty, Received_at) VALUES (%s, %s, %s, %s, %s)",
+                   (drug_id, manager_id, expiry_date, quantity, received_at))
+    return cursor.lastrowid
+
+
+# Receive a lot into a store (creating the Inventory row if needed) and record the movement; returns the new Rem_qty
+def restock(conn, drug_id, manager_id, quantity, expiry_date=None, reason="restock"):
+    if quantity <= 0:
+        raise ValueError("Restock quantity must be positive")
+    conn.begin()
+    cursor = conn.cursor()
+    try:
+        add_batch(cursor, drug_id, manager_id, quantity, expiry_date)
+        cursor.execute(upsert_sql(conn.backend, "Inventory", ["Rem_qty", "D_ID", "M_ID"], ["D_ID", "M_ID"],
+                                  increment=("Rem_qty",)), (quantity, drug_id, manager_id))
+        cursor.execute("SELECT Rem_qty FROM Inventory WHERE D_ID = %s AND M_ID = %s", (drug_id, manager_id))
+        rem_qty = cursor.fetchone()[0]
+        inventory_feed.record_events(cursor, [(drug_id, manager_id, quantity, rem_qty, reason)])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    inventory_feed.notify()
+    return rem_qty
+
+
+# Batches with stock left that expire on or before today + days (already expired ones included), soonest
+# first. Reads only the matching range of the expiry index.
+def expiring_within(conn, days, manager_id=None, today=None, limit=500):
+    cutoff = (today or datetime.date.today()) + datetime.timedelta(days=days)
+    query = (f"SELECT {EXPIRING_COLUMNS} FROM InventoryBatch JOIN Drugs ON InventoryBatch.D_ID = Drugs.D_ID "
+             "WHERE InventoryBatch.Expiry_date <= %s AND InventoryBatch.Qty > 0")
+    params = [cutoff]
+    if manager_id is not None:
+        query += " AND InventoryBatch.M_ID = %s"
+        params.append(manager_id)
+    cursor = conn.cursor()
+    cursor.execute(query + " ORDER BY InventoryBatch.Expiry_date, InventoryBatch.Batch_ID LIMIT %s", params + [limit])
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+# Expiring batches nobody has been alerted about yet: (Batch_ID, D_ID, D_name, M_ID, Expiry_date, Qty)
+def unalerted_expiring(cursor, days, today=None, limit=1000):
+    cutoff = (today or datetime.date.today()) + datetime.timedelta(days=days)
+    cursor.execute(
+        f"SELECT {EXPIRING_COLUMNS} FROM InventoryBatch JOIN Drugs ON InventoryBatch.D_ID = Drugs.D_ID "
+        "LEFT JOIN ExpiryAlertLog ON InventoryBatch.Batch_ID = ExpiryAlertLog.Batch_ID "
+        "WHERE InventoryBatch.Expiry_date <= %s AND InventoryBatch.Qty > 0 AND ExpiryAlertLog.Batch_ID IS NULL "
+        "ORDER BY InventoryBatch.Expiry_date LIMIT %s",
+        (cutoff, limit),
+    )
+    return cursor.fetchall()
+
+
+# Remove expired units from stock (optionally for one store); returns the number of units written off
+def write_off_expired(conn, manager_id=None, today=None):
+    today = today or datetime.date.today()
+    conn.begin()
+    cursor = conn.cursor()
+    try:
+        lock = " FOR UPDATE" if conn.backend == "mysql" else ""
+        query = "SELECT Batch_ID, D_ID, M_ID, Qty FROM InventoryBatch WHERE Expiry_date < %s AND Qty > 0"
+        params = [today]
+        if manager_id is not None:
+            query += " AND M_ID = %s"
+            params.append(manager_id)
+        cursor.execute(query + " ORDER BY D_ID, M_ID" + lock, params)
+        expired = cursor.fetchall()
+
+        totals = {}
+        for batch_id, d_id, m_id, qty in expired:
+            totals[(d_id, m_id)] = totals.get((d_id, m_id), 0) + qty
+        cursor.executemany("UPDATE InventoryBatch SET Qty = 0 WHERE Batch_ID = %s", [(row[0],) for row in expired])
+        events = []
+        for (d_id, m_id), qty in totals.items():
+            cursor.execute("UPDATE Inventory SET Rem_qty = GREATEST(Rem_qty - %s, 0) WHERE D_ID = %s AND M_ID = %s"
+                           if conn.backend == "mysql" else
+                           "UPDATE Inventory SET Rem_qty = MAX(Rem_qty - %s, 0) WHERE D_ID = %s AND M_ID = %s",
+                           (qty, d_id, m_id))
+            cursor.execute("SELECT Rem_qty FROM Inventory WHERE D_ID = %s AND M_ID = %s", (d_id, m_id))
+            row = cursor.fetchone()
+            events.append((d_id, m_id, -qty, row[0] if row else 0, "expired"))
+        if events:
+            inventory_feed.record_events(cursor, events)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    if events:
+        inventory_feed.notify()
+    return sum(totals.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List expiring stock or write off expired batches")
+    parser.add_argument("--days", type=int, default=30, help="List batches expiring within this many days")
+    parser.add_argument("--store", type=int, help="Only this store (M_ID)")
+    parser.add_argument("--write-off", action="store_true", help="Remove expired units from stock")
+    args = parser.parse_args()
+
+    with db_pool.connection() as conn:
+        if args.write_off:
+            print(f"Wrote off {write_off_expired(conn, args.store)} expired units.")
+        for batch_id, d_id, d_name, m_id, expiry_date, qty in expiring_within(conn, args.days, args.store):
+            print(f"{expiry_date}  batch {batch_id:>8}  store {m_id:>4}  {qty:>6} x {d_name} (drug {d_id})")
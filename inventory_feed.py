@@ -0,0 +1,122 @@
+import argparse
+import datetime
+from collections import namedtuple
+
+import db_pool
+from db_pool import upsert_sql
+
+InventoryEvent = namedtuple("InventoryEvent", ["Event_ID", "D_ID", "M_ID", "Delta", "Rem_qty", "Reason", "Created_at"])
+EVENT_COLUMNS = "Event_ID, D_ID, M_ID, Delta, Rem_qty, Reason, Created_at"
+
+# MySQL hands out AUTO_INCREMENT ids at insert time, so a transaction that commits late can add an event
+# below ids a consumer has already passed. Consumers only read events at least this many seconds old.
+MYSQL_SETTLE_SECONDS = 2.0
+
+listeners = []  # called with no arguments after a transaction that recorded events commits
+
+
+# Append (D_ID, M_ID, Delta, Rem_qty, Reason) events inside the caller's open transaction
+def record_events(cursor, events, created_at=None):
+    created_at = created_at or datetime.datetime.now().replace(microsecond=0)
+    cursor.executemany(
+        "INSERT INTO InventoryEvent (D_ID, M_ID, Delta, Rem_qty, Reason, Created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+        [tuple(event) + (created_at,) for event in events],
+    )
+
+
+# Wake in-process consumers once the events are committed
+def notify():
+    for listener in list(listeners):
+        try:
+            listener()
+        except Exception as e:
+            print(f"Inventory feed listener failed: {e}")
+
+
+def latest_event_id(cursor):
+    cursor.execute("SELECT COALESCE(MAX(Event_ID), 0) FROM InventoryEvent")
+    return cursor.fetchone()[0]
+
+
+def read_events(cursor, after_id, limit=1000, settle=0.0):
+    query = f"SELECT {EVENT_COLUMNS} FROM InventoryEvent WHERE Event_ID > %s"
+    params = [after_id]
+    if settle:
+        query += " AND Created_at <= %s"
+        params.append((datetime.datetime.now() - datetime.timedelta(seconds=settle)).replace(microsecond=0))
+    cursor.execute(query + " ORDER BY Event_ID LIMIT %s", params + [limit])
+    return [InventoryEvent(*row) for row in cursor.fetchall()]
+
+
+# Newest stock movements first, optionally for one store (the audit view on the inventory page)
+def recent_events(conn, manager_id=None, limit=50):
+    cursor = conn.cursor()
+    if manager_id is None:
+        cursor.execute(f"SELECT {EVENT_COLUMNS} FROM InventoryEvent ORDER BY Event_ID DESC LIMIT %s", (limit,))
+    else:
+        cursor.execute(f"SELECT {EVENT_COLUMNS} FROM InventoryEvent WHERE M_ID = %s "
+                       "ORDER BY Event_ID DESC LIMIT %s", (manager_id, limit))
+    events = [InventoryEvent(*row) for row in cursor.fetchall()]
+    cursor.close()
+    return events
+
+
+# Last Event_ID the consumer has processed, or None if it has never run
+def consumer_offset(cursor, name):
+    cursor.execute("SELECT Last_ID FROM EventConsumer WHERE Name = %s", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_consumer_offset(conn, cursor, name, last_id):
+    cursor.execute(upsert_sql(conn.backend, "EventConsumer", ["Name", "Last_ID"], ["Name"]), (name, last_id))
+
+
+# Pass new events to handler(events) in batches. Each batch's offset is committed together with whatever the
+# handler wrote, so a crash re-delivers at most the batch in progress. Returns the number of events handled.
+def consume(conn, name, handler, batch_size=1000):
+    settle = MYSQL_SETTLE_SECONDS if conn.backend == "mysql" else 0.0
+    cursor = conn.cursor()
+    handled = 0
+    try:
+        offset = consumer_offset(cursor, name) or 0
+        while True:
+            events = read_events(cursor, offset, batch_size, settle)
+            if not events:
+                break
+            handler(events)
+            offset = events[-1].Event_ID
+            set_consumer_offset(conn, cursor, name, offset)
+            conn.commit()
+            handled += len(events)
+        conn.rollback()
+        return handled
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Make a consumer re-read the feed from after `from_id` (0 replays the whole history)
+def replay(conn, name, from_id=0):
+    cursor = conn.cursor()
+    set_consumer_offset(conn, cursor, name, from_id)
+    conn.commit()
+    cursor.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or rewind the inventory change feed")
+    parser.add_argument("--tail", type=int, metavar="N", help="Print the newest N events")
+    parser.add_argument("--replay", metavar="CONSUMER", help="Make a consumer re-read the feed")
+    parser.add_argument("--from-id", type=int, default=0, help="Event_ID to replay after (default: everything)")
+    args = parser.parse_args()
+
+    with db_pool.connection() as conn:
+        if args.replay:
+            replay(conn, args.replay, args.from_id)
+            print(f"{args.replay} will re-read events after {args.from_id}.")
+        for event in reversed(recent_events(conn, limit=args.tail or 0)):
+            print(f"{event.Event_ID:>8} {event.Created_at} drug {event.D_ID} store {event.M_ID} "
+                  f"{event.Delta:+d} -> {event.Rem_qty} ({event.Reason})")
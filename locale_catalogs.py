@@ -0,0 +1,121 @@
+import argparse
+import functools
+import json
+import os
+import threading
+
+from translation_cache import (
+    SOURCE_LANGUAGE,
+    TRANSLATOR_BACKENDS,
+    TranslationCache,
+    TranslationStore,
+    extract_static_strings,
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CATALOG_DIR = os.environ.get("PHARMACY_LOCALE_DIR", os.path.join(BASE_DIR, "locales"))
+APP_SOURCE = os.path.join(BASE_DIR, "pharma_app.py")
+
+# Language options
+LANGUAGES = {
+    'English': 'en',
+    'Spanish': 'es',
+    'French': 'fr',
+    'German': 'de',
+    'Chinese': 'zh-cn',
+    'Kannada': 'kn',
+    'Hindi': 'hi',
+    'Tamil': 'ta',
+    'Telugu': 'te',
+}
+
+
+def catalog_path(lang, catalog_dir=CATALOG_DIR):
+    return os.path.join(catalog_dir, f"{lang}.json")
+
+
+# Load a language catalog the first time it is needed; missing catalogs load as empty
+@functools.lru_cache(maxsize=None)
+def load_catalog(lang, catalog_dir=CATALOG_DIR):
+    try:
+        with open(catalog_path(lang, catalog_dir), encoding="utf-8") as f:
+            return json.load(f)["strings"]
+    except FileNotFoundError:
+        return {}
+
+
+# Catalog lookup that never touches the network; None means the text is not in the catalog
+def lookup(text, lang, catalog_dir=CATALOG_DIR):
+    if lang == SOURCE_LANGUAGE:
+        return text
+    return load_catalog(lang, catalog_dir).get(text)
+
+
+def missing_strings(texts, lang, catalog_dir=CATALOG_DIR):
+    catalog = load_catalog(lang, catalog_dir)
+    return [text for text in texts if text not in catalog]
+
+
+# Write the catalog of one language (only the given strings, so removed literals drop out)
+def write_catalog(lang, strings, translations, catalog_dir=CATALOG_DIR):
+    os.makedirs(catalog_dir, exist_ok=True)
+    catalog = {"lang": lang, "strings": {text: translations[text] for text in strings}}
+    # Per-process temporary name: several app processes may build the same catalog at once
+    tmp_path = f"{catalog_path(lang, catalog_dir)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp_path, catalog_path(lang, catalog_dir))
+    load_catalog.cache_clear()
+
+
+_built = set()  # (lang, catalog_dir) checked by ensure_catalog in this process
+_built_lock = threading.Lock()
+
+
+# Bring a language's catalog up to date with the app's strings, once per process: strings missing from it are
+# translated through the translation cache in one batch and the catalog is rewritten, so later processes and
+# reruns read them from disk. An offline cache would only return the source text, so the catalog is left as it
+# is; a failing translator or an unwritable directory is reported and not retried.
+def ensure_catalog(lang, strings, cache, catalog_dir=CATALOG_DIR):
+    if lang == SOURCE_LANGUAGE:
+        return
+    with _built_lock:
+        if (lang, catalog_dir) in _built:
+            return
+        _built.add((lang, catalog_dir))
+    missing = missing_strings(strings, lang, catalog_dir)
+    if not missing or cache.offline:
+        return
+    try:
+        translations = dict(load_catalog(lang, catalog_dir))
+        translations.update(cache.translate_many(missing, lang))
+        write_catalog(lang, strings, translations, catalog_dir)
+        print(f"Added {len(missing)} strings to {catalog_path(lang, catalog_dir)}")
+    except Exception as e:
+        print(f"Could not build the {lang} catalog: {e}")
+
+
+# Translate every translate_text() literal in the app and write one JSON catalog per language
+def build_catalogs(source=APP_SOURCE, catalog_dir=CATALOG_DIR, languages=None, translator=None):
+    strings = extract_static_strings(source)
+    translator = translator or TRANSLATOR_BACKENDS["google"]()
+    cache = TranslationCache(
+        translator,
+        TranslationStore(os.environ.get("PHARMACY_TRANSLATION_CACHE", "translation_cache.db")),
+    )
+
+    for lang in languages or LANGUAGES.values():
+        if lang == SOURCE_LANGUAGE:
+            continue
+        write_catalog(lang, strings, cache.translate_many(strings, lang), catalog_dir)
+        print(f"Wrote {len(strings)} strings to {catalog_path(lang, catalog_dir)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build static locale catalogs for pharma_app.py")
+    parser.add_argument("--source", default=APP_SOURCE)
+    parser.add_argument("--out", default=CATALOG_DIR)
+    parser.add_argument("--languages", nargs="*", help="Language codes (default: all of LANGUAGES)")
+    parser.add_argument("--translator", choices=sorted(TRANSLATOR_BACKENDS), default="google")
+    args = parser.parse_args()
+    build_catalogs(args.source, args.out, args.languages, TRANSLATOR_BACKENDS[args.translator]())
@@ -0,0 +1,92 @@
+import argparse
+import os
+import threading
+
+import db_pool
+from db_pool import DB_ERRORS
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def split_statements(script):
+    lines = [line.split("--", 1)[0] for line in script.splitlines()]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+# Migration files are named <version>_<description>.sql and applied in version order
+def list_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".sql"):
+            migrations.append((filename.split("_", 1)[0], os.path.join(directory, filename)))
+    return migrations
+
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version VARCHAR(32) PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.commit()
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+# Apply every pending migration; returns the versions applied
+def apply_migrations(conn, directory=MIGRATIONS_DIR):
+    done = applied_versions(conn)
+    applied = []
+    for version, path in list_migrations(directory):
+        if version in done:
+            continue
+        with open(path, encoding="utf-8") as f:
+            script = f.read()
+        if conn.backend == "sqlite":
+            statements = db_pool.sqlite_statements_from_mysql(script)
+        else:
+            statements = split_statements(script)
+
+        cursor = conn.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            conn.commit()
+        except DB_ERRORS:
+            conn.rollback()
+            # Another process may have applied the same migration concurrently
+            if version in applied_versions(conn):
+                continue
+            raise
+        finally:
+            cursor.close()
+        print(f"Applied migration {os.path.basename(path)}")
+        applied.append(version)
+    return applied
+
+
+_migrated = False
+_migrate_lock = threading.Lock()
+
+
+# Run pending migrations once per process (called by pharma_app.py at startup)
+def ensure_migrated():
+    global _migrated
+    with _migrate_lock:
+        if _migrated:
+            return
+        with db_pool.connection() as conn:
+            apply_migrations(conn)
+        _migrated = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the PHARMACY_DB_* database")
+    parser.add_argument("--dir", default=MIGRATIONS_DIR)
+    args = parser.parse_args()
+    with db_pool.connection() as conn:
+        applied = apply_migrations(conn, args.dir)
+    print(f"{len(applied)} migration(s) applied.")
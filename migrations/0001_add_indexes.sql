@@ -0,0 +1,6 @@
+-- Secondary indexes for the filters used by pharma_app.py
+CREATE INDEX idx_orders_c_id ON Orders (C_ID);
+CREATE INDEX idx_inventory_rem_qty ON Inventory (Rem_qty);
+CREATE INDEX idx_manager_name ON Manager (M_name);
+CREATE INDEX idx_sales_date ON Sales (Date);
+CREATE INDEX idx_drugs_expiry_date ON Drugs (Expiry_date);
@@ -0,0 +1,5 @@
+-- Keyset pagination for the manager views: filter by manager, then walk the sort order
+CREATE INDEX idx_sales_manager_date ON Sales (M_ID, Date);
+CREATE INDEX idx_sales_total_amt ON Sales (Total_amt);
+CREATE INDEX idx_inventory_manager ON Inventory (M_ID, D_ID);
+CREATE INDEX idx_inventory_manager_qty ON Inventory (M_ID, Rem_qty);
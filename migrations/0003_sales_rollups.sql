@@ -0,0 +1,21 @@
+-- Incrementally maintained sales aggregates (see sales_analytics.py).
+-- M_ID is 0 for sales without a manager and -1 for the all-stores total.
+CREATE TABLE SalesRollup (
+    Period VARCHAR(5) NOT NULL,
+    Period_start DATE NOT NULL,
+    M_ID INT NOT NULL,
+    Total_amt DECIMAL(14,2) NOT NULL,
+    Sale_count INT NOT NULL,
+    PRIMARY KEY (Period, M_ID, Period_start)
+);
+CREATE TABLE DrugSalesRollup (
+    D_ID INT PRIMARY KEY,
+    Sale_qty INT NOT NULL,
+    Total_price DECIMAL(14,2) NOT NULL
+);
+CREATE INDEX idx_drug_sales_rollup_price ON DrugSalesRollup (Total_price);
+CREATE TABLE RollupState (
+    Name VARCHAR(32) PRIMARY KEY,
+    Last_ID INT NOT NULL
+);
+INSERT INTO RollupState (Name, Last_ID) VALUES ('sales', 0);
@@ -0,0 +1,17 @@
+-- Low-stock alerts (see alert_scheduler.py).
+-- Managers without an Email get alerts at PHARMACY_ALERT_RECIPIENT.
+ALTER TABLE Manager ADD COLUMN Email VARCHAR(100);
+-- Per-drug reorder point; drugs without a row use PHARMACY_ALERT_THRESHOLD.
+CREATE TABLE ReorderThreshold (
+    D_ID INT PRIMARY KEY,
+    Threshold INT NOT NULL,
+    FOREIGN KEY (D_ID) REFERENCES Drugs(D_ID) ON DELETE CASCADE
+);
+-- One row per (drug, store) alert already sent; removed once the stock recovers.
+CREATE TABLE AlertLog (
+    D_ID INT,
+    M_ID INT,
+    Rem_qty INT NOT NULL,
+    Sent_at DATETIME NOT NULL,
+    PRIMARY KEY (D_ID, M_ID)
+);
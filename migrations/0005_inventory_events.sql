@@ -0,0 +1,17 @@
+-- Inventory change feed (see inventory_feed.py).
+-- Every stock mutation appends a row in the same transaction; Rem_qty is the stock left after the change.
+CREATE TABLE InventoryEvent (
+    Event_ID INT PRIMARY KEY AUTO_INCREMENT,
+    D_ID INT NOT NULL,
+    M_ID INT NOT NULL,
+    Delta INT NOT NULL,
+    Rem_qty INT NOT NULL,
+    Reason VARCHAR(16) NOT NULL,
+    Created_at DATETIME NOT NULL
+);
+CREATE INDEX idx_inventory_event_store ON InventoryEvent (M_ID, Event_ID);
+-- Last event each named consumer has processed
+CREATE TABLE EventConsumer (
+    Name VARCHAR(64) PRIMARY KEY,
+    Last_ID INT NOT NULL
+);
@@ -0,0 +1,2 @@
+-- Demand history reads for reorder forecasting (see reorder_forecast.py) select a date range of events.
+CREATE INDEX idx_inventory_event_created ON InventoryEvent (Created_at);
@@ -0,0 +1,24 @@
+-- Lot-level stock (see inventory_batches.py). Inventory.Rem_qty stays the per-store total of its batches.
+CREATE TABLE InventoryBatch (
+    Batch_ID INT PRIMARY KEY AUTO_INCREMENT,
+    D_ID INT NOT NULL,
+    M_ID INT NOT NULL,
+    Expiry_date DATE NOT NULL,
+    Qty INT NOT NULL,
+    Received_at DATETIME
+);
+-- First-expiring-first-out allocation seeks the oldest lot of a drug in a store
+CREATE INDEX idx_inventory_batch_fefo ON InventoryBatch (D_ID, M_ID, Expiry_date);
+-- "Expiring within N days", across all stores or for one store
+CREATE INDEX idx_inventory_batch_expiry ON InventoryBatch (Expiry_date);
+CREATE INDEX idx_inventory_batch_store_expiry ON InventoryBatch (M_ID, Expiry_date);
+-- One row per batch an expiry alert has been sent for
+CREATE TABLE ExpiryAlertLog (
+    Batch_ID INT PRIMARY KEY,
+    Sent_at DATETIME NOT NULL
+);
+-- Existing stock becomes one batch per store, expiring on the drug's Expiry_date
+INSERT INTO InventoryBatch (D_ID, M_ID, Expiry_date, Qty)
+SELECT Inventory.D_ID, Inventory.M_ID, COALESCE(Drugs.Expiry_date, '9999-12-31'), Inventory.Rem_qty
+FROM Inventory JOIN Drugs ON Inventory.D_ID = Drugs.D_ID
+WHERE Inventory.Rem_qty > 0;
@@ -0,0 +1,2 @@
+-- Drugs supplied by a supplier, for the chatbot's supplier documents (see retrieval.py)
+CREATE INDEX idx_supplies_supplier ON Supplies (S_ID);
@@ -0,0 +1,111 @@
+import datetime
+import random
+import sqlite3
+import time
+from collections import namedtuple
+
+import inventory_feed
+from db_pool import DB_ERRORS
+from inventory_batches import ExpiredStockError, allocate_fefo
+
+OrderLine = namedtuple("OrderLine", ["drug_id", "drug_name", "quantity"])
+
+# MySQL deadlock and lock-wait timeout error numbers
+RETRYABLE_MYSQL_ERRNOS = {1213, 1205}
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, drug_name, quantity):
+        super().__init__(f"Insufficient stock for {drug_name} (requested {quantity})")
+        self.drug_name = drug_name
+        self.quantity = quantity
+
+
+def _is_retryable(error):
+    if getattr(error, "errno", None) in RETRYABLE_MYSQL_ERRNOS:
+        return True
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+# Merge repeated drugs and sort by D_ID so concurrent orders always lock rows in the same order
+def _normalize_lines(lines):
+    merged = {}
+    for line in lines:
+        if line.quantity <= 0:
+            raise ValueError(f"Quantity must be positive for {line.drug_name}")
+        if line.drug_id in merged:
+            previous = merged[line.drug_id]
+            merged[line.drug_id] = previous._replace(quantity=previous.quantity + line.quantity)
+        else:
+            merged[line.drug_id] = line
+    return [merged[drug_id] for drug_id in sorted(merged)]
+
+
+# Decrement stock for one line inside the open transaction; returns (M_ID the stock came from, Rem_qty left)
+def _reserve_line(conn, cursor, line, store_id):
+    if store_id is None:
+        # The store with the most unexpired units: Rem_qty also counts expired lots, which are never sold
+        cursor.execute(
+            "SELECT M_ID FROM InventoryBatch WHERE D_ID = %s AND Expiry_date >= %s AND Qty > 0 "
+            "GROUP BY M_ID HAVING SUM(Qty) >= %s ORDER BY SUM(Qty) DESC, M_ID LIMIT 1",
+            (line.drug_id, datetime.date.today(), line.quantity),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise InsufficientStockError(line.drug_name, line.quantity)
+        store_id = row[0]
+
+    # The Rem_qty guard makes the decrement safe without locking the row first
+    cursor.execute(
+        "UPDATE Inventory SET Rem_qty = Rem_qty - %s WHERE D_ID = %s AND M_ID = %s AND Rem_qty >= %s",
+        (line.quantity, line.drug_id, store_id, line.quantity),
+    )
+    if cursor.rowcount != 1:
+        raise InsufficientStockError(line.drug_name, line.quantity)
+    # Units come out of the store's batches first-expiring-first-out; expired lots are never sold
+    try:
+        allocate_fefo(conn, cursor, line.drug_id, store_id, line.quantity)
+    except ExpiredStockError:
+        raise InsufficientStockError(line.drug_name, line.quantity)
+    cursor.execute("SELECT Rem_qty FROM Inventory WHERE D_ID = %s AND M_ID = %s", (line.drug_id, store_id))
+    return store_id, cursor.fetchone()[0]
+
+
+def _try_submit(conn, customer_id, lines, store_id):
+    conn.begin()
+    cursor = conn.cursor()
+    try:
+        allocations = []
+        events = []
+        for line in lines:
+            m_id, rem_qty = _reserve_line(conn, cursor, line, store_id)
+            allocations.append((line, m_id))
+            events.append((line.drug_id, m_id, -line.quantity, rem_qty, "order"))
+        cursor.executemany(
+            "INSERT INTO Orders (C_ID, Qty, Name, Item) VALUES (%s, %s, %s, %s)",
+            [(customer_id, line.quantity, f"Order for {line.drug_name}", line.drug_name) for line in lines],
+        )
+        inventory_feed.record_events(cursor, events)
+        conn.commit()
+        return allocations
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Place a multi-line order atomically: every line is reserved and recorded, or nothing is.
+# Deadlocks and lock timeouts are retried with jittered exponential backoff.
+def submit_order(conn, customer_id, lines, store_id=None, max_retries=5):
+    lines = _normalize_lines(lines)
+    for attempt in range(max_retries + 1):
+        try:
+            allocations = _try_submit(conn, customer_id, lines, store_id)
+        except DB_ERRORS as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            time.sleep(min(1.0, 0.01 * 2 ** attempt) * random.uniform(0.5, 1.5))
+        else:
+            inventory_feed.notify()
+            return allocations
@@ -0,0 +1,118 @@
+from collections import namedtuple
+
+# rows: at most page_size rows; next_after: cursor for the following page, or None on the last page
+Page = namedtuple("Page", ["rows", "next_after"])
+
+SALES_COLUMNS = ["Sale_ID", "Total_amt", "Date", "Time", "M_ID"]
+ORDERS_COLUMNS = ["Order_ID", "Qty", "Name", "Item"]
+INVENTORY_COLUMNS = ["D_ID", "Rem_qty", "M_ID"]
+
+SALES_SORTS = {
+    "Newest first": (("Date", "Sale_ID"), True),
+    "Oldest first": (("Date", "Sale_ID"), False),
+    "Highest amount": (("Total_amt", "Sale_ID"), True),
+}
+INVENTORY_SORTS = {
+    "Drug ID": (("D_ID", "M_ID"), False),
+    "Lowest stock": (("Rem_qty", "D_ID", "M_ID"), False),
+}
+
+
+# Sort columns that may hold NULL; MySQL and SQLite both sort NULLs first ascending and last descending
+NULLABLE_COLUMNS = {"Date"}
+
+
+# `column` compared to a cursor value: (strictly-after condition, equal condition, params of each). Comparisons
+# with NULL are never true in SQL, so NULL cursor values and nullable columns are spelled out.
+def _compare(column, op, value):
+    nullable = column in NULLABLE_COLUMNS
+    if value is None:
+        # NULLs come first ascending (anything non-NULL is after) and last descending (nothing is after)
+        return (f"{column} IS NOT NULL" if op == ">" else "1 = 0"), [], f"{column} IS NULL", []
+    if nullable and op == "<":
+        return f"({column} < %s OR {column} IS NULL)", [value], f"{column} = %s", [value]
+    return f"{column} {op} %s", [value], f"{column} = %s", [value]
+
+
+# WHERE clause selecting rows strictly after `values` in (columns...) order
+def _after_clause(columns, descending, values):
+    op = "<" if descending else ">"
+    clauses = []
+    params = []
+    for i, column in enumerate(columns):
+        parts = []
+        for previous, value in zip(columns[:i], values[:i]):
+            _, _, equal, equal_params = _compare(previous, op, value)
+            parts.append(equal)
+            params.extend(equal_params)
+        after, after_params, _, _ = _compare(column, op, values[i])
+        parts.append(after)
+        params.extend(after_params)
+        clauses.append("(" + " AND ".join(parts) + ")")
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+# Run a keyset-paginated query over `table`, streaming at most page_size + 1 rows from the server.
+# Every sort column must be one of the selected columns so the next cursor can be read off the last row.
+def fetch_page(conn, table, columns, filters, params, sort_columns, descending, after=None, page_size=50):
+    filters = list(filters)
+    params = list(params)
+    if after is not None:
+        clause, after_params = _after_clause(sort_columns, descending, after)
+        filters.append(clause)
+        params.extend(after_params)
+
+    direction = "DESC" if descending else "ASC"
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += " ORDER BY " + ", ".join(f"{column} {direction}" for column in sort_columns)
+    query += f" LIMIT {int(page_size) + 1}"
+
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = []
+    while len(rows) <= page_size:
+        chunk = cursor.fetchmany(min(page_size + 1 - len(rows), 500))
+        if not chunk:
+            break
+        rows.extend(chunk)
+    cursor.close()
+
+    if len(rows) <= page_size:
+        return Page(rows, None)
+    rows = rows[:page_size]
+    positions = [columns.index(column) for column in sort_columns]
+    return Page(rows, tuple(rows[-1][position] for position in positions))
+
+
+def fetch_sales_page(conn, after=None, page_size=50, date_from=None, date_to=None, manager_id=None,
+                     sort="Newest first"):
+    sort_columns, descending = SALES_SORTS[sort]
+    filters, params = [], []
+    if date_from is not None:
+        filters.append("Date >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        filters.append("Date <= %s")
+        params.append(date_to)
+    if manager_id is not None:
+        filters.append("M_ID = %s")
+        params.append(manager_id)
+    return fetch_page(conn, "Sales", SALES_COLUMNS, filters, params,
+                      sort_columns, descending, after, page_size)
+
+
+def fetch_orders_page(conn, customer_id, after=None, page_size=50):
+    return fetch_page(conn, "Orders", ORDERS_COLUMNS, ["C_ID = %s"], [customer_id],
+                      ("Order_ID",), True, after, page_size)
+
+
+def fetch_inventory_page(conn, after=None, page_size=50, manager_id=None, sort="Drug ID"):
+    sort_columns, descending = INVENTORY_SORTS[sort]
+    filters, params = [], []
+    if manager_id is not None:
+        filters.append("M_ID = %s")
+        params.append(manager_id)
+    return fetch_page(conn, "Inventory", INVENTORY_COLUMNS, filters, params,
+                      sort_columns, descending, after, page_size)
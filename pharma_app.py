@@ -1,93 +1,81 @@
 import streamlit as st
-import re
-import mysql.connector
 import pandas as pd
 import datetime
-import google.generativeai as genai
-from googletrans import Translator
-import smtplib
-from email.mime.text import MIMEText
-from pyzbar.pyzbar import decode
-from PIL import Image
-import qrcode
-import requests
-
-
-# ✅ Directly define your Gemini API Key here
-API_KEY = "put your API here"
-
-# ✅ Configure Gemini API
-genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel("gemini-pro")
-
-# Initialize the translator
-translator = Translator()
-
-# Language options
-LANGUAGES = {
-    'English': 'en',
-    'Spanish': 'es',
-    'French': 'fr',
-    'German': 'de',
-    'Chinese': 'zh-cn',
-    'Kannada': 'kn',
-    'Hindi': 'hi',
-    'Tamil': 'ta',
-    'Telugu': 'te',
-}
+import os
+import tempfile
+
+import db_pool
+from alert_scheduler import alerts_enabled_from_env, get_alert_scheduler
+from auth import EmailTakenError, get_authenticator
+from db_pool import DB_ERRORS
+from instrumentation import get_instrumentation, traced, traced_connection
+from migrate import ensure_migrated
+from order_pipeline import InsufficientStockError, OrderLine
+from paged_queries import INVENTORY_SORTS, SALES_SORTS
+import pharmacy_service as service
+from reference_cache import get_reference_cache
+import locale_catalogs
+from locale_catalogs import LANGUAGES
+from translation_cache import extract_static_strings, get_translation_cache
+from validators import validate_email, validate_password, validate_phone
+
+# Subsystems used by a single page (AI chat and retrieval, QR scanning, openFDA interactions, forecasting,
+# sales analytics) are imported inside that page's function, so a cold start only loads what the login and
+# order pages need. Python caches the module after the first import, so later reruns pay nothing for it.
+# `python bench_import_time.py --check` fails if one of them is loaded at startup again.
+
+# Time this rerun's slow paths (a no-op unless PHARMACY_INSTRUMENTATION=1 or enabled on the Debug Panel page)
+get_instrumentation().begin_rerun(enabled=st.session_state.get("record_timings"))
 
 # Function to translate text
+# Static strings come from the prebuilt locale catalogs; only dynamic text reaches the translation cache.
+@traced("translate")
 def translate_text(text, target_language="en"):
+    translated = locale_catalogs.lookup(text, target_language)
+    if translated is not None:
+        return translated
     try:
-        translated = translator.translate(text, dest=target_language)
-        return translated.text
+        return get_translation_cache().translate(text, target_language)
     except Exception as e:
         st.error(f"Translation Error: {e}")
         return text  # Return the original text if translation fails
 
+# Bring the database schema up to date (runs once per process)
+ensure_migrated()
+
+# Low-stock alerts are evaluated and emailed from a background thread (started once per process) when
+# PHARMACY_ALERTS=1; otherwise they are left to a separate `python alert_scheduler.py` worker
+if alerts_enabled_from_env():
+    get_alert_scheduler().start()
+
 # Initialize session state
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.user_type = None  # 'Customer' or 'Manager'
     st.session_state.user_id = None    # Stores the user ID
-    st.session_state.chat_history = []  # Initialize chat history
+    st.session_state.auth_token = None  # Signed session token issued at login
+
+# The signed token is checked on every rerun without a database query; an expired session logs out
+if st.session_state.logged_in and get_authenticator().verify_token(st.session_state.get("auth_token")) is None:
+    st.session_state.logged_in = False
+    st.session_state.user_type = None
+    st.session_state.user_id = None
+    st.session_state.auth_token = None
 
 # Sidebar for language selection
 selected_language = st.sidebar.selectbox("Select Language", list(LANGUAGES.keys()))
 target_language = LANGUAGES[selected_language]
 
+# Add static UI strings missing from the language's catalog to it in one batch (once per process), so they are
+# read from locales/ from then on
+locale_catalogs.ensure_catalog(target_language, extract_static_strings(__file__), get_translation_cache())
+
 # Database Connection Function
+# Connections come from the shared pool in db_pool.py (configured through PHARMACY_DB_* environment
+# variables); calling close() on them hands them back to the pool.
+@traced("db.checkout")
 def get_db_connection():
-    return mysql.connector.connect(
-        # Setup your database
-        host='', user='', password='', database='PharmacyManagement'
-    )
-
-# Validate Email Format
-def validate_email(email):
-    if not re.match(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$", email):
-        return False, "Invalid email format. Please enter a valid email address."
-    return True, ""
-
-# Validate Password
-def validate_password(password):
-    if len(password) < 8:
-        return False, "Password must be at least 8 characters long."
-    if not re.search(r"[a-z]", password):
-        return False, "Password must contain at least one lowercase letter."
-    if not re.search(r"[A-Z]", password):
-        return False, "Password must contain at least one uppercase letter."
-    if not re.search(r"[0-9]", password):
-        return False, "Password must contain at least one digit."
-    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-        return False, "Password must contain at least one special character."
-    return True, ""
-
-# Validate Phone Number (10 digits)
-def validate_phone(phone):
-    if not re.match(r"^\d{10}$", phone):
-        return False, "Invalid phone number format. It must contain exactly 10 digits."
-    return True, ""
+    return traced_connection(db_pool.get_connection())
 
 # Signup Function (New Customer Registration)
 def signup_user(email, password, name, age, sex, phone, address):
@@ -97,23 +85,10 @@ def signup_user(email, password, name, age, sex, phone, address):
         st.error(email_error)
         return
 
-    # Check if email already exists
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT C_ID FROM Customer WHERE EmailID = %s", (email,))
-    existing_user = cursor.fetchone()
-    if existing_user:
-        st.error("Email is already registered. Please log in instead.")
-        cursor.close()
-        conn.close()
-        return
-
     # Validate password
     is_password_valid, password_error = validate_password(password)
     if not is_password_valid:
         st.error(password_error)
-        cursor.close()
-        conn.close()
         return
 
     # Validate phone number (optional, if phone is provided)
@@ -121,97 +96,65 @@ def signup_user(email, password, name, age, sex, phone, address):
         is_phone_valid, phone_error = validate_phone(phone)
         if not is_phone_valid:
             st.error(phone_error)
-            cursor.close()
-            conn.close()
             return
 
-    # Proceed with the registration if all validations pass
+    # Customer and phone rows are written in one transaction, with the password hashed
+    conn = get_db_connection()
     try:
-        cursor.execute(
-            "INSERT INTO Customer (C_name, Age, Sex, Address, Pwd, EmailID) VALUES (%s, %s, %s, %s, %s, %s)",
-            (name, age, sex, address, password, email)
-        )
-        conn.commit()
-
-        # Retrieve customer ID for future references
-        cursor.execute("SELECT C_ID FROM Customer WHERE EmailID = %s", (email,))
-        customer_id = cursor.fetchone()[0]
-
-        # Insert phone number if provided
-        if phone.strip():
-            cursor.execute(
-                "INSERT INTO CustomerPhone (C_ID, Ph_no) VALUES (%s, %s)",
-                (customer_id, phone)
-            )
-            conn.commit()
-
+        get_authenticator().register_customer(conn, email, password, name, age, sex, phone.strip(), address)
         st.success("Signup successful! You can now log in.")
-    except mysql.connector.Error as e:
+    except EmailTakenError:
+        st.error("Email is already registered. Please log in instead.")
+    except DB_ERRORS as e:
         st.error(f"Database error: {str(e)}")
     finally:
-        cursor.close()
         conn.close()
 
 # Login Function
+# Passwords are checked against salted hashes (auth.py); plain-text rows are hashed on their next login
 def login_user(username, password, user_type):
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    if user_type == "Customer":
-        query = "SELECT C_ID FROM Customer WHERE EmailID = %s AND Pwd = %s"
-    else:
-        query = "SELECT M_ID FROM Manager WHERE M_name = %s AND M_pwd = %s"
-
-    cursor.execute(query, (username, password))
-    result = cursor.fetchone()
+    try:
+        user_id = get_authenticator().authenticate(conn, username, password, user_type)
+    except DB_ERRORS as err:
+        st.error(f"Database error: {err}")
+        return
+    finally:
+        conn.close()
 
-    if result:
+    if user_id is not None:
         st.session_state.logged_in = True
         st.session_state.user_type = user_type
-        st.session_state.user_id = result[0]
+        st.session_state.user_id = user_id
+        st.session_state.auth_token = get_authenticator().issue_token(user_type, user_id)
         st.success(translate_text(f"Logged in as {user_type}!", target_language))
     else:
         st.error(translate_text("Invalid credentials. Please try again.", target_language))
 
-    cursor.close()
-    conn.close()
-
+# Interaction warnings come from the cached openFDA lookup service (drug_interactions.py).
+# Returns None while the label is still being fetched in the background.
+@traced("openfda")
 def get_drug_interactions(drug_name):
-    url = f"https://api.fda.gov/drug/label.json?search={drug_name}&limit=1"
-    
-    try:
-        response = requests.get(url)
-        data = response.json()
-
-        if 'results' in data and 'warnings' in data['results'][0]:
-            warnings_list = data['results'][0]['warnings']
-
-            # ✅ Clean and format warnings into multiple bullet points
-            formatted_warnings = "\n\n".join([
-                f"• {sentence.strip()}" for warning in warnings_list for sentence in warning.split(". ") if sentence
-            ])
-
-            return f"⚠ *Warning for {drug_name}:*\n\n{formatted_warnings}"
-        
-        else:
-            return f"✅ *No known harmful interactions for {drug_name}.*"
-    
-    except Exception as e:
-        return f"❌ *Error fetching data: {e}*"
+    from drug_interactions import get_interaction_service
+    return get_interaction_service().lookup(drug_name)
 
 
 def place_order():
     if not st.session_state.logged_in or st.session_state.user_type != "Customer":
         st.error(translate_text("You must be logged in as a customer!", target_language))
         return
+    from drug_interactions import get_interaction_service
+    from interaction_engine import format_interaction, get_interaction_index
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("SELECT Drugs.D_ID, Drugs.D_name, Inventory.Rem_qty FROM Drugs JOIN Inventory ON Drugs.D_ID = Inventory.D_ID")
-    drugs = cursor.fetchall()
+    # Drugs with their largest single-store stock of unexpired lots, from the reference cache (invalidated
+    # whenever stock changes)
+    drugs = service.drug_stock(conn)
 
-    drug_dict = {d[1]: (d[0], d[2]) for d in drugs}  # d[0] is D_ID, d[2] is Rem_qty
+    drug_dict = {d[1]: (d[0], d[2]) for d in drugs}  # d[0] is D_ID, d[2] is the unexpired quantity
+    if "basket" not in st.session_state:
+        st.session_state.basket = []
     drug_name = st.selectbox(translate_text("Select Drug", target_language), list(drug_dict.keys()))
     quantity = st.number_input(translate_text("Enter Quantity", target_language), min_value=1, step=1)
 
@@ -221,41 +164,101 @@ def place_order():
     # Check if the requested quantity is available
     if quantity > remaining_qty:
         st.error(translate_text("Insufficient stock. Please reduce the quantity.", target_language))
-        cursor.close()
         conn.close()
         return
     
-    # ✅ Fetch interaction warnings
+    # ✅ Fetch interaction warnings (warm the cache for the whole Drugs table in the background)
+    get_interaction_service().start_prefetch()
     interaction_warning = get_drug_interactions(drug_name)
 
     # ✅ Display warning properly
     st.write(f"🔍 Checking interactions for: *{drug_name}*")
-    if "⚠ Warning" in interaction_warning:
+    if interaction_warning is None:
+        st.info(translate_text("Still checking interactions, they will appear shortly.", target_language))
+    elif interaction_warning.startswith("⚠"):
         st.warning(interaction_warning)  # ✅ Show warning in a proper alert
     else:
         st.success(interaction_warning)  # ✅ Show success message if no warning
 
+    # ✅ Check contraindications across the basket and the customer's previous orders using the local index
+    basket_names = [line.drug_name for line in st.session_state.basket] + [drug_name]
+    for interaction in get_interaction_index().check_customer(st.session_state.user_id, basket_names):
+        st.warning(format_interaction(interaction))
+
+    if st.button(translate_text("Add to Basket", target_language)):
+        st.session_state.basket.append(OrderLine(drug_id, drug_name, int(quantity)))
+
+    if st.session_state.basket:
+        st.subheader(translate_text("Basket", target_language))
+        st.table(pd.DataFrame(st.session_state.basket, columns=["Drug ID", "Drug", "Quantity"]))
+        if st.button(translate_text("Clear Basket", target_language)):
+            st.session_state.basket = []
 
     if st.button(translate_text("Place Order", target_language)):
-        # Insert the order into the Orders table
-        cursor.execute(
-            "INSERT INTO Orders (C_ID, Qty, Name, Item) VALUES (%s, %s, %s, %s)",
-            (st.session_state.user_id, quantity, f"Order for {drug_name}", drug_name)
-        )
-
-        # Update the remaining quantity in the Inventory table
-        new_qty = remaining_qty - quantity
-        cursor.execute(
-            "UPDATE Inventory SET Rem_qty = %s WHERE D_ID = %s",
-            (new_qty, drug_id)
-        )
-
-        conn.commit()
-        st.success(translate_text("Successfully placed order!", target_language))
-
-    cursor.close()
+        # The order goes to one store with stock for every line; its stock is reserved and the Orders rows
+        # are inserted in one transaction
+        lines = st.session_state.basket or [OrderLine(drug_id, drug_name, int(quantity))]
+        try:
+            store_id, _ = service.place_order(conn, st.session_state.user_id,
+                                              [(line.drug_id, line.quantity) for line in lines])
+            st.session_state.basket = []
+            st.success(translate_text("Successfully placed order!", target_language))
+            if store_id is not None:
+                st.caption(f"{translate_text('Served by store', target_language)} {store_id}")
+        except InsufficientStockError as e:
+            st.error(translate_text(f"Insufficient stock for {e.drug_name}. Please reduce the quantity.", target_language))
+        except (ValueError, service.NotFoundError) as e:
+            st.error(str(e))
+        except DB_ERRORS as e:
+            st.error(f"Database error: {str(e)}")
+
     conn.close()
 
+PAGE_SIZE = 50
+
+
+# Keyset cursor of the page currently shown for a view; going back to the first page when the filters change
+def current_page_cursor(view_key, filters):
+    state = st.session_state.get(view_key)
+    if state is None or state["filters"] != filters:
+        state = {"filters": filters, "cursors": [None]}
+        st.session_state[view_key] = state
+    return state["cursors"][-1]
+
+
+# Previous / Next buttons for a paginated view
+def page_navigation(view_key, next_after):
+    state = st.session_state[view_key]
+    col1, col2 = st.columns(2)
+    if col1.button(translate_text("Previous Page", target_language), key=f"{view_key}_prev",
+                   disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    if col2.button(translate_text("Next Page", target_language), key=f"{view_key}_next",
+                   disabled=next_after is None):
+        state["cursors"].append(next_after)
+        st.rerun()
+
+
+# Shown when some store databases did not answer a query spanning stores
+def store_warning(failed):
+    if failed:
+        st.warning(f"{translate_text('Some store databases did not respond; results are incomplete', target_language)}: "
+                   f"{', '.join(failed)}")
+
+
+# Store filter options: "All stores" plus one entry per manager
+def manager_options(conn):
+    managers = {translate_text("All stores", target_language): None}
+    managers.update({f"{m_name} (ID {m_id})": m_id for m_id, m_name in get_reference_cache().get(conn, "managers")})
+    return managers
+
+
+def format_time(value):
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M:%S')
+    return str(value)
+
 # Function to View Orders (Customer)
 def view_orders():
     if not st.session_state.logged_in or st.session_state.user_type != "Customer":
@@ -263,105 +266,22 @@ def view_orders():
         return
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("SELECT Order_ID, Qty, Name, Item FROM Orders WHERE C_ID = %s", (st.session_state.user_id,))
-    orders = cursor.fetchall()
+    # Orders are kept by the store that served them, so every store database is read
+    filters = {"customer": st.session_state.user_id}
+    page = service.customer_orders(conn, st.session_state.user_id, current_page_cursor("orders_pages", filters),
+                                   PAGE_SIZE)
+    store_warning(page.failed)
 
-    if orders:
-        df = pd.DataFrame(orders, columns=["Order ID", "Quantity", "Order Name", "Item"])
+    if page.rows:
+        df = pd.DataFrame(page.rows, columns=["Order ID", "Quantity", "Order Name", "Item"])
         st.subheader(translate_text("Your Orders:", target_language))
-        st.table(df)
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        page_navigation("orders_pages", page.next_after)
     else:
         st.info(translate_text("No orders found.", target_language))
 
-    cursor.close()
     conn.close()
-# Function to check inventory and notify managers about out-of-stock drugs
-def check_inventory_and_notify():
-    try:
-        # Instead of using db_config, directly use get_db_connection
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-
-        # Query to find out-of-stock drugs (i.e., Rem_qty <= 0)
-        query = """
-            SELECT Inventory.D_ID, Drugs.D_name, Manager.M_ID, Manager.M_name, Manager.Ph_no
-            FROM Inventory 
-            JOIN Drugs ON Inventory.D_ID = Drugs.D_ID
-            JOIN Manager ON Inventory.M_ID = Manager.M_ID
-            WHERE Inventory.Rem_qty <= 0
-        """
-        cursor.execute(query)
-        results = cursor.fetchall()
-
-        if results:
-            # Organize notifications per manager if needed
-            manager_notifications = {}
-            for row in results:
-                m_id = row['M_ID']
-                if m_id not in manager_notifications:
-                    manager_notifications[m_id] = {
-                        'M_name': row['M_name'],
-                        'Ph_no': row['Ph_no'],  # You can extend this to include email if available
-                        'drugs': []
-                    }
-                manager_notifications[m_id]['drugs'].append(row['D_name'])
-
-            # For each manager, send a notification email
-            for m_id, info in manager_notifications.items():
-                # For demo purposes, we use a predefined email address.
-                # In a real system, you could fetch the manager's email from the database.
-                send_notification_email(info['M_name'], info['drugs'], recipient_email='add email id')
-        else:
-            print("All drugs are in stock.")
-    except mysql.connector.Error as err:
-        print("Database error:", err)
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
-
-
-def send_notification_email(manager_name, drugs, recipient_email):
-    # Email server configuration: update with your actual SMTP server settings
-    smtp_server = 'smtp.gmail.com'
-    smtp_port = 587
-    smtp_username = ''
-    smtp_password = ''
-    
-    from_email = smtp_username
-    subject = "Out of Stock Notification - Pharmacy Management System"
-    
-    # Compose the email body
-    body = (
-        f"Dear {manager_name},\n\n"
-        f"The following drugs are currently out of stock: {', '.join(drugs)}.\n"
-        "Please take the necessary action to reorder these drugs as soon as possible.\n\n"
-        "Regards,\n"
-        "Pharmacy Management System"
-    )
-    
-    # Create the MIMEText message
-    msg = MIMEText(body)
-    msg['Subject'] = subject
-    msg['From'] = from_email
-    msg['To'] = recipient_email
-
-    server = None  # Initialize server to ensure it is always declared before the 'finally' block
-    try:
-        # Establish a connection with the SMTP server and send the email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()  # Secure the connection
-        server.login(smtp_username, smtp_password)
-        server.sendmail(from_email, recipient_email, msg.as_string())
-        print(f"Notification email sent to {recipient_email}.")
-    except Exception as e:
-        print("Error sending email:", e)
-    finally:
-        if server:
-            server.quit()  # Ensure server is only quit if it was initialized
 
 # Function to View Inventory (Manager)
 def view_inventory():
@@ -370,24 +290,71 @@ def view_inventory():
         return
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("SELECT D_ID, Rem_qty FROM Inventory")
-    inventory = cursor.fetchall()
-
-    if inventory:
+    managers = manager_options(conn)
+    col1, col2 = st.columns(2)
+    store = col1.selectbox(translate_text("Store", target_language), list(managers.keys()),
+                           index=list(managers.values()).index(st.session_state.user_id)
+                           if st.session_state.user_id in managers.values() else 0)
+    sort = col2.selectbox(translate_text("Sort by", target_language), list(INVENTORY_SORTS.keys()))
+    filters = {"store": managers[store], "sort": sort}
+    page = service.inventory_page(conn, current_page_cursor("inventory_pages", filters), PAGE_SIZE,
+                                  managers[store], sort)
+    store_warning(page.failed)
+
+    if page.rows:
         # Display inventory as a DataFrame
-        df = pd.DataFrame(inventory, columns=["Drug ID", "Remaining Quantity"])
+        df = pd.DataFrame(page.rows, columns=["Drug ID", "Remaining Quantity", "Manager ID"])
         st.subheader(translate_text("Inventory Status:", target_language))
-        st.table(df)
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        page_navigation("inventory_pages", page.next_after)
 
-        # Call the function to check inventory and send notifications
-        check_inventory_and_notify()
+        if alerts_enabled_from_env():
+            alerts = get_alert_scheduler().stats()
+            st.caption(f"{translate_text('Low-stock alerts', target_language)}: {alerts['sent']} "
+                       f"{translate_text('sent', target_language)}, {alerts['queued']} "
+                       f"{translate_text('queued', target_language)}, {alerts['suppressed']} "
+                       f"{translate_text('suppressed', target_language)}")
 
     else:
         st.info(translate_text("No inventory data found.", target_language))
 
-    cursor.close()
+    # Restock the manager's own store; the change is recorded in the inventory feed
+    with st.expander(translate_text("Restock", target_language)):
+        drug_id = st.number_input(translate_text("Drug ID", target_language), min_value=1, step=1)
+        quantity = st.number_input(translate_text("Quantity", target_language), min_value=1, step=1)
+        if st.button(translate_text("Add Stock", target_language)):
+            try:
+                rem_qty = service.restock_store(conn, st.session_state.user_id, int(drug_id), int(quantity))
+                st.success(f"{translate_text('Stock updated. Remaining quantity', target_language)}: {rem_qty}")
+            except DB_ERRORS as err:
+                st.error(f"{translate_text('Could not restock', target_language)}: {err}")
+
+    # Which stores can fill a large order, asked of every store database at once
+    with st.expander(translate_text("Find Stock Across Stores", target_language)):
+        col1, col2 = st.columns(2)
+        find_name = col1.text_input(translate_text("Drug name", target_language))
+        find_qty = col2.number_input(translate_text("Units needed", target_language), min_value=1, value=1, step=1)
+        if find_name:
+            result = service.find_stock(conn, find_name.strip(), int(find_qty))
+            store_warning(result.failed)
+            if result.rows:
+                st.dataframe(pd.DataFrame(result.rows, columns=["Store", "Drug ID", "Drug", "Remaining Quantity"]),
+                             hide_index=True, use_container_width=True)
+            else:
+                st.info(translate_text("No store has that much stock.", target_language))
+            st.caption(f"{len(result.shard_seconds)} {translate_text('databases searched in', target_language)} "
+                       f"{result.seconds * 1000:.1f} ms")
+
+    with st.expander(translate_text("Recent Stock Movements", target_language)):
+        events = service.stock_movements(conn, managers[store])
+        if events:
+            st.dataframe(pd.DataFrame(events, columns=["Event ID", "Drug ID", "Manager ID", "Change",
+                                                       "Remaining Quantity", "Reason", "Time"]),
+                         hide_index=True, use_container_width=True)
+        else:
+            st.info(translate_text("No stock movements recorded yet.", target_language))
+
     conn.close()
 
 
@@ -398,49 +365,188 @@ def view_sales():
         return
 
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT Sale_ID, Total_amt, Date, Time FROM Sales")
-    sales = cursor.fetchall()
-
-    if sales:
-        formatted_sales = []
-        for sale in sales:
-            sale_id, total_amt, date, time = sale
-            # Handle the case where time is a timedelta object
-            if isinstance(time, datetime.time):
-                formatted_time = time.strftime('%H:%M:%S')  # Format time if it's a time object
-            else:
-                formatted_time = str(time)  # If it's not a time object, convert it to a string
-            formatted_sales.append([sale_id, total_amt, date, formatted_time])
 
-        # Convert formatted data to DataFrame
-        df = pd.DataFrame(formatted_sales, columns=["Sale ID", "Total Amount", "Date", "Time"])
+    managers = manager_options(conn)
+    col1, col2, col3, col4 = st.columns(4)
+    date_from = col1.date_input(translate_text("From", target_language), value=None)
+    date_to = col2.date_input(translate_text("To", target_language), value=None)
+    store = col3.selectbox(translate_text("Store", target_language), list(managers.keys()))
+    sort = col4.selectbox(translate_text("Sort by", target_language), list(SALES_SORTS.keys()))
+    filters = {"from": date_from, "to": date_to, "store": managers[store], "sort": sort}
+    page = service.sales_page(conn, current_page_cursor("sales_pages", filters), PAGE_SIZE, date_from, date_to,
+                              managers[store], sort)
+    store_warning(page.failed)
+
+    if page.rows:
+        df = pd.DataFrame(page.rows, columns=["Sale ID", "Total Amount", "Date", "Time", "Manager ID"])
+        # MySQL returns TIME columns as timedelta objects; show them as HH:MM:SS
+        df["Time"] = df["Time"].map(format_time)
         st.subheader(translate_text("Sales Report", target_language))
-        st.table(df)
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        page_navigation("sales_pages", page.next_after)
+    else:
+        st.info(translate_text("No sales found.", target_language))
+
+    conn.close()
+
+
+# Function to show the Sales Dashboard (Manager); reads the pre-aggregated rollups instead of scanning Sales
+def sales_dashboard():
+    if not st.session_state.logged_in or st.session_state.user_type != "Manager":
+        st.error(translate_text("You must be logged in as a manager!", target_language))
+        return
+    from sales_analytics import (ALL_STORES, PERIODS, refresh_rollups_if_due, revenue_trend,
+                                 rollup_interval_from_env, top_drugs)
+
+    conn = get_db_connection()
+    try:
+        # Fold in only the sales recorded since the last refresh, at most once per interval for all sessions
+        refresh_rollups_if_due(conn, rollup_interval_from_env())
+    except DB_ERRORS as err:
+        st.error(f"{translate_text('Could not refresh sales totals', target_language)}: {err}")
+
+    managers = manager_options(conn)
+    col1, col2, col3 = st.columns(3)
+    period = col1.selectbox(translate_text("Period", target_language), list(PERIODS))
+    store = col2.selectbox(translate_text("Store", target_language), list(managers.keys()), key="dashboard_store")
+    periods = col3.number_input(translate_text("Periods shown", target_language), min_value=1, max_value=365, value=30)
+    manager_id = managers[store] if managers[store] is not None else ALL_STORES
+
+    trend = revenue_trend(conn, period, manager_id, int(periods))
+    if trend.empty:
+        st.info(translate_text("No sales found.", target_language))
+    else:
+        col1, col2 = st.columns(2)
+        col1.metric(translate_text("Revenue", target_language), f"{trend['Revenue'].sum():,.2f}")
+        col2.metric(translate_text("Sales", target_language), int(trend["Sales"].sum()))
+        st.line_chart(trend, x="Period start", y="Revenue")
+
+    st.subheader(translate_text("Top Drugs", target_language))
+    st.dataframe(top_drugs(conn), hide_index=True, use_container_width=True)
 
-    cursor.close()
     conn.close()
 
+# Function to show Expiring Stock (Manager): batches expiring within N days, soonest first
+def expiring_stock():
+    if not st.session_state.logged_in or st.session_state.user_type != "Manager":
+        st.error(translate_text("You must be logged in as a manager!", target_language))
+        return
+
+    conn = get_db_connection()
+    managers = manager_options(conn)
+    col1, col2 = st.columns(2)
+    days = col1.number_input(translate_text("Expiring within (days)", target_language), min_value=0, value=30)
+    store = col2.selectbox(translate_text("Store", target_language), list(managers.keys()), key="expiry_store")
+
+    rows = service.expiring_batches(conn, int(days), managers[store])
+    if rows:
+        df = pd.DataFrame(rows, columns=["Batch ID", "Drug ID", "Drug", "Manager ID", "Expiry Date", "Quantity"])
+        st.dataframe(df, hide_index=True, use_container_width=True)
+    else:
+        st.info(translate_text("No stock expiring in this period.", target_language))
+
+    # Managers may only write off their own store's expired stock
+    if st.button(translate_text("Write Off Expired Stock", target_language)):
+        try:
+            units = service.write_off_store(conn, st.session_state.user_id)
+            st.success(f"{translate_text('Expired units written off', target_language)}: {units}")
+        except DB_ERRORS as err:
+            st.error(f"Database error: {err}")
+
+    conn.close()
+
+
+# Function to show forecast-driven Reorder Suggestions (Manager); the forecast is cached for a few minutes
+def reorder_suggestions():
+    if not st.session_state.logged_in or st.session_state.user_type != "Manager":
+        st.error(translate_text("You must be logged in as a manager!", target_language))
+        return
+    from reorder_forecast import by_supplier, cached_suggestions
+
+    col1, col2 = st.columns(2)
+    lead_time = col1.number_input(translate_text("Supplier lead time (days)", target_language), min_value=1, value=7)
+    review_period = col2.number_input(translate_text("Days until next reorder", target_language), min_value=1, value=7)
+    refresh = st.button(translate_text("Recalculate", target_language))
+
+    conn = get_db_connection()
+    try:
+        suggestions = cached_suggestions(conn, int(lead_time), int(review_period), refresh=refresh)
+    except DB_ERRORS as err:
+        st.error(f"Database error: {err}")
+        return
+    finally:
+        conn.close()
+
+    if suggestions.empty:
+        st.success(translate_text("No drugs need reordering.", target_language))
+        return
+    col1, col2 = st.columns(2)
+    col1.metric(translate_text("Drugs to reorder", target_language), len(suggestions))
+    col2.metric(translate_text("Units to order", target_language), int(suggestions["Suggested qty"].sum()))
+    st.subheader(translate_text("By Supplier", target_language))
+    st.dataframe(by_supplier(suggestions), hide_index=True, use_container_width=True)
+    st.subheader(translate_text("Suggestions", target_language))
+    st.dataframe(suggestions[["D_ID", "Drug", "Stock", "Daily demand", "Days of cover", "Reorder point",
+                              "Suggested qty", "Supplier"]], hide_index=True, use_container_width=True)
+
+# Debug Panel (Manager): where the time went in this session's recent reruns, and the process-wide metrics
+def debug_panel():
+    if not st.session_state.logged_in or st.session_state.user_type != "Manager":
+        st.error(translate_text("You must be logged in as a manager!", target_language))
+        return
+
+    instrumentation = get_instrumentation()
+    # Kept per session, so one manager switching it on does not record every other session's reruns
+    st.session_state.record_timings = st.checkbox(
+        translate_text("Record timings (from the next rerun)", target_language),
+        value=st.session_state.get("record_timings", instrumentation.enabled))
+    traces = st.session_state.get("rerun_traces", [])
+    if not traces:
+        st.info(translate_text("No reruns recorded yet.", target_language))
+    else:
+        st.dataframe(pd.DataFrame(
+            [(datetime.datetime.fromtimestamp(trace.started_at).strftime("%H:%M:%S"), trace.label,
+              round(trace.duration, 1), len(trace.spans) + trace.dropped) for trace in reversed(traces)],
+            columns=["Started", "Page", "Duration (ms)", "Spans"],
+        ), hide_index=True, use_container_width=True)
+
+        trace = traces[-1]
+        st.subheader(translate_text("Last recorded rerun", target_language))
+        st.dataframe(pd.DataFrame([(name, calls, round(total, 2)) for name, (calls, total) in trace.totals().items()],
+                                  columns=["Span", "Calls", "Total (ms)"]), hide_index=True, use_container_width=True)
+        with st.expander(translate_text("Timeline", target_language)):
+            st.dataframe(pd.DataFrame(
+                [("  " * depth + name, start, duration, error) for name, start, duration, depth, error in trace.spans],
+                columns=["Span", "Start (ms)", "Duration (ms)", "Error"],
+            ), hide_index=True, use_container_width=True)
+            if trace.dropped:
+                st.caption(f"{trace.dropped} more spans were not kept.")
+
+    # Reference data cache of this process: hit ratio and the age of the rows it served
+    st.subheader(translate_text("Reference data cache", target_language))
+    st.dataframe(pd.DataFrame.from_dict(get_reference_cache().stats(), orient="index"), use_container_width=True)
+
+    with st.expander(translate_text("Prometheus metrics", target_language)):
+        st.code(instrumentation.prometheus_text(), language="text")
+
 # Function to Manage Suppliers (Manager)
 def manage_suppliers():
     if not st.session_state.logged_in or st.session_state.user_type != "Manager":
         st.error(translate_text("You must be logged in as a manager!", target_language))
         return
+    import bulk_io
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    # Display Current Suppliers
-    cursor.execute("SELECT S_ID, S_name, S_address, S_phone FROM Supplier")
-    suppliers = cursor.fetchall()
+    # Display Current Suppliers (cached; every Add/Update/Delete below invalidates the list)
+    suppliers = service.list_suppliers(conn)
 
     if suppliers:
         df = pd.DataFrame(suppliers, columns=["Supplier ID", "Name", "Address", "Phone"])
         st.subheader(translate_text("Manage Suppliers", target_language))
         st.table(df)
 
-    action = st.selectbox(translate_text("Choose Action", target_language), ["Add", "Update", "Delete"])
+    action = st.selectbox(translate_text("Choose Action", target_language), ["Add", "Update", "Delete", "Import File", "Export"])
 
     if action == "Add":
         s_name = st.text_input(translate_text("Supplier Name", target_language))
@@ -448,119 +554,156 @@ def manage_suppliers():
         s_phone = st.text_input(translate_text("Supplier Phone", target_language))
 
         if st.button(translate_text("Add Supplier", target_language)):
-            cursor.execute("INSERT INTO Supplier (S_name, S_address, S_phone) VALUES (%s, %s, %s)",
-                           (s_name, s_address, s_phone))
-            conn.commit()
-            st.success(translate_text("Supplier added successfully!", target_language))
+            try:
+                service.add_supplier(conn, s_name, s_address, s_phone)
+                st.success(translate_text("Supplier added successfully!", target_language))
+            except ValueError as err:
+                st.error(str(err))
 
     elif action == "Update":
         supplier_id = st.number_input(translate_text("Enter Supplier ID to Update", target_language), min_value=1, step=1)
-        cursor.execute("SELECT S_name, S_address, S_phone FROM Supplier WHERE S_ID = %s", (supplier_id,))
-        supplier = cursor.fetchone()
+        supplier = next((row for row in suppliers if row[0] == supplier_id), None)
         if supplier:
-            current_name, current_address, current_phone = supplier
+            _, current_name, current_address, current_phone = supplier
             new_name = st.text_input(translate_text("New Name (Leave blank to keep current)", target_language), value=current_name)
             new_address = st.text_input(translate_text("New Address (Leave blank to keep current)", target_language), value=current_address)
             new_phone = st.text_input(translate_text("New Phone (Leave blank to keep current)", target_language), value=current_phone)
             
             if st.button(translate_text("Update Supplier", target_language)):
-                update_fields = []
-                values = []
-                
-                if new_name and new_name != current_name:
-                    update_fields.append("S_name = %s")
-                    values.append(new_name)
-                
-                if new_address and new_address != current_address:
-                    update_fields.append("S_address = %s")
-                    values.append(new_address)
-                
-                if new_phone and new_phone != current_phone:
-                    update_fields.append("S_phone = %s")
-                    values.append(new_phone)
-                if update_fields:
-                    query = f"UPDATE Supplier SET {', '.join(update_fields)} WHERE S_ID = %s"
-                    values.append(supplier_id)
-                    
-                    cursor.execute(query, tuple(values))
-                    conn.commit()
-                    st.success(translate_text("Supplier updated successfully!", target_language))
+                try:
+                    if service.update_supplier(conn, supplier_id, new_name, new_address, new_phone):
+                        st.success(translate_text("Supplier updated successfully!", target_language))
+                except (ValueError, service.NotFoundError) as err:
+                    st.error(str(err))
             else:
                 st.info(translate_text("No changes were made.", target_language))
 
     elif action == "Delete":
         supplier_id_to_delete = st.number_input(translate_text("Enter Supplier ID to Delete", target_language), min_value=1, step=1)
         if st.button(translate_text("Delete Supplier", target_language)):
-            cursor.execute("SELECT S_name FROM Supplier WHERE S_ID = %s", (supplier_id_to_delete,))
-            supplier = cursor.fetchone()
-            
-            if supplier:
-                supplier_name = supplier[0]
-                cursor.execute("DELETE FROM Supplier WHERE S_ID = %s", (supplier_id_to_delete,))
-                conn.commit()
+            try:
+                supplier_name = service.delete_supplier(conn, supplier_id_to_delete)
                 st.success(translate_text(f"Supplier {supplier_name} (ID: {supplier_id_to_delete}) deleted successfully!", target_language))
-            else:
+            except service.NotFoundError:
                 st.warning(translate_text("Supplier ID not found.", target_language))
 
+    # Bulk load a supplier list or a distributor's catalogue (drugs, supplies, received stock) from CSV or Parquet;
+    # stock can only be received into the manager's own store
+    elif action == "Import File":
+        kind = st.selectbox(translate_text("Data", target_language), list(bulk_io.IMPORT_SPECS))
+        st.caption(f"{translate_text('Columns', target_language)}: {', '.join(bulk_io.IMPORT_SPECS[kind].columns)}")
+        uploaded_file = st.file_uploader(translate_text("CSV or Parquet file", target_language),
+                                         type=["csv", "parquet"])
+        if uploaded_file is not None and st.button(translate_text("Import", target_language)):
+            rejects_path = os.path.join(tempfile.mkdtemp(), "rejected_rows.csv")
+            try:
+                with st.spinner(translate_text("Importing...", target_language)):
+                    result = bulk_io.import_file(conn, kind, uploaded_file, bulk_io.detect_format(uploaded_file.name),
+                                                 rejects=rejects_path, store=st.session_state.user_id)
+                st.success(f"{translate_text('Imported rows', target_language)}: {result.imported:,} / {result.rows:,} "
+                           f"({result.rows / result.seconds if result.seconds else 0:,.0f} rows/s)")
+                if result.rejected:
+                    with open(rejects_path, "rb") as f:
+                        st.download_button(f"{translate_text('Download rejected rows', target_language)} "
+                                           f"({result.rejected:,})", f.read(), "rejected_rows.csv", "text/csv")
+            except (ValueError, RuntimeError) as err:
+                st.error(str(err))
+            except DB_ERRORS as err:
+                st.error(f"Database error: {err}")
+
+    elif action == "Export":
+        table = st.selectbox(translate_text("Table", target_language), list(bulk_io.EXPORT_KEYS))
+        fmt = st.selectbox(translate_text("Format", target_language), ["csv", "parquet"])
+        if st.button(translate_text("Prepare Export", target_language)):
+            path = os.path.join(tempfile.mkdtemp(), f"{table}.{fmt}")
+            try:
+                bulk_io.export_table(conn, table, path, fmt)
+                with open(path, "rb") as f:
+                    st.download_button(translate_text("Download", target_language), f.read(), f"{table}.{fmt}")
+            except (ValueError, RuntimeError) as err:
+                st.error(str(err))
+            except DB_ERRORS as err:
+                st.error(f"Database error: {err}")
 
-    cursor.close()
     conn.close()
-# Function to get medicine details
-def get_medicine_details(medicine_data):
-    print(f"DEBUG: Scanned data: {medicine_data}")  # Print the QR code data for debugging
-    # Example data retrieval logic (you can replace this with your DB query or API call)
-    medicine_info = {
-        "Medicine ID: 1\nName: Paracetamol": "Used for pain relief and fever reduction.",
-        "Medicine ID: 2\nName: Aspirin": "Used for pain relief and to reduce inflammation.",
-        "Medicine ID: 3\nName: Ibuprofen": "Used to reduce fever, pain, and inflammation."
-    }
-    return medicine_info.get(medicine_data, "Medicine details not found.")
-# QR Code Scanner UI
+# QR Code Scanner UI: every QR label in the photo is looked up in the Drugs table, so a whole shelf can be
+# scanned at once
 def qr_code_scanner_ui():
     st.title(translate_text("📲 QR Code Scanner for Medicine Info", target_language))
     
     uploaded_file = st.file_uploader("Upload a QR Code Image", type=["png", "jpg", "jpeg"])
     
     if uploaded_file is not None:
-        qr_result = scan_qr_from_image(uploaded_file)
+        conn = get_db_connection()
+        try:
+            results = service.scan_qr(conn, uploaded_file.getvalue())
+        except DB_ERRORS as err:
+            st.error(f"Database error: {err}")
+            return
+        finally:
+            conn.close()
 
-        if qr_result:
-            medicine_details = get_medicine_details(qr_result)
-            st.success(medicine_details)
-        else:
+        if not results:
             st.error("❌ No QR code detected.")
+        for result in results:
+            if result.details:
+                details = result.details
+                st.success(f"✅ {details['D_name']} (ID {details['D_ID']}): {details['D_use']} — "
+                           f"{translate_text('In stock', target_language)}: {details['Stock']}, "
+                           f"{translate_text('Expires', target_language)}: {details['Expiry_date']}")
+            else:
+                st.warning(f"{translate_text('Medicine details not found.', target_language)} ({result.payload})")
 
-# Scan QR Code from an uploaded image
-def scan_qr_from_image(uploaded_file):
-    image = Image.open(uploaded_file)
-    decoded_objects = decode(image)
-    if decoded_objects:
-        return decoded_objects[0].data.decode("utf-8")
-    else:
-        return None
-# Chat with Gemini AI
+# Stream the assistant's reply into a placeholder as it arrives; the session keeps recent turns and a summary.
+# Matching stock, supplier and (for a logged-in customer) order data is retrieved locally and sent along.
+@traced("chat")
 def chat_with_gemini(user_input):
-    st.session_state.chat_history.append(("User", user_input))
-    response = model.generate_content(user_input)
-    bot_reply = response.text if response.text else translate_text("Sorry, I couldn't process that.", target_language)
-    st.session_state.chat_history.append(("Gemini", bot_reply))
-    return bot_reply
+    from chatbot_service import get_chat_service
+    from retrieval import get_retriever
+
+    customer_id = st.session_state.user_id if st.session_state.user_type == "Customer" else None
+    conn = get_db_connection()
+    try:
+        context = get_retriever().context_for(conn, user_input, customer_id)
+    except DB_ERRORS as err:
+        print(f"Chat retrieval failed: {err}")
+        context = None
+    finally:
+        conn.close()
+
+    placeholder = st.empty()
+    reply = ""
+    try:
+        for part in get_chat_service().stream_reply(st.session_state.chat_session, user_input, context):
+            reply += part
+            placeholder.markdown(reply + "▌")
+    except Exception as e:
+        st.error(translate_text("Sorry, I couldn't process that.", target_language) + f" ({e})")
+        return None
+    placeholder.markdown(reply)
+    return reply
 
 # Streamlit Chatbot UI
 def chatbot_ui():
+    from chatbot_service import ChatSession
+
     st.title(translate_text("Virtual Chatbot Assistance", target_language))
 
-    for role, message in st.session_state.chat_history:
-        with st.chat_message(role):
+    if "chat_session" not in st.session_state:
+        st.session_state.chat_session = ChatSession()  # Recent chat turns plus a summary of older ones
+    session = st.session_state.chat_session
+    if session.summary:
+        st.caption(translate_text("Earlier messages have been summarized.", target_language))
+    for role, message in session.turns:
+        with st.chat_message("User" if role == "user" else "Gemini"):
             st.write(message)
 
     user_input = st.chat_input(translate_text("Ask me anything...", target_language))
     if user_input:
-        bot_reply = chat_with_gemini(user_input)
         with st.chat_message("User"):
             st.write(user_input)
         with st.chat_message("Gemini"):
-            st.write(bot_reply)
+            chat_with_gemini(user_input)
 
 # Main Application for Pharmacy Management System
 def main_pharmacy():
@@ -605,24 +748,36 @@ def main_pharmacy():
 
         elif st.session_state.user_type == "Manager":
             st.subheader(translate_text("Welcome, Manager!", target_language))
-            choice = st.selectbox(translate_text("Choose an option:", target_language), ["View Inventory", "Manage Suppliers", "See Sales"])
+            choice = st.selectbox(translate_text("Choose an option:", target_language),
+                                  ["View Inventory", "Manage Suppliers", "See Sales", "Sales Dashboard",
+                                   "Reorder Suggestions", "Expiring Stock", "Debug Panel"])
             if choice == "View Inventory":
                 view_inventory()
             elif choice == "Manage Suppliers":
                 manage_suppliers()
             elif choice == "See Sales":
                 view_sales()
+            elif choice == "Sales Dashboard":
+                sales_dashboard()
+            elif choice == "Reorder Suggestions":
+                reorder_suggestions()
+            elif choice == "Expiring Stock":
+                expiring_stock()
+            elif choice == "Debug Panel":
+                debug_panel()
 
         if st.button(translate_text("Logout", target_language)):
             st.session_state.logged_in = False
             st.session_state.user_type = None
             st.session_state.user_id = None
+            st.session_state.auth_token = None
             st.success(translate_text("You have been logged out. Please refresh the page.", target_language))
 
 # Add navigation to the app
 def app_navigation():
     st.sidebar.title(translate_text("Navigation", target_language))
     page = st.sidebar.radio(translate_text("Choose a page:", target_language), ["Pharmacy Management", "AI Chatbot", "QR Code Scanner"])
+    get_instrumentation().set_label(page)
 
     if page == "Pharmacy Management":
         main_pharmacy()
@@ -633,3 +788,7 @@ def app_navigation():
 
 if __name__ == "__main__":
     app_navigation()
+    # Keep this session's most recent rerun traces for the Debug Panel
+    trace = get_instrumentation().end_rerun()
+    if trace is not None:
+        st.session_state.rerun_traces = (st.session_state.get("rerun_traces", []) + [trace])[-20:]
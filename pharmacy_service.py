@@ -0,0 +1,252 @@
+import base64
+import datetime
+import decimal
+import json
+
+from auth import USER_TABLES, get_authenticator
+from inventory_batches import expiring_within, restock, write_off_expired
+from inventory_feed import recent_events
+from order_pipeline import OrderLine
+from paged_queries import (INVENTORY_COLUMNS, INVENTORY_SORTS, ORDERS_COLUMNS, SALES_COLUMNS, SALES_SORTS,
+                           fetch_inventory_page, fetch_orders_page, fetch_sales_page)
+from reference_cache import get_reference_cache
+from stores import get_store_registry
+from validators import validate_phone
+
+# The operations behind the app's pages, independent of Streamlit. Every function takes a primary database
+# connection and plain values; the Streamlit pages and the HTTP API (api_server.py) are both clients.
+# Bad input raises ValueError, unknown IDs NotFoundError, and a basket nobody can fill InsufficientStockError.
+
+
+class NotFoundError(Exception):
+    pass
+
+
+# Keyset cursors of a view spanning store databases ({pool name: sort values}) as an opaque URL-safe token.
+# Values keep their type, since SQLite compares text and numbers differently.
+def encode_cursor(cursors):
+    def tag(value):
+        if isinstance(value, datetime.datetime):
+            return {"dt": value.isoformat()}
+        if isinstance(value, datetime.date):
+            return {"d": value.isoformat()}
+        if isinstance(value, decimal.Decimal):
+            return {"n": str(value)}
+        return value
+
+    if cursors is None:
+        return None
+    data = json.dumps({name: [tag(value) for value in values] for name, values in cursors.items()})
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, width):
+    def untag(value):
+        if isinstance(value, dict):
+            if "dt" in value:
+                return datetime.datetime.fromisoformat(value["dt"])
+            if "d" in value:
+                return datetime.date.fromisoformat(value["d"])
+            return decimal.Decimal(value["n"])
+        return value
+
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        cursors = {name: tuple(untag(value) for value in values) for name, values in data.items()}
+    except (ValueError, TypeError, KeyError, AttributeError, decimal.InvalidOperation):
+        raise ValueError("Invalid page cursor")
+    if any(len(values) != width for values in cursors.values()):
+        raise ValueError("Invalid page cursor")
+    return cursors
+
+
+# Signed session token for valid credentials, None otherwise
+def login(conn, username, password, user_type):
+    if user_type not in USER_TABLES:
+        raise ValueError(f"Unknown user type: {user_type}")
+    user_id = get_authenticator().authenticate(conn, username, password, user_type)
+    if user_id is None:
+        return None
+    return get_authenticator().issue_token(user_type, user_id)
+
+
+# (D_ID, D_name, largest single-store stock) of every stocked drug, from the reference cache
+def drug_stock(conn):
+    return get_reference_cache().get(conn, "drug_stock")
+
+
+# Place an order for [(D_ID, quantity)] at one store; returns (store ID or None, [(OrderLine, M_ID)])
+def place_order(conn, customer_id, items):
+    if not items:
+        raise ValueError("The order has no lines")
+    drug_ids = sorted({int(drug_id) for drug_id, _ in items})
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT D_ID, D_name FROM Drugs WHERE D_ID IN ({', '.join(['%s'] * len(drug_ids))})", drug_ids)
+    names = dict(cursor.fetchall())
+    cursor.close()
+    unknown = [drug_id for drug_id in drug_ids if drug_id not in names]
+    if unknown:
+        raise NotFoundError(f"Unknown drug: {', '.join(map(str, unknown))}")
+    lines = [OrderLine(int(drug_id), names[int(drug_id)], int(quantity)) for drug_id, quantity in items]
+    result = get_store_registry().route_order(conn, customer_id, lines)
+    get_reference_cache().invalidate("drug_stock")
+    return result
+
+
+def customer_orders(conn, customer_id, after=None, page_size=50):
+    return get_store_registry().fan_out_page(
+        lambda store_conn, group, cursor: fetch_orders_page(store_conn, customer_id, cursor, page_size),
+        ORDERS_COLUMNS, ("Order_ID",), True, after, page_size, conn=conn,
+    )
+
+
+def inventory_page(conn, after=None, page_size=50, store_id=None, sort="Drug ID"):
+    if sort not in INVENTORY_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    return get_store_registry().fan_out_page(
+        lambda store_conn, group, cursor: fetch_inventory_page(store_conn, cursor, page_size, store_id, sort),
+        INVENTORY_COLUMNS, *INVENTORY_SORTS[sort], after, page_size,
+        store_ids=None if store_id is None else [store_id], conn=conn,
+    )
+
+
+def sales_page(conn, after=None, page_size=50, date_from=None, date_to=None, store_id=None, sort="Newest first"):
+    if sort not in SALES_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    return get_store_registry().fan_out_page(
+        lambda store_conn, group, cursor: fetch_sales_page(store_conn, cursor, page_size, date_from, date_to,
+                                                           store_id, sort),
+        SALES_COLUMNS, *SALES_SORTS[sort], after, page_size,
+        store_ids=None if store_id is None else [store_id], conn=conn,
+    )
+
+
+# Stores holding at least `quantity` units of the named drug (a FanOutResult of StoreStock rows)
+def find_stock(conn, drug_name, quantity=1):
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    return get_store_registry().find_stock(conn, drug_name, quantity)
+
+
+# Newest stock movements of one store or all of them. Event IDs are per database, so movements from several
+# store databases are merged by time.
+def stock_movements(conn, store_id=None, limit=50):
+    events = get_store_registry().fan_out(lambda store_conn, group: recent_events(store_conn, store_id, limit),
+                                          None if store_id is None else [store_id], conn).rows
+    return sorted(events, key=lambda event: event.Created_at, reverse=True)[:limit]
+
+
+# Batches expiring within `days`, soonest first: (Batch_ID, D_ID, D_name, M_ID, Expiry_date, Qty)
+def expiring_batches(conn, days, store_id=None):
+    if days < 0:
+        raise ValueError("Days must not be negative")
+    rows = get_store_registry().fan_out(lambda store_conn, group: expiring_within(store_conn, days, store_id),
+                                        None if store_id is None else [store_id], conn).rows
+    return sorted(rows, key=lambda row: (row[4], row[0]))
+
+
+# Add stock to the manager's own store; returns the store's new Rem_qty
+def restock_store(conn, store_id, drug_id, quantity, expiry_date=None):
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    registry = get_store_registry()
+    with registry.connection(store_id, conn) as store_conn:
+        registry.replicate(conn, store_id, store_conn, "Drugs", [drug_id])
+        rem_qty = restock(store_conn, drug_id, store_id, quantity, expiry_date)
+    get_reference_cache().invalidate("drug_stock")
+    return rem_qty
+
+
+# Units of expired stock written off at the store
+def write_off_store(conn, store_id):
+    with get_store_registry().connection(store_id, conn) as store_conn:
+        units = write_off_expired(store_conn, store_id)
+    get_reference_cache().invalidate("drug_stock")
+    return units
+
+
+# (S_ID, S_name, S_address, S_phone) rows, from the reference cache
+def list_suppliers(conn):
+    return get_reference_cache().get(conn, "suppliers")
+
+
+def _supplier_changed(supplier_id):
+    from retrieval import get_retriever
+
+    get_retriever().mark_changed("supplier", supplier_id)
+    get_reference_cache().invalidate("suppliers")
+
+
+def _check_supplier_phone(phone):
+    valid, error = validate_phone(phone)
+    if not valid:
+        raise ValueError(error)
+
+
+def add_supplier(conn, name, address, phone):
+    if not name:
+        raise ValueError("Supplier name is required")
+    if phone:
+        _check_supplier_phone(phone)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Supplier (S_name, S_address, S_phone) VALUES (%s, %s, %s)", (name, address, phone))
+    conn.commit()
+    supplier_id = cursor.lastrowid
+    cursor.close()
+    _supplier_changed(supplier_id)
+    return supplier_id
+
+
+# Change the given fields (None or empty keeps the current value); returns False when nothing changed
+def update_supplier(conn, supplier_id, name=None, address=None, phone=None):
+    cursor = conn.cursor()
+    cursor.execute("SELECT S_name, S_address, S_phone FROM Supplier WHERE S_ID = %s", (supplier_id,))
+    current = cursor.fetchone()
+    if current is None:
+        cursor.close()
+        raise NotFoundError(f"Supplier {supplier_id} not found")
+    if phone and phone != current[2]:
+        _check_supplier_phone(phone)
+    fields, values = [], []
+    for column, value, old in zip(("S_name", "S_address", "S_phone"), (name, address, phone), current):
+        if value and value != old:
+            fields.append(f"{column} = %s")
+            values.append(value)
+    if fields:
+        cursor.execute(f"UPDATE Supplier SET {', '.join(fields)} WHERE S_ID = %s", values + [supplier_id])
+        conn.commit()
+    cursor.close()
+    if fields:
+        _supplier_changed(supplier_id)
+    return bool(fields)
+
+
+# Name of the deleted supplier
+def delete_supplier(conn, supplier_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT S_name FROM Supplier WHERE S_ID = %s", (supplier_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.close()
+        raise NotFoundError(f"Supplier {supplier_id} not found")
+    cursor.execute("DELETE FROM Supplier WHERE S_ID = %s", (supplier_id,))
+    conn.commit()
+    cursor.close()
+    _supplier_changed(supplier_id)
+    return row[0]
+
+
+# {D_ID: details} for drug IDs typed in or read from a label
+def drug_details(conn, drug_ids):
+    from qr_lookup import get_qr_scanner
+
+    return get_qr_scanner().drug_details(conn, sorted(set(drug_ids)))
+
+
+# One ScanResult per QR code in the image
+def scan_qr(conn, image):
+    from qr_lookup import get_qr_scanner
+
+    return get_qr_scanner().scan(conn, image)
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import io
+import re
+import threading
+from collections import namedtuple
+
+import db_pool
+from cache_utils import LRUCache, TTLCache
+from stores import get_store_registry
+
+# Labels from generate_qr_codes.py read "Medicine ID: N\nName: X"; bare IDs and "D_ID: N" are accepted too
+PAYLOAD_PATTERNS = [
+    re.compile(r"^\s*(\d+)\s*$"),
+    re.compile(r"(?:medicine\s*id|d_id|drug)\s*[:=/#]\s*(\d+)", re.IGNORECASE),
+]
+MAX_DECODE_SIDE = 1024
+
+ScanResult = namedtuple("ScanResult", ["payload", "drug_id", "details"])
+
+
+def parse_payload(payload):
+    for pattern in PAYLOAD_PATTERNS:
+        match = pattern.search(payload)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def _decode(image):
+    from pyzbar.pyzbar import ZBarSymbol, decode
+
+    seen = []
+    for symbol in decode(image, symbols=[ZBarSymbol.QRCODE]):
+        payload = symbol.data.decode("utf-8", errors="replace")
+        if payload not in seen:
+            seen.append(payload)
+    return seen
+
+
+# Every QR payload in an image, in the order zbar finds them. Large images are first decoded greyscaled and
+# downscaled so their longest side is max_side; if that finds nothing, the full resolution is tried once.
+# PIL and pyzbar are imported here, so looking up drug details does not need the zbar library.
+def decode_image(data, max_side=MAX_DECODE_SIDE):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if max(image.size) > max_side:
+        small = Image.open(io.BytesIO(data))
+        small.draft("L", (max_side, max_side))  # JPEGs decode straight to a reduced greyscale image
+        small = small.convert("L")
+        small.thumbnail((max_side, max_side))
+        payloads = _decode(small)
+        if payloads:
+            return payloads
+    return _decode(image.convert("L"))
+
+
+# Resolves scanned labels to Drugs rows. Decodes are cached by image hash and drug details by D_ID.
+class QRScanner:
+    def __init__(self, decode_cache_size=256, details_cache_size=4096, details_ttl=60):
+        self._decoded = LRUCache(maxsize=decode_cache_size)
+        self._details = TTLCache(maxsize=details_cache_size, ttl=details_ttl)
+        self._lock = threading.Lock()
+        self._stats = {"decodes": 0}
+
+    def decode(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        payloads = self._decoded.get(key)
+        if payloads is None:
+            with self._lock:
+                self._stats["decodes"] += 1
+            payloads = decode_image(data)
+            self._decoded.put(key, payloads)
+        return payloads
+
+    # {D_ID: details} for the given IDs; cache misses are loaded with one query on the Drugs key, and their
+    # unexpired stock from every store database
+    def drug_details(self, conn, drug_ids):
+        found = {}
+        missing = []
+        for drug_id in drug_ids:
+            details = self._details.get(drug_id)
+            if details is None:
+                missing.append(drug_id)
+            else:
+                found[drug_id] = details
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"SELECT D_ID, D_name, D_use, Expiry_date FROM Drugs WHERE D_ID IN ({placeholders})",
+                           missing)
+            rows = cursor.fetchall()
+            cursor.close()
+            stock = {row["D_ID"]: 0 for row in rows}
+            if stock:
+                for _, drug_id, units in get_store_registry().unexpired_stock(conn, sorted(stock)).rows:
+                    stock[drug_id] += units
+            for row in rows:
+                row["Stock"] = stock[row["D_ID"]]
+                self._details.put(row["D_ID"], row)
+                found[row["D_ID"]] = row
+        return found
+
+    # One ScanResult per QR code in the image; details is None for unknown drugs or unreadable payloads
+    def scan(self, conn, data):
+        payloads = self.decode(data)
+        drug_ids = [parse_payload(payload) for payload in payloads]
+        details = self.drug_details(conn, sorted({d for d in drug_ids if d is not None}))
+        return [ScanResult(payload, drug_id, details.get(drug_id)) for payload, drug_id in zip(payloads, drug_ids)]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(decode_hits=self._decoded.hits, details_hits=self._details.hits,
+                     details_misses=self._details.misses)
+        return stats
+
+
+_scanner = None
+_scanner_lock = threading.Lock()
+
+
+def get_qr_scanner():
+    global _scanner
+    with _scanner_lock:
+        if _scanner is None:
+            _scanner = QRScanner()
+        return _scanner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode QR labels in images and look the drugs up")
+    parser.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    with db_pool.connection() as conn:
+        for path in args.images:
+            with open(path, "rb") as f:
+                for result in get_qr_scanner().scan(conn, f.read()):
+                    name = result.details["D_name"] if result.details else "not found"
+                    print(f"{path}: {result.payload!r} -> {result.drug_id} ({name})")
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache_utils import TTLCache
+
+
+# Drugs with their largest single-store stock, from every store database
+def load_drug_stock(conn):
+    from stores import get_store_registry
+
+    return get_store_registry().drug_stock(conn)
+
+
+# Reference data the pages re-read on every rerun, keyed by dataset name: a query, or a function of the
+# connection for data that does not come from the primary database alone
+REFERENCE_QUERIES = {
+    "drug_stock": load_drug_stock,
+    "suppliers": "SELECT S_ID, S_name, S_address, S_phone FROM Supplier",
+    "managers": "SELECT M_ID, M_name FROM Manager ORDER BY M_ID",
+}
+
+
+# Version counters and loaded datasets shared by every app process on the host, in one SQLite file
+class ReferenceStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "name TEXT NOT NULL, version INTEGER NOT NULL, loaded_at REAL NOT NULL, rows TEXT NOT NULL, "
+            "PRIMARY KEY (name, version))"
+        )
+        self._conn.commit()
+
+    def version(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    # Move the dataset to a new version; entries stored under older versions are dropped
+    def bump(self, name):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO versions (name, version) VALUES (?, 1) "
+                "ON CONFLICT (name) DO UPDATE SET version = version + 1", (name,)
+            )
+            version = self._conn.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()[0]
+            self._conn.execute("DELETE FROM entries WHERE name = ? AND version < ?", (name, version))
+            self._conn.commit()
+        return version
+
+    # (loaded_at, rows) stored for this version, or None
+    def get(self, name, version):
+        with self._lock:
+            row = self._conn.execute("SELECT loaded_at, rows FROM entries WHERE name = ? AND version = ?",
+                                     (name, version)).fetchone()
+        if row is None:
+            return None
+        return row[0], [tuple(values) for values in json.loads(row[1])]
+
+    def put(self, name, version, loaded_at, rows):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO entries (name, version, loaded_at, rows) VALUES (?, ?, ?, ?)",
+                               (name, version, loaded_at, json.dumps(rows, default=str)))
+            self._conn.commit()
+
+
+# Read-through cache of the reference datasets. A dataset is cached under (name, version): a write path
+# calls invalidate() after committing, which bumps the version in the shared store, so every process stops
+# using its copy on its next read. Rows loaded by one process are shared with the others through the store.
+# Entries also expire after `ttl` seconds, which bounds staleness after edits made outside the app.
+class ReferenceCache:
+    def __init__(self, store, ttl=300, queries=REFERENCE_QUERIES, clock=time.time):
+        self.store = store
+        self.ttl = ttl
+        self.queries = queries
+        self._clock = clock
+        self._memory = TTLCache(maxsize=4 * len(queries), ttl=ttl, clock=clock)
+        self._lock = threading.Lock()
+        self._stats = {name: {"hits": 0, "shared_hits": 0, "loads": 0, "invalidations": 0, "load_seconds": 0.0,
+                              "age_seconds": 0.0, "max_age_seconds": 0.0} for name in queries}
+
+    def _served(self, name, kind, loaded_at):
+        age = max(0.0, self._clock() - loaded_at)
+        with self._lock:
+            stats = self._stats[name]
+            stats[kind] += 1
+            stats["age_seconds"] += age
+            stats["max_age_seconds"] = max(stats["max_age_seconds"], age)
+
+    # The dataset's rows, loaded with `conn` only when no current copy is cached
+    def get(self, conn, name):
+        version = self.store.version(name)
+        entry = self._memory.get((name, version))
+        if entry is not None:
+            self._served(name, "hits", entry[0])
+            return entry[1]
+
+        entry = self.store.get(name, version)
+        if entry is not None and entry[0] + self.ttl > self._clock():
+            self._memory.put((name, version), entry, ttl=entry[0] + self.ttl - self._clock())
+            self._served(name, "shared_hits", entry[0])
+            return entry[1]
+
+        start = time.perf_counter()
+        query = self.queries[name]
+        if callable(query):
+            rows = [tuple(row) for row in query(conn)]
+        else:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            rows = [tuple(row) for row in cursor.fetchall()]
+            cursor.close()
+        loaded_at = self._clock()
+        with self._lock:
+            self._stats[name]["load_seconds"] += time.perf_counter() - start
+        # Stored under the version read before loading: if a write bumped it meanwhile, nobody reads this copy
+        self.store.put(name, version, loaded_at, rows)
+        self._memory.put((name, version), (loaded_at, rows))
+        self._served(name, "loads", loaded_at)
+        return rows
+
+    # Call after committing a write that changes the dataset
+    def invalidate(self, *names):
+        for name in names:
+            self.store.bump(name)
+            with self._lock:
+                self._stats[name]["invalidations"] += 1
+
+    # {dataset: counters}; hit_ratio counts both in-process and shared hits, mean_age_seconds is the average
+    # age of the rows served
+    def stats(self):
+        with self._lock:
+            stats = {name: dict(values) for name, values in self._stats.items()}
+        for values in stats.values():
+            served = values["hits"] + values["shared_hits"] + values["loads"]
+            values["hit_ratio"] = round((values["hits"] + values["shared_hits"]) / served, 4) if served else 0.0
+            age = values.pop("age_seconds")
+            values["mean_age_seconds"] = round(age / served, 3) if served else 0.0
+            values["max_age_seconds"] = round(values["max_age_seconds"], 3)
+            values["load_seconds"] = round(values["load_seconds"], 6)
+        return stats
+
+
+def reference_cache_from_env():
+    env = os.environ
+    store = ReferenceStore(env.get("PHARMACY_REFERENCE_CACHE", "reference_cache.db"))
+    return ReferenceCache(store, ttl=float(env.get("PHARMACY_REFERENCE_TTL", "300")))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_reference_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = reference_cache_from_env()
+        return _cache
+
+
+# Counters of this process's cache, or {} before it is first used
+def reference_cache_metrics():
+    return _cache.stats() if _cache is not None else {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Invalidate cached reference data, e.g. after editing tables by hand")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help=f"Datasets to invalidate ({', '.join(sorted(REFERENCE_QUERIES))}); all by default")
+    args = parser.parse_args()
+
+    names = args.names or sorted(REFERENCE_QUERIES)
+    unknown = [name for name in names if name not in REFERENCE_QUERIES]
+    if unknown:
+        parser.error("unknown dataset: " + ", ".join(unknown))
+    get_reference_cache().invalidate(*names)
+    print("Invalidated " + ", ".join(names))
@@ -0,0 +1,192 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+import db_pool
+from cache_utils import TTLCache
+from stores import get_store_registry
+
+HISTORY_DAYS = 730
+SERVICE_LEVEL_Z = 1.65  # safety stock for roughly a 95% chance of not running out during the lead time
+
+_suggestion_cache = TTLCache(maxsize=16, ttl=600)
+
+
+# Dense (drugs x days) demand matrix from sparse (row, day, quantity) entries
+def build_demand_matrix(rows, days, quantities, drug_count, day_count):
+    flat = np.bincount(rows * day_count + days, weights=quantities, minlength=drug_count * day_count)
+    return flat.reshape(drug_count, day_count)
+
+
+# Units ordered per drug per day from the inventory feed of every store database: (drug_ids, matrix[drug,
+# day]) for the `days` days ending on end_date. Orders and Sale_Item carry no dates, so order events are the
+# dated demand history.
+def load_demand_history(conn, days=HISTORY_DAYS, end_date=None, chunk_size=100000):
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days - 1)
+
+    def query(store_conn, group):
+        if store_conn.backend == "mysql":
+            day = "DATEDIFF(Created_at, %s)"
+        else:
+            day = "CAST(julianday(Created_at) - julianday(%s) AS INTEGER)"
+        cursor = store_conn.cursor()
+        cursor.execute(
+            f"SELECT D_ID, {day} AS Day, -SUM(Delta) FROM InventoryEvent "
+            "WHERE Reason = 'order' AND Created_at >= %s AND Created_at < %s GROUP BY D_ID, Day",
+            (start_date, start_date, end_date + datetime.timedelta(days=1)),
+        )
+        chunks = []
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            chunks.append(np.asarray(chunk, dtype=np.float64))
+        cursor.close()
+        return chunks
+
+    # A drug-day ordered in several databases has one entry per database; the matrix adds them up
+    chunks = get_store_registry().fan_out(query, conn=conn).rows
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.zeros((0, days))
+
+    history = np.concatenate(chunks)
+    unique_ids, rows = np.unique(history[:, 0].astype(np.int64), return_inverse=True)
+    return unique_ids, build_demand_matrix(rows, history[:, 1].astype(np.int64), history[:, 2], len(unique_ids), days)
+
+
+# Exponentially weighted daily demand rate and standard deviation for each row of a (drugs x days) matrix.
+# Recent days count more: a day `half_life` days ago weighs half as much as today.
+def demand_statistics(demand, half_life=28):
+    weights = 0.5 ** (np.arange(demand.shape[1])[::-1] / half_life)
+    weights /= weights.sum()
+    rate = demand @ weights
+    variance = np.maximum((demand * demand) @ weights - rate * rate, 0)
+    return rate, np.sqrt(variance)
+
+
+# Days of cover, reorder point and suggested order quantity per drug (all arrays).
+# A drug is reordered once its stock falls to the expected lead-time demand plus safety stock, up to enough
+# stock to last until the next review.
+def reorder_quantities(rate, std, stock, lead_time=7, review_period=7, z=SERVICE_LEVEL_Z):
+    safety = z * std * np.sqrt(lead_time)
+    reorder_point = rate * lead_time + safety
+    target = rate * (lead_time + review_period) + safety
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(rate > 0, stock / rate, np.inf)
+    quantity = np.where(stock <= reorder_point, np.ceil(np.maximum(target - stock, 0)), 0)
+    return days_of_cover, reorder_point, quantity
+
+
+# Unexpired units of every drug over all stores; expired lots are never sold, so they do not cover demand
+def _stock_levels(conn):
+    totals = {}
+    for _, drug_id, units in get_store_registry().unexpired_stock(conn).rows:
+        totals[drug_id] = totals.get(drug_id, 0) + units
+    cursor = conn.cursor()
+    cursor.execute("SELECT D_ID, D_name FROM Drugs")
+    stock = pd.DataFrame(cursor.fetchall(), columns=["D_ID", "Drug"]).set_index("D_ID")
+    cursor.close()
+    stock["Stock"] = stock.index.map(lambda drug_id: totals.get(drug_id, 0)).astype(float)
+    return stock
+
+
+# The supplier with the largest supply quantity for each drug
+def _preferred_suppliers(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT Supplies.D_ID, Supplies.S_ID, Supplier.S_name, Supplies.Qty FROM Supplies "
+        "JOIN Supplier ON Supplies.S_ID = Supplier.S_ID"
+    )
+    supplies = pd.DataFrame(cursor.fetchall(), columns=["D_ID", "S_ID", "Supplier", "Supply qty"])
+    cursor.close()
+    return (supplies.sort_values(["D_ID", "Supply qty"], ascending=[True, False])
+            .drop_duplicates("D_ID").set_index("D_ID"))
+
+
+# Drugs that should be reordered now, most urgent (fewest days of cover) first
+def suggest_reorders(conn, lead_time=7, review_period=7, half_life=28, days=HISTORY_DAYS, end_date=None,
+                     z=SERVICE_LEVEL_Z):
+    drug_ids, demand = load_demand_history(conn, days, end_date)
+    rate, std = demand_statistics(demand, half_life)
+    stock = _stock_levels(conn)
+    stock["Daily demand"] = pd.Series(rate, index=drug_ids).reindex(stock.index, fill_value=0.0)
+    deviation = pd.Series(std, index=drug_ids).reindex(stock.index, fill_value=0.0)
+
+    days_of_cover, reorder_point, quantity = reorder_quantities(
+        stock["Daily demand"].to_numpy(), deviation.to_numpy(), stock["Stock"].to_numpy(), lead_time,
+        review_period, z)
+    stock["Days of cover"] = days_of_cover
+    stock["Reorder point"] = np.ceil(reorder_point)
+    stock["Suggested qty"] = quantity.astype(np.int64)
+
+    suggestions = stock[stock["Suggested qty"] > 0].join(_preferred_suppliers(conn), how="left")
+    suggestions = suggestions.sort_values("Days of cover").reset_index()
+    suggestions["Daily demand"] = suggestions["Daily demand"].round(2)
+    suggestions["Days of cover"] = suggestions["Days of cover"].round(1)
+    return suggestions
+
+
+# suggest_reorders() cached for a few minutes so dashboard reruns do not recompute the forecast
+def cached_suggestions(conn, lead_time=7, review_period=7, half_life=28, refresh=False):
+    key = (lead_time, review_period, half_life, datetime.date.today())
+    suggestions = None if refresh else _suggestion_cache.get(key)
+    if suggestions is None:
+        suggestions = suggest_reorders(conn, lead_time, review_period, half_life)
+        _suggestion_cache.put(key, suggestions)
+    return suggestions
+
+
+# One purchase-order summary line per supplier
+def by_supplier(suggestions):
+    return (suggestions.fillna({"Supplier": "No supplier"})
+            .groupby(["S_ID", "Supplier"], as_index=False, dropna=False)
+            .agg(Drugs=("D_ID", "count"), Units=("Suggested qty", "sum"))
+            .sort_values("Units", ascending=False))
+
+
+# Time the vectorized forecast on random demand for `drugs` x `days` days of history
+def benchmark(drugs=10_000, days=HISTORY_DAYS, seed=42):
+    rng = np.random.default_rng(seed)
+    rates = rng.gamma(0.6, 4.0, size=drugs)
+    dense = rng.poisson(rates[:, None], size=(drugs, days)).astype(np.float64)
+    rows, day_index = np.nonzero(dense)
+    stock = rng.integers(0, 500, size=drugs).astype(np.float64)
+
+    start = time.perf_counter()
+    demand = build_demand_matrix(rows, day_index, dense[rows, day_index], drugs, days)
+    built = time.perf_counter()
+    rate, std = demand_statistics(demand)
+    days_of_cover, reorder_point, quantity = reorder_quantities(rate, std, stock)
+    finished = time.perf_counter()
+    print(f"{drugs} drugs x {days} days ({len(rows)} non-zero drug-days)")
+    print(f"  build matrix: {built - start:.3f}s")
+    print(f"      forecast: {finished - built:.3f}s")
+    print(f"  {int((quantity > 0).sum())} drugs to reorder")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suggest reorder quantities from recent demand")
+    parser.add_argument("--lead-time", type=int, default=7, help="Days between ordering and receiving stock")
+    parser.add_argument("--review-period", type=int, default=7, help="Days until the next reorder run")
+    parser.add_argument("--half-life", type=float, default=28, help="Days for a day's demand to count half as much")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, help="Last day of history (default: today)")
+    parser.add_argument("--output", help="Write the suggestions to this CSV file")
+    parser.add_argument("--bench", action="store_true", help="Time the forecast on random data instead")
+    parser.add_argument("--drugs", type=int, default=10_000, help="Drugs in the --bench data")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.drugs)
+    else:
+        started = time.perf_counter()
+        with db_pool.connection() as conn:
+            suggestions = suggest_reorders(conn, args.lead_time, args.review_period, args.half_life,
+                                           end_date=args.as_of)
+        print(by_supplier(suggestions).to_string(index=False))
+        print(f"{len(suggestions)} drugs to reorder ({time.perf_counter() - started:.2f}s)")
+        if args.output:
+            suggestions.to_csv(args.output, index=False)
@@ -0,0 +1,375 @@
+import argparse
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+import db_pool
+import inventory_feed
+from stores import get_store_registry
+
+STOP_WORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "have", "how",
+              "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "we", "what", "when", "where",
+              "which", "who", "with", "you", "your"}
+ORDER_WORDS = {"order", "orders", "ordered", "bought", "purchase", "purchased", "previous", "last"}
+
+# A scalar subquery so that loading a few drugs by key only seeks Sale_Item on their D_ID prefix. Stock comes
+# from the store databases (see PharmacyRetriever._load).
+DRUG_QUERY = (
+    "SELECT D_ID, D_name, D_use, Expiry_date, "
+    "(SELECT SUM(Total_price) * 1.0 / SUM(Sale_qty) FROM Sale_Item WHERE Sale_Item.D_ID = Drugs.D_ID) FROM Drugs"
+)
+SUPPLIER_QUERY = (
+    "SELECT Supplier.S_ID, Supplier.S_name, Supplier.S_address, Supplier.S_phone, "
+    "(SELECT GROUP_CONCAT(Drugs.D_name) FROM Supplies JOIN Drugs ON Supplies.D_ID = Drugs.D_ID "
+    "WHERE Supplies.S_ID = Supplier.S_ID) FROM Supplier"
+)
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", (text or "").casefold())
+            if word not in STOP_WORDS and len(word) > 1]
+
+
+# BM25 ranking over an in-memory inverted index. Each term keeps NumPy arrays of (row, term frequency), so a
+# query is a handful of vector operations. Documents can be replaced or removed one at a time: the old row is
+# only marked dead, and the index compacts itself once dead rows outnumber live ones.
+class TermIndex:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._rows = {}  # key -> row
+        self._keys = []
+        self._texts = []
+        self._displays = []
+        self._lengths = []
+        self._alive = []
+        self._postings = {}  # term -> ([rows], [tf])
+        self._arrays = {}  # term -> (rows, tf) as arrays, rebuilt after the term gains a row
+        self._df = {}
+        self._total_length = 0
+        self._row_arrays = None  # (lengths, alive) as arrays, rebuilt after any change
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        return list(self._rows)
+
+    # Index or replace a document. Returns False when the indexed text is unchanged, in which case only the
+    # text shown for the document is updated.
+    def put(self, key, text, display):
+        row = self._rows.get(key)
+        if row is not None:
+            if self._texts[row] == text:
+                self._displays[row] = display
+                return False
+            self.remove(key)
+        row = len(self._keys)
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            rows, tfs = self._postings.setdefault(term, ([], []))
+            rows.append(row)
+            tfs.append(tf)
+            self._arrays.pop(term, None)
+            self._df[term] = self._df.get(term, 0) + 1
+        length = sum(counts.values())
+        self._rows[key] = row
+        self._keys.append(key)
+        self._texts.append(text)
+        self._displays.append(display)
+        self._lengths.append(length)
+        self._alive.append(True)
+        self._total_length += length
+        self._row_arrays = None
+        return True
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        self._total_length -= self._lengths[row]
+        self._row_arrays = None
+        for term in set(tokenize(self._texts[row])):
+            self._df[term] -= 1
+        if len(self._keys) > 64 and len(self._keys) > 2 * len(self._rows):
+            self._compact()
+
+    def _compact(self):
+        live = [(self._keys[row], self._texts[row], self._displays[row]) for row in self._rows.values()]
+        self.__init__(self.k1, self.b)
+        for key, text, display in live:
+            self.put(key, text, display)
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            rows, tfs = self._postings[term]
+            arrays = self._arrays[term] = (np.asarray(rows), np.asarray(tfs, dtype=np.float64))
+        return arrays
+
+    # [(score, key, display), ...] for the k best live documents sharing a term with the query
+    def search(self, query, k=5):
+        terms = [term for term in dict.fromkeys(tokenize(query)) if self._df.get(term)]
+        if not terms or not self._rows:
+            return []
+        count = len(self._rows)
+        if self._row_arrays is None:
+            self._row_arrays = (np.asarray(self._lengths, dtype=np.float64), np.asarray(self._alive))
+        lengths, alive = self._row_arrays
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / count))
+        scores = np.zeros(len(self._keys))
+        for term in terms:
+            rows, tfs = self._term_arrays(term)
+            df = self._df[term]
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+        scores *= alive
+        top = np.flatnonzero(scores)
+        if len(top) > k:
+            top = top[np.argpartition(-scores[top], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[row]), self._keys[row], self._displays[row]) for row in top]
+
+
+def _drug_document(row):
+    d_id, d_name, d_use, expiry_date, stock, stores, price = row
+    display = f"Drug {d_name} (ID {d_id}): {d_use or 'no description'}. In stock: {stock} units"
+    display += f" in {stores} stores." if stores else " (out of stock)."
+    if price is not None:
+        display += f" Average sale price: {float(price):.2f}."
+    if expiry_date:
+        display += f" Expires {expiry_date}."
+    return ("drug", d_id), f"{d_name} {d_use or ''}", display
+
+
+def _supplier_document(row):
+    s_id, s_name, s_address, s_phone, drugs = row
+    display = f"Supplier {s_name} (ID {s_id}), {s_address or 'no address'}, phone {s_phone or 'unknown'}"
+    display += f"; supplies {drugs.replace(',', ', ')}." if drugs else "."
+    return ("supplier", s_id), f"{s_name} {s_address or ''} {drugs or ''}", display
+
+
+# Keeps a TermIndex of Drugs (with unexpired stock and Sale_Item prices) and Supplier (with the drugs it
+# supplies) up to date without re-reading the tables: stock changes come from the inventory feed of every
+# store database (read from an offset per database), new rows are found by key, and edits made in the app are
+# reported through mark_changed(). A full resync every resync_interval seconds catches edits made outside the
+# app; even then only changed documents are re-indexed.
+class PharmacyRetriever:
+    def __init__(self, resync_interval=3600, chunk_size=5000, clock=time.monotonic):
+        self.resync_interval = resync_interval
+        self.chunk_size = chunk_size
+        self._clock = clock
+        self._index = TermIndex()
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._event_ids = {}  # pool name -> last Event_ID read from that database's feed
+        self._max_ids = {"drug": 0, "supplier": 0}
+        self._changed = set()
+        self._stats = {"full_loads": 0, "refreshes": 0, "documents_updated": 0, "queries": 0,
+                       "last_query_ms": 0.0}
+
+    # Documents to reload on the next refresh, e.g. mark_changed("supplier", 3) after editing a supplier
+    def mark_changed(self, kind, key_id):
+        with self._lock:
+            self._changed.add((kind, key_id))
+
+    def _put(self, key, text, display):
+        if self._index.put(key, text, display):
+            self._stats["documents_updated"] += 1
+
+    # Drug rows with (units, stores holding any) inserted before the price
+    def _with_stock(self, conn, rows):
+        if not rows:
+            return rows
+        stock = {row[0]: [0, 0] for row in rows}
+        for _, drug_id, units in get_store_registry().unexpired_stock(conn, sorted(stock)).rows:
+            stock[drug_id][0] += units
+            stock[drug_id][1] += units > 0
+        return [tuple(row[:4]) + tuple(stock[row[0]]) + tuple(row[4:]) for row in rows]
+
+    def _load(self, conn, cursor, kind, ids=None, after=None):
+        query, id_column, document = ((DRUG_QUERY, "D_ID", _drug_document) if kind == "drug" else
+                                      (SUPPLIER_QUERY, "Supplier.S_ID", _supplier_document))
+        seen = set()
+        if ids is not None:
+            ids = sorted(ids)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(f"{query} WHERE {id_column} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+                rows = cursor.fetchall()
+                for row in self._with_stock(conn, rows) if kind == "drug" else rows:
+                    self._put(*document(row))
+                    seen.add(row[0])
+            for key_id in set(ids) - seen:
+                self._index.remove((kind, key_id))
+            return seen
+        last = after or 0
+        while True:
+            cursor.execute(f"{query} WHERE {id_column} > %s ORDER BY {id_column} LIMIT %s", (last, self.chunk_size))
+            rows = cursor.fetchall()
+            for row in self._with_stock(conn, rows) if kind == "drug" else rows:
+                self._put(*document(row))
+                seen.add(row[0])
+            if len(rows) < self.chunk_size:
+                break
+            last = rows[-1][0]
+        if seen:
+            self._max_ids[kind] = max(self._max_ids[kind], max(seen))
+        return seen
+
+    # {pool name: newest Event_ID} of every database; one that failed keeps the offset read from it before, so
+    # its feed is not read again from the start
+    def _latest_event_ids(self, conn):
+        def latest(store_conn, group):
+            cursor = store_conn.cursor()
+            event_id = inventory_feed.latest_event_id(cursor)
+            cursor.close()
+            return [(group.pool_name, event_id)]
+
+        result = get_store_registry().fan_out(latest, conn=conn)
+        event_ids = {name: self._event_ids[name] for name in result.failed if name in self._event_ids}
+        event_ids.update(result.rows)
+        return event_ids
+
+    # ({pool name: last Event_ID read}, drug IDs with stock changes) from every database's feed
+    def _changed_drugs(self, conn):
+        def read(store_conn, group):
+            settle = inventory_feed.MYSQL_SETTLE_SECONDS if store_conn.backend == "mysql" else 0.0
+            cursor = store_conn.cursor()
+            last_id = self._event_ids.get(group.pool_name, 0)
+            drugs = set()
+            while True:
+                events = inventory_feed.read_events(cursor, last_id, 1000, settle)
+                if not events:
+                    break
+                drugs.update(event.D_ID for event in events)
+                last_id = events[-1].Event_ID
+            cursor.close()
+            return [(group.pool_name, last_id, drugs)]
+
+        offsets, drugs = {}, set()
+        for name, last_id, changed in get_store_registry().fan_out(read, conn=conn).rows:
+            offsets[name] = last_id
+            drugs |= changed
+        return offsets, drugs
+
+    def _full_load(self, conn, cursor):
+        event_ids = self._latest_event_ids(conn)
+        for kind in ("drug", "supplier"):
+            seen = self._load(conn, cursor, kind)
+            for key in self._index.keys():
+                if key[0] == kind and key[1] not in seen:
+                    self._index.remove(key)
+        self._event_ids = event_ids
+        self._loaded_at = self._clock()
+        self._stats["full_loads"] += 1
+
+    # Apply everything that changed since the last call; `conn` is a primary database connection
+    def refresh(self, conn):
+        with self._lock:
+            cursor = conn.cursor()
+            try:
+                if self._loaded_at is None or self._clock() - self._loaded_at >= self.resync_interval:
+                    self._full_load(conn, cursor)
+                    return
+                self._stats["refreshes"] += 1
+                changed, self._changed = self._changed, set()
+                drugs = {key_id for kind, key_id in changed if kind == "drug"}
+                offsets, stock_changed = self._changed_drugs(conn)
+                self._event_ids.update(offsets)
+                drugs |= stock_changed
+                if drugs:
+                    self._load(conn, cursor, "drug", ids=drugs)
+                suppliers = {key_id for kind, key_id in changed if kind == "supplier"}
+                if suppliers:
+                    self._load(conn, cursor, "supplier", ids=suppliers)
+                self._load(conn, cursor, "drug", after=self._max_ids["drug"])
+                self._load(conn, cursor, "supplier", after=self._max_ids["supplier"])
+            finally:
+                cursor.close()
+                conn.rollback()
+
+    # The customer's own orders (item, times ordered, units) that match the question; when the question is about
+    # their orders but names no item, the most recent ones. Orders are kept by the store database that served
+    # them, so each database's totals are added up; Order_IDs only order items within one database.
+    def _customer_orders(self, conn, customer_id, question, k):
+        def query(store_conn, group):
+            cursor = store_conn.cursor()
+            cursor.execute("SELECT Item, COUNT(*), SUM(Qty), MAX(Order_ID) AS Latest FROM Orders WHERE C_ID = %s "
+                           "GROUP BY Item ORDER BY Latest DESC LIMIT 200", (customer_id,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        totals = {}
+        for item, times, units, latest in get_store_registry().fan_out(query, conn=conn).rows:
+            total = totals.setdefault(item, [item, 0, 0, latest])
+            total[1] += times
+            total[2] += units or 0
+            total[3] = max(total[3], latest)
+        rows = sorted(totals.values(), key=lambda row: -row[3])[:200]
+        index = TermIndex()
+        for position, (item, times, units, _) in enumerate(rows):
+            index.put(position, item or "", f"Your orders: {item} ordered {times} time(s), {units} units in total.")
+        matches = [display for _, _, display in index.search(question, k)]
+        if not matches and ORDER_WORDS & set(tokenize(question)):
+            matches = [f"Your orders: {item} ordered {times} time(s), {units} units in total."
+                       for item, times, units, _ in rows[:k]]
+        return matches
+
+    # Lines of pharmacy data relevant to a chat question, best match first
+    def search(self, conn, question, customer_id=None, k=5):
+        self.refresh(conn)
+        started = time.perf_counter()
+        with self._lock:
+            lines = [display for _, _, display in self._index.search(question, k)]
+        if customer_id is not None:
+            lines += self._customer_orders(conn, customer_id, question, k)
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["last_query_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return lines
+
+    def context_for(self, conn, question, customer_id=None, k=5):
+        return "\n".join(self.search(conn, question, customer_id, k))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["documents"] = len(self._index)
+        return stats
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever():
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = PharmacyRetriever(resync_interval=float(os.environ.get("PHARMACY_RETRIEVAL_RESYNC", "3600")))
+        return _retriever
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the pharmacy data the chatbot would see for a question")
+    parser.add_argument("question")
+    parser.add_argument("--customer", type=int, help="Also search this customer's orders (C_ID)")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    with db_pool.connection() as conn:
+        started = time.perf_counter()
+        get_retriever().refresh(conn)
+        print(f"Indexed in {time.perf_counter() - started:.2f}s")
+        for line in get_retriever().search(conn, args.question, args.customer, args.k):
+            print(line)
+        print(get_retriever().stats())
@@ -0,0 +1,229 @@
+import argparse
+import os
+import threading
+import time
+
+import pandas as pd
+
+import db_pool
+from db_pool import upsert_sql
+from inventory_feed import MYSQL_SETTLE_SECONDS
+from stores import DEFAULT_POOL, get_store_registry
+
+PERIODS = ("day", "week", "month")
+ROLLUP_INTERVAL = 60.0  # minimum seconds between the dashboard's refreshes
+ALL_STORES = -1
+NO_MANAGER = 0
+
+
+# Start date of the day/week/month each sale falls in (weeks start on Monday)
+def period_starts(dates, period):
+    if period == "day":
+        return dates.dt.normalize()
+    if period == "week":
+        return (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.normalize()
+    return dates.dt.to_period("M").dt.start_time
+
+
+# Aggregate a chunk of Sales rows into (Period, Period_start, M_ID) totals, per store and for all stores
+def aggregate_sales(rows):
+    sales = pd.DataFrame(rows, columns=["Sale_ID", "Total_amt", "Date", "M_ID"])
+    sales["Date"] = pd.to_datetime(sales["Date"])
+    sales["Total_amt"] = sales["Total_amt"].astype(float)
+    sales["M_ID"] = sales["M_ID"].fillna(NO_MANAGER).astype(int)
+    sales = sales.dropna(subset=["Date"])
+
+    frames = []
+    for period in PERIODS:
+        sales["Period_start"] = period_starts(sales["Date"], period)
+        per_store = sales.groupby(["Period_start", "M_ID"], as_index=False).agg(
+            Total_amt=("Total_amt", "sum"), Sale_count=("Sale_ID", "count"))
+        all_stores = sales.groupby("Period_start", as_index=False).agg(
+            Total_amt=("Total_amt", "sum"), Sale_count=("Sale_ID", "count"))
+        all_stores["M_ID"] = ALL_STORES
+        frame = pd.concat([per_store, all_stores], ignore_index=True)
+        frame["Period"] = period
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _rollup_rows(aggregated):
+    return [
+        (row.Period, row.Period_start.date(), int(row.M_ID), round(float(row.Total_amt), 2), int(row.Sale_count))
+        for row in aggregated.itertuples(index=False)
+    ]
+
+
+# MySQL hands out AUTO_INCREMENT ids at insert time, so a sale that commits late can appear below a watermark
+# that has already passed it. As with the inventory feed, a refresh only folds in sales up to the highest
+# Sale_ID noted by an earlier refresh at least inventory_feed.MYSQL_SETTLE_SECONDS ago: {pool name: [(time,
+# MAX(Sale_ID))]}, oldest first.
+_seen_sale_ids = {}
+_seen_lock = threading.Lock()
+
+
+# Highest Sale_ID up to which every sale has committed, or None while no noted value is old enough
+def _settled_sale_id(conn, cursor, name):
+    cursor.execute("SELECT COALESCE(MAX(Sale_ID), 0) FROM Sales")
+    newest = cursor.fetchone()[0]
+    if conn.backend != "mysql":
+        return newest
+    now = time.monotonic()
+    with _seen_lock:
+        seen = _seen_sale_ids.setdefault(name, [])
+        seen.append((now, newest))
+        while len(seen) > 1 and seen[1][0] <= now - MYSQL_SETTLE_SECONDS:
+            seen.pop(0)
+        return seen[0][1] if seen[0][0] <= now - MYSQL_SETTLE_SECONDS else None
+
+
+# Fold the database's settled sales newer than its stored watermark into its rollups (or, with `rebuild`, all
+# of them into emptied rollups); returns the number of sales processed. Runs in one transaction, so concurrent
+# refreshes cannot double count and readers keep seeing the previous totals until a rebuild has finished.
+def _refresh_database(conn, chunk_size, drugs=True, name=DEFAULT_POOL, rebuild=False):
+    conn.begin()
+    cursor = conn.cursor()
+    try:
+        lock = " FOR UPDATE" if conn.backend == "mysql" else ""
+        cursor.execute("SELECT Last_ID FROM RollupState WHERE Name = 'sales'" + lock)
+        last_id = cursor.fetchone()[0]
+        if rebuild:
+            cursor.execute("DELETE FROM SalesRollup")
+            last_id = 0
+        settled = _settled_sale_id(conn, cursor, name)
+        upto = last_id if settled is None else settled
+
+        upsert = upsert_sql(conn.backend, "SalesRollup",
+                            ["Period", "Period_start", "M_ID", "Total_amt", "Sale_count"],
+                            ["Period", "M_ID", "Period_start"], increment=("Total_amt", "Sale_count"))
+        processed = 0
+        while True:
+            # Chunks are read by primary-key range so memory stays bounded during large backfills
+            cursor.execute(
+                "SELECT Sale_ID, Total_amt, Date, M_ID FROM Sales WHERE Sale_ID > %s AND Sale_ID <= %s "
+                "ORDER BY Sale_ID LIMIT %s",
+                (last_id, upto, chunk_size),
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(upsert, _rollup_rows(aggregate_sales(rows)))
+            last_id = rows[-1][0]
+            processed += len(rows)
+
+        cursor.execute("UPDATE RollupState SET Last_ID = %s WHERE Name = 'sales'", (last_id,))
+        if drugs:
+            refresh_drug_rollup(conn, cursor)
+        conn.commit()
+        return processed
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Per-drug totals, on the primary database with Sale_Item. Sale_Item has no date or sale reference to watermark
+# on, but it holds at most one row per (drug, supplier) pair, so it is re-aggregated in SQL rather than in Python.
+def refresh_drug_rollup(conn, cursor):
+    cursor.execute("DELETE FROM DrugSalesRollup")
+    cursor.execute(
+        "INSERT INTO DrugSalesRollup (D_ID, Sale_qty, Total_price) "
+        "SELECT D_ID, SUM(Sale_qty), SUM(Total_price) FROM Sale_Item GROUP BY D_ID"
+    )
+
+
+# Every database holding sales (see stores.py) keeps the rollups of its own sales, so Sale_ID watermarks
+# never compare IDs from different databases. `conn` is a primary database connection; returns the number of
+# sales processed.
+def refresh_rollups(conn, chunk_size=50000):
+    return sum(get_store_registry().fan_out(
+        lambda store_conn, group: [_refresh_database(store_conn, chunk_size, group.pool_name == DEFAULT_POOL,
+                                                     group.pool_name)],
+        conn=conn,
+    ).rows)
+
+
+_last_refresh = None
+_refresh_lock = threading.Lock()
+
+
+def rollup_interval_from_env():
+    return float(os.environ.get("PHARMACY_ROLLUP_INTERVAL", str(ROLLUP_INTERVAL)))
+
+
+# refresh_rollups at most once every `interval` seconds in this process, for page views: each refresh is a
+# write transaction on every database and rebuilds DrugSalesRollup. Returns the number of sales processed.
+def refresh_rollups_if_due(conn, interval):
+    global _last_refresh
+    with _refresh_lock:
+        now = time.monotonic()
+        if _last_refresh is not None and now - _last_refresh < interval:
+            return 0
+        _last_refresh = now
+    return refresh_rollups(conn)
+
+
+# Rebuild every rollup from scratch, e.g. after changing the aggregation, fixing historical sales or moving
+# a store to its own database
+def backfill(conn, chunk_size=200000):
+    def note_sales(store_conn, group):
+        cursor = store_conn.cursor()
+        _settled_sale_id(store_conn, cursor, group.pool_name)
+        cursor.close()
+        return []
+
+    registry = get_store_registry()
+    if conn.backend == "mysql":
+        # Note the newest sales now, so the rebuild can take them once they have settled
+        registry.fan_out(note_sales, conn=conn)
+        time.sleep(MYSQL_SETTLE_SECONDS)
+    return sum(registry.fan_out(
+        lambda store_conn, group: [_refresh_database(store_conn, chunk_size, group.pool_name == DEFAULT_POOL,
+                                                     group.pool_name, rebuild=True)],
+        conn=conn,
+    ).rows)
+
+
+# Latest `periods` totals for one store (or ALL_STORES, summed over the databases), oldest first; reads at
+# most `periods` rollup rows per database
+def revenue_trend(conn, period="day", manager_id=ALL_STORES, periods=30):
+    def latest(store_conn, group):
+        cursor = store_conn.cursor()
+        cursor.execute(
+            "SELECT Period_start, Total_amt, Sale_count FROM SalesRollup "
+            "WHERE Period = %s AND M_ID = %s ORDER BY Period_start DESC LIMIT %s",
+            (period, manager_id, periods),
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    rows = get_store_registry().fan_out(latest, None if manager_id == ALL_STORES else [manager_id], conn).rows
+    trend = pd.DataFrame(rows, columns=["Period start", "Revenue", "Sales"])
+    trend["Period start"] = pd.to_datetime(trend["Period start"])
+    trend["Revenue"] = trend["Revenue"].astype(float)
+    trend = trend.groupby("Period start", as_index=False).sum().sort_values("Period start")
+    return trend.tail(periods).reset_index(drop=True)
+
+
+def top_drugs(conn, limit=10):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT DrugSalesRollup.D_ID, Drugs.D_name, DrugSalesRollup.Sale_qty, DrugSalesRollup.Total_price "
+        "FROM DrugSalesRollup JOIN Drugs ON DrugSalesRollup.D_ID = Drugs.D_ID "
+        "ORDER BY DrugSalesRollup.Total_price DESC LIMIT %s",
+        (limit,),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    return pd.DataFrame(rows, columns=["Drug ID", "Drug", "Units sold", "Revenue"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the sales rollup tables")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild the rollups from the full Sales history")
+    args = parser.parse_args()
+    with db_pool.connection() as conn:
+        processed = backfill(conn) if args.backfill else refresh_rollups(conn)
+    print(f"Rolled up {processed} sales.")
@@ -0,0 +1,449 @@
+import argparse
+import datetime
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import db_pool
+from db_pool import upsert_sql
+from instrumentation import get_instrumentation, traced_connection
+from migrate import apply_migrations
+from order_pipeline import InsufficientStockError, submit_order
+from paged_queries import fetch_page
+
+DEFAULT_POOL = "default"
+
+# Tables whose rows belong to one store and move to the store's own database when it has one: table ->
+# (key columns, condition selecting the store's rows). The alert logs go with the stock they are about, and
+# ExpiryAlertLog comes before InventoryBatch since its condition reads InventoryBatch.
+MOVED_TABLES = {
+    "AlertLog": (["D_ID", "M_ID"], "M_ID = %s"),
+    "ExpiryAlertLog": (["Batch_ID"], "Batch_ID IN (SELECT Batch_ID FROM InventoryBatch WHERE M_ID = %s)"),
+    "Inventory": (["D_ID", "M_ID"], "M_ID = %s"),
+    "InventoryBatch": (["Batch_ID"], "M_ID = %s"),
+    "InventoryEvent": (["Event_ID"], "M_ID = %s"),
+    "Sales": (["Sale_ID"], "M_ID = %s"),
+}
+# Orders carry no M_ID: an order is written to the database of the store it was routed to
+STORE_TABLES = list(MOVED_TABLES) + ["Orders"]
+
+# Rows copied from the primary database into store databases so their foreign keys resolve:
+# table -> (key column, columns, SELECT expressions). Credentials are not copied.
+REPLICATED_TABLES = {
+    "Manager": ("M_ID", ["M_ID", "M_name", "Ph_no", "M_pwd"], ["M_ID", "M_name", "Ph_no", "''"]),
+    "Customer": ("C_ID", ["C_ID", "C_name", "Age", "Sex", "Address", "EmailID", "Pwd"],
+                 ["C_ID", "C_name", "Age", "Sex", "Address", "EmailID", "''"]),
+    "Drugs": ("D_ID", ["D_ID", "D_name", "Mnf_date", "Expiry_date", "D_use", "C_ID"],
+              ["D_ID", "D_name", "Mnf_date", "Expiry_date", "D_use", "C_ID"]),
+}
+
+# Units orders can still take per store and drug: (M_ID, D_ID, units). Lots past their expiry are never sold
+# (see inventory_batches.allocate_fefo), so a drug left only with those counts as 0.
+STORE_STOCK_QUERY = ("SELECT M_ID, D_ID, SUM(CASE WHEN Expiry_date >= %s THEN Qty ELSE 0 END) FROM InventoryBatch "
+                     "WHERE Qty > 0{} GROUP BY M_ID, D_ID")
+
+# Databases queried together by a fan-out: pool name and the stores kept there (None: every store without
+# a database of its own)
+StoreGroup = namedtuple("StoreGroup", ["pool_name", "store_ids"])
+# rows: results of every database that answered, failed: pool names that raised or timed out
+FanOutResult = namedtuple("FanOutResult", ["rows", "failed", "seconds", "shard_seconds"])
+StorePage = namedtuple("StorePage", ["rows", "next_after", "failed"])
+StoreStock = namedtuple("StoreStock", ["store_id", "drug_id", "drug_name", "rem_qty"])
+
+
+def _database_key(config):
+    if config["backend"] == "sqlite":
+        return "sqlite", os.path.abspath(config["sqlite_path"])
+    return config["backend"], config["host"], config["port"], config["database"]
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+# NULLs sort first, as they do in ascending SQL order
+def _sort_key(row, positions):
+    return tuple((row[position] is not None, row[position]) for position in positions)
+
+
+# Which database holds each store's Inventory, batches, stock movements, Sales and Orders. Stores without a
+# database of their own use the primary one, which also keeps everything shared (customers, drugs, suppliers).
+# Queries spanning stores run on every database at once from a thread pool, so they take as long as the
+# slowest database rather than the sum.
+class StoreRegistry:
+    def __init__(self, store_configs=None, primary_config=None, fan_out_timeout=10):
+        self.fan_out_timeout = fan_out_timeout
+        primary = _database_key(primary_config or db_pool.db_config_from_env())
+        self._pool_names = {}  # store ID -> pool name, for stores with their own database
+        self._configs = {}  # pool name -> database config
+        pools_by_database = {}
+        for store_id, config in sorted((store_configs or {}).items()):
+            database = _database_key(config)
+            if database == primary:
+                print(f"Store {store_id} is configured with the primary database; keeping its data there")
+                continue
+            # Stores configured with the same database share one pool
+            name = pools_by_database.setdefault(database, f"store-{store_id}")
+            self._pool_names[store_id] = name
+            # A store database starts empty; the schema script's sample rows would clash with moved rows
+            self._configs.setdefault(name, dict(config, sample_data=False))
+        self._lock = threading.Lock()
+        self._executor = None
+        self._migrated = set()
+        self._replicated = set()  # (pool name, table, key) rows known to exist in a store database
+
+    @property
+    def sharded(self):
+        return bool(self._pool_names)
+
+    def pool_name(self, store_id):
+        return self._pool_names.get(store_id, DEFAULT_POOL)
+
+    # {store ID: pool name} of the stores with their own database
+    def store_databases(self):
+        return dict(self._pool_names)
+
+    def _pool(self, name):
+        pool = db_pool.get_pool(name, self._configs.get(name))
+        if name != DEFAULT_POOL and name not in self._migrated:
+            with self._lock:
+                if name not in self._migrated:
+                    with pool.get_connection() as conn:
+                        apply_migrations(conn)
+                    self._migrated.add(name)
+        return pool
+
+    # Connection to the database holding the store's data (the primary database for store_id None). A primary
+    # connection the caller already holds is passed as `conn` and reused instead of checking out a second one.
+    @contextmanager
+    def connection(self, store_id=None, conn=None):
+        if conn is not None and self.pool_name(store_id) == DEFAULT_POOL:
+            yield conn
+            return
+        conn = traced_connection(self._pool(self.pool_name(store_id)).get_connection())
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # Connection to the database of one of the groups below
+    def group_connection(self, group, conn=None):
+        return self.connection(group.store_ids[0] if group.store_ids else None,
+                               conn if group.pool_name == DEFAULT_POOL else None)
+
+    # One group per database holding any of `store_ids` (all databases when None)
+    def groups(self, store_ids=None):
+        if store_ids is None:
+            sharded = {}
+            for store_id, name in sorted(self._pool_names.items()):
+                sharded.setdefault(name, []).append(store_id)
+            return [StoreGroup(DEFAULT_POOL, None)] + [StoreGroup(name, ids) for name, ids in sharded.items()]
+        groups = {}
+        for store_id in store_ids:
+            groups.setdefault(self.pool_name(store_id), []).append(store_id)
+        return [StoreGroup(name, ids) for name, ids in groups.items()]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(set(self._pool_names.values())) + 1,
+                                                    thread_name_prefix="store-fan-out")
+            return self._executor
+
+    def _run(self, fn, group, conn):
+        start = time.perf_counter()
+        with get_instrumentation().span("stores.shard"):
+            with self.group_connection(group, conn) as group_conn:
+                rows = list(fn(group_conn, group))
+        return rows, time.perf_counter() - start
+
+    # Call fn(conn, group) on every database holding `store_ids` in parallel and concatenate the returned rows.
+    # The primary database is queried with `conn` when given, on the caller's thread: a worker could still be
+    # running after a timeout, and the caller's connection must not be in use by two threads. With a single
+    # database the call runs inline and errors propagate; otherwise a database that fails or does not answer
+    # within fan_out_timeout is reported in `failed` and the others' rows are still returned.
+    def fan_out(self, fn, store_ids=None, conn=None):
+        groups = self.groups(store_ids)
+        start = time.perf_counter()
+        results, errors = {}, {}  # group index -> (rows, seconds) and error
+        with get_instrumentation().span("stores.fan_out"):
+            if len(groups) == 1:
+                rows, seconds = self._run(fn, groups[0], conn)
+                return FanOutResult(rows, [], seconds, {groups[0].pool_name: seconds})
+            futures = {i: self._get_executor().submit(self._run, fn, group, None) for i, group in enumerate(groups)
+                       if conn is None or group.pool_name != DEFAULT_POOL}
+            for i, group in enumerate(groups):
+                if i not in futures:
+                    try:
+                        results[i] = self._run(fn, group, conn)
+                    except Exception as e:
+                        errors[i] = e
+            done, _ = wait(futures.values(), timeout=max(0.0, self.fan_out_timeout - (time.perf_counter() - start)))
+        for i, future in futures.items():
+            if future not in done:
+                future.cancel()
+                errors[i] = "timed out"
+            elif future.exception() is not None:
+                errors[i] = future.exception()
+            else:
+                results[i] = future.result()
+        rows, failed, shard_seconds = [], [], {}
+        for i, group in enumerate(groups):
+            if i in results:
+                group_rows, shard_seconds[group.pool_name] = results[i]
+                rows += group_rows
+            else:
+                failed.append(group.pool_name)
+                print(f"Store database {group.pool_name} failed: {errors[i]}")
+        return FanOutResult(rows, failed, time.perf_counter() - start, shard_seconds)
+
+    # One page of a keyset-paginated view across databases, in (sort_columns...) order. fetch(conn, group,
+    # after) returns a Page of `columns` rows from one database; `cursors` holds each database's own keyset
+    # cursor, so IDs repeating across databases do not matter.
+    def fan_out_page(self, fetch, columns, sort_columns, descending, cursors=None, page_size=50, store_ids=None,
+                     conn=None):
+        cursors = cursors or {}
+        positions = [columns.index(column) for column in sort_columns]
+        result = self.fan_out(lambda group_conn, group: [(group.pool_name,
+                                                          fetch(group_conn, group, cursors.get(group.pool_name)))],
+                              store_ids, conn)
+        entries = []
+        more = False
+        for name, page in result.rows:
+            entries += [(_sort_key(row, positions), name, row) for row in page.rows]
+            more = more or page.next_after is not None
+        entries.sort(key=lambda entry: entry[0], reverse=descending)
+        next_cursors = dict(cursors)
+        for _, name, row in entries[:page_size]:
+            next_cursors[name] = tuple(row[position] for position in positions)
+        more = more or len(entries) > page_size
+        return StorePage([row for _, _, row in entries[:page_size]], next_cursors if more else None, result.failed)
+
+    # Unexpired units per (store, drug) in every database (or only the stores given), optionally for some drugs
+    def unexpired_stock(self, conn, drug_ids=None, store_ids=None, today=None):
+        today = today or datetime.date.today()
+        where = "" if drug_ids is None else f" AND D_ID IN ({_placeholders(drug_ids)})"
+
+        def query(store_conn, group):
+            store_cursor = store_conn.cursor()
+            store_cursor.execute(STORE_STOCK_QUERY.format(where), [today] + list(drug_ids or []))
+            rows = [(m_id, d_id, int(units)) for m_id, d_id, units in store_cursor.fetchall()
+                    if group.store_ids is None or m_id in group.store_ids]
+            store_cursor.close()
+            return rows
+
+        return self.fan_out(query, store_ids, conn)
+
+    # Drugs with their largest single-store unexpired stock, since one order line is served from one store:
+    # (D_ID, D_name, units)
+    def drug_stock(self, conn):
+        stock = {}
+        for _, drug_id, units in self.unexpired_stock(conn).rows:
+            stock[drug_id] = max(units, stock.get(drug_id, units))
+        cursor = conn.cursor()
+        cursor.execute("SELECT D_ID, D_name FROM Drugs")
+        rows = [(drug_id, name, stock[drug_id]) for drug_id, name in cursor.fetchall() if drug_id in stock]
+        cursor.close()
+        return rows
+
+    # Stores holding at least `quantity` unexpired units of the named drug, most stock first ("which branch has
+    # 50 units of Amoxicillin"). `conn` is a primary database connection.
+    def find_stock(self, conn, drug_name, quantity=1, store_ids=None):
+        cursor = conn.cursor()
+        cursor.execute("SELECT D_ID, D_name FROM Drugs WHERE D_name = %s", (drug_name,))
+        names = dict(cursor.fetchall())
+        cursor.close()
+        if not names:
+            return FanOutResult([], [], 0.0, {})
+        result = self.unexpired_stock(conn, sorted(names), store_ids)
+        rows = [StoreStock(m_id, d_id, names[d_id], units) for m_id, d_id, units in result.rows
+                if units >= quantity]
+        return result._replace(rows=sorted(rows, key=lambda stock: (-stock.rem_qty, stock.store_id)))
+
+    # Copy rows the store database does not have yet from the primary database; call outside a transaction
+    def replicate(self, conn, store_id, store_conn, table, keys):
+        name = self.pool_name(store_id)
+        if name == DEFAULT_POOL:
+            return 0
+        key_column, columns, expressions = REPLICATED_TABLES[table]
+        missing = sorted({key for key in keys if key is not None and (name, table, key) not in self._replicated})
+        if not missing:
+            return 0
+        store_cursor = store_conn.cursor()
+        store_cursor.execute(f"SELECT {key_column} FROM {table} WHERE {key_column} IN ({_placeholders(missing)})",
+                             missing)
+        present = {row[0] for row in store_cursor.fetchall()}
+        copy = [key for key in missing if key not in present]
+        if copy:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {', '.join(expressions)} FROM {table} WHERE {key_column} IN ({_placeholders(copy)})",
+                           copy)
+            rows = cursor.fetchall()
+            cursor.close()
+            if table == "Drugs":
+                self.replicate(conn, store_id, store_conn, "Customer", [row[-1] for row in rows])
+            store_cursor.executemany(upsert_sql(store_conn.backend, table, columns, [key_column]), rows)
+            store_conn.commit()
+        store_cursor.close()
+        with self._lock:
+            self._replicated.update((name, table, key) for key in missing)
+        return len(copy)
+
+    # Copy every row of the replicated tables into the store's database; returns {table: rows copied}
+    def sync_reference_data(self, conn, store_id, store_conn, page_size=1000):
+        copied = {}
+        for table, (key_column, columns, expressions) in REPLICATED_TABLES.items():
+            copied[table] = 0
+            store_cursor = store_conn.cursor()
+            page = fetch_page(conn, table, expressions, [], [], (key_column,), False, None, page_size)
+            while page.rows:
+                store_cursor.executemany(upsert_sql(store_conn.backend, table, columns, [key_column]), page.rows)
+                store_conn.commit()
+                copied[table] += len(page.rows)
+                if page.next_after is None:
+                    break
+                page = fetch_page(conn, table, expressions, [], [], (key_column,), False, page.next_after, page_size)
+            store_cursor.close()
+        return copied
+
+    # Move a store's rows out of the primary database into its own. Reference data is copied first. The
+    # store's rows on the primary stay locked from the start of the copy until they are deleted (on SQLite the
+    # whole primary database is), so its writes wait for the move instead of landing between copy and delete.
+    # A failed move leaves the primary unchanged, and copying again is harmless. Sales rollups are rebuilt
+    # afterwards, since the moved sales are now counted in the store database.
+    def move_store(self, conn, store_id, page_size=1000, log=print):
+        if self.pool_name(store_id) == DEFAULT_POOL:
+            raise ValueError(f"Store {store_id} has no database of its own (set PHARMACY_STORE_{store_id}_DB_*)")
+        moved = {}
+        with self.connection(store_id) as store_conn:
+            store_cursor = store_conn.cursor()
+            # Marks the stores already moved into this database
+            store_cursor.execute("CREATE TABLE IF NOT EXISTS StoreShard (M_ID INT PRIMARY KEY, Moved_at DATETIME NOT NULL)")
+            store_conn.commit()
+            log(f"Copied reference data: {self.sync_reference_data(conn, store_id, store_conn)}")
+
+            lock = " FOR UPDATE" if conn.backend == "mysql" else ""
+            conn.begin()
+            cursor = conn.cursor()
+            try:
+                for table, (keys, where) in MOVED_TABLES.items():
+                    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}" + lock, (store_id,))
+                    expected = cursor.fetchone()[0]
+                    cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+                    columns = [column[0] for column in cursor.description]
+                    cursor.fetchall()
+                    moved[table] = 0
+                    after = None
+                    while True:
+                        page = fetch_page(conn, table, columns, [where], [store_id], keys, False, after, page_size)
+                        if page.rows:
+                            store_cursor.executemany(upsert_sql(store_conn.backend, table, columns, keys), page.rows)
+                            store_conn.commit()
+                            moved[table] += len(page.rows)
+                        if page.next_after is None:
+                            break
+                        after = page.next_after
+                    if moved[table] != expected:
+                        raise RuntimeError(f"{table}: copied {moved[table]} of {expected} rows of store {store_id}")
+                    log(f"{table}: copied {moved[table]:,} rows")
+                store_cursor.execute(upsert_sql(store_conn.backend, "StoreShard", ["M_ID", "Moved_at"], ["M_ID"]),
+                                     (store_id, datetime.datetime.now().replace(microsecond=0)))
+                store_conn.commit()
+                for table, (_, where) in MOVED_TABLES.items():
+                    cursor.execute(f"DELETE FROM {table} WHERE {where}", (store_id,))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                store_cursor.close()
+
+        from sales_analytics import backfill
+
+        log(f"Rebuilt the sales rollups from {backfill(conn):,} sales")
+        return moved
+
+    # Place the order at one store that has stock for every line: `preferred` if it can, otherwise the one
+    # with the most stock of the ordered drugs. The order is written to that store's database in one
+    # transaction. Returns (store ID, allocations); the store ID is None when every store shares the primary
+    # database and no single store had everything, in which case each line is served by its own store.
+    def route_order(self, conn, customer_id, lines, preferred=None):
+        needed = {}
+        for line in lines:
+            needed[line.drug_id] = needed.get(line.drug_id, 0) + line.quantity
+        drug_ids = sorted(needed)
+
+        by_store = {}
+        for m_id, d_id, units in self.unexpired_stock(conn, drug_ids).rows:
+            by_store.setdefault(m_id, {})[d_id] = units
+        candidates = [store_id for store_id, levels in by_store.items()
+                      if all(levels.get(d_id, 0) >= quantity for d_id, quantity in needed.items())]
+        candidates.sort(key=lambda store_id: (store_id != preferred, -sum(by_store[store_id].values()), store_id))
+
+        for store_id in candidates:
+            with self.connection(store_id, conn) as store_conn:
+                self.replicate(conn, store_id, store_conn, "Customer", [customer_id])
+                try:
+                    return store_id, submit_order(store_conn, customer_id, lines, store_id=store_id)
+                except InsufficientStockError:
+                    continue  # stock taken meanwhile or only expired lots left; try the next store
+
+        if not self.sharded:
+            return None, submit_order(conn, customer_id, lines)
+        for line in lines:
+            if max((levels.get(line.drug_id, 0) for levels in by_store.values()), default=0) < needed[line.drug_id]:
+                raise InsufficientStockError(line.drug_name, needed[line.drug_id])
+        raise InsufficientStockError(lines[0].drug_name, needed[lines[0].drug_id])
+
+
+def store_registry_from_env():
+    env = os.environ
+    store_ids = [int(value) for value in env.get("PHARMACY_STORE_DATABASES", "").split(",") if value.strip()]
+    return StoreRegistry(
+        {store_id: db_pool.db_config_from_env(f"PHARMACY_STORE_{store_id}_DB") for store_id in store_ids},
+        fan_out_timeout=float(env.get("PHARMACY_STORE_FAN_OUT_TIMEOUT", "10")),
+    )
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_store_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = store_registry_from_env()
+        return _registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find stock across stores or move a store to its own database")
+    parser.add_argument("--find", metavar="DRUG", help="List the stores holding --quantity units of this drug")
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--move", type=int, metavar="STORE", help="Move this store's rows to its own database")
+    parser.add_argument("--sync", action="store_true", help="Copy customers, drugs and managers to every store database")
+    args = parser.parse_args()
+
+    registry = get_store_registry()
+    with registry.connection() as conn:
+        if args.move is not None:
+            print(f"Moved store {args.move}: {registry.move_store(conn, args.move)}")
+        if args.sync:
+            for store_id, name in sorted(registry.store_databases().items()):
+                with registry.connection(store_id) as store_conn:
+                    print(f"Store {store_id} ({name}): {registry.sync_reference_data(conn, store_id, store_conn)}")
+        if args.find:
+            result = registry.find_stock(conn, args.find, args.quantity)
+            for stock in result.rows:
+                print(f"store {stock.store_id:>4}  {stock.rem_qty:>8} x {stock.drug_name} (drug {stock.drug_id})")
+            print(f"{len(result.rows)} stores in {result.seconds * 1000:.1f} ms (slowest database "
+                  f"{max(result.shard_seconds.values(), default=0) * 1000:.1f} ms, sum "
+                  f"{sum(result.shard_seconds.values()) * 1000:.1f} ms)"
+                  + (f"; no answer from {', '.join(result.failed)}" if result.failed else ""))
+        if args.move is None and not args.sync and not args.find:
+            print(f"Stores with their own database: {registry.store_databases() or 'none'}")
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+import db_pool  # noqa: E402
+import reference_cache  # noqa: E402
+import stores  # noqa: E402
+from migrate import apply_migrations  # noqa: E402
+
+
+# Point the process-wide singletons (pools, store registry, reference cache) at databases under tmp_path
+def _use_databases(tmp_path, monkeypatch, store_databases=()):
+    monkeypatch.setenv("PHARMACY_DB_BACKEND", "sqlite")
+    monkeypatch.setenv("PHARMACY_DB_SQLITE_PATH", str(tmp_path / "primary.db"))
+    monkeypatch.setenv("PHARMACY_REFERENCE_CACHE", str(tmp_path / "reference_cache.db"))
+    monkeypatch.setenv("PHARMACY_STORE_DATABASES", ",".join(map(str, store_databases)))
+    for store_id in store_databases:
+        monkeypatch.setenv(f"PHARMACY_STORE_{store_id}_DB_BACKEND", "sqlite")
+        monkeypatch.setenv(f"PHARMACY_STORE_{store_id}_DB_SQLITE_PATH", str(tmp_path / f"store_{store_id}.db"))
+    pools = {}
+    monkeypatch.setattr(db_pool, "_pools", pools)
+    monkeypatch.setattr(stores, "_registry", None)
+    monkeypatch.setattr(reference_cache, "_cache", None)
+    monkeypatch.setattr(auth, "_authenticator", None)
+    with db_pool.connection() as conn:
+        apply_migrations(conn)
+    return pools
+
+
+def _close(pools):
+    for pool in pools.values():
+        pool.close_all()
+
+
+# Primary SQLite database built from pharmacysql.sql (with its sample rows) and migrated; yields a connection
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    pools = _use_databases(tmp_path, monkeypatch)
+    with db_pool.connection() as conn:
+        yield conn
+    _close(pools)
+
+
+# Like conn, with store 2 configured to keep its data in a database of its own
+@pytest.fixture
+def sharded_conn(tmp_path, monkeypatch):
+    pools = _use_databases(tmp_path, monkeypatch, store_databases=[2])
+    with db_pool.connection() as conn:
+        yield conn
+    _close(pools)
+
+
+def query(conn, sql, params=()):
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
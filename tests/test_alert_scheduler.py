@@ -0,0 +1,109 @@
+import datetime
+
+import pytest
+
+import alert_scheduler
+import inventory_feed
+from alert_scheduler import AlertScheduler, alerts_enabled_from_env, low_stock
+from conftest import query
+from inventory_batches import restock
+
+TODAY = datetime.date.today()
+LATER = TODAY + datetime.timedelta(days=365)
+
+
+# Collects messages instead of sending them
+class RecordingMailer:
+    config = {"sender": "pharmacy@localhost"}
+    connections = 0
+
+    def __init__(self):
+        self.sent = []
+
+    def send_batch(self, messages):
+        self.sent += messages
+        return list(messages), []
+
+    def close(self):
+        pass
+
+
+def new_drug(conn, name):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Drugs (D_name) VALUES (%s)", (name,))
+    conn.commit()
+    drug_id = cursor.lastrowid
+    cursor.close()
+    return drug_id
+
+
+def alerted(mailer, name):
+    return [msg["To"] for msg in mailer.sent if name in msg.get_payload()]
+
+
+def scheduler(mailer):
+    return AlertScheduler(mailer, default_threshold=2, default_recipient="ops@example.com", expiry_days=0)
+
+
+def test_expired_units_do_not_hold_back_an_alert(conn):
+    stocked = new_drug(conn, "Stockamol")
+    expired = new_drug(conn, "Expirol")
+    restock(conn, stocked, 1, 5, LATER)
+    restock(conn, expired, 1, 50, TODAY - datetime.timedelta(days=1))
+
+    cursor = conn.cursor()
+    low = {row[0]: row[5] for row in low_stock(cursor, 2, [stocked, expired])}
+    cursor.close()
+
+    assert low == {expired: 0}
+
+
+def test_reconcile_alerts_once_until_stock_recovers(conn):
+    drug_id = new_drug(conn, "Expirol")
+    restock(conn, drug_id, 1, 50, TODAY - datetime.timedelta(days=1))
+    mailer = RecordingMailer()
+    alerts = scheduler(mailer)
+
+    alerts.reconcile()
+    assert alerted(mailer, "Expirol") == ["ops@example.com"]
+    alerts.reconcile()
+    assert len(alerted(mailer, "Expirol")) == 1
+
+    restock(conn, drug_id, 1, 10, LATER)
+    alerts.reconcile()
+    assert query(conn, "SELECT COUNT(*) FROM AlertLog WHERE D_ID = %s", (drug_id,)) == [(0,)]
+
+
+def test_feed_offset_and_alert_log_commit_together(conn, monkeypatch):
+    mailer = RecordingMailer()
+    alerts = scheduler(mailer)
+    alerts.reconcile()
+    drug_id = new_drug(conn, "Feedol")
+    restock(conn, drug_id, 1, 1, LATER)
+    offset = query(conn, "SELECT Last_ID FROM EventConsumer WHERE Name = %s", (AlertScheduler.CONSUMER,))
+
+    def fail(*args):
+        raise RuntimeError("offset write failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(inventory_feed, "set_consumer_offset", fail)
+        with pytest.raises(RuntimeError):
+            alerts.process_changes()
+    # The alert went out, but neither its log row nor the offset were committed, so it is delivered again
+    assert len(alerted(mailer, "Feedol")) == 1
+    assert query(conn, "SELECT COUNT(*) FROM AlertLog WHERE D_ID = %s", (drug_id,)) == [(0,)]
+    assert query(conn, "SELECT Last_ID FROM EventConsumer WHERE Name = %s", (AlertScheduler.CONSUMER,)) == offset
+
+    alerts.process_changes()
+    assert len(alerted(mailer, "Feedol")) == 2
+    assert query(conn, "SELECT Rem_qty FROM AlertLog WHERE D_ID = %s", (drug_id,)) == [(1,)]
+    alerts.process_changes()
+    assert len(alerted(mailer, "Feedol")) == 2
+
+
+def test_app_starts_the_scheduler_only_when_enabled(monkeypatch):
+    monkeypatch.delenv("PHARMACY_ALERTS", raising=False)
+    assert not alerts_enabled_from_env()
+    monkeypatch.setenv("PHARMACY_ALERTS", "1")
+    assert alerts_enabled_from_env()
+    assert alert_scheduler.smtp_config_from_env()["port"] == 1025
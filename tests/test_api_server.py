@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from api_server import create_app
+from conftest import query
+
+
+# Send each (method, path, json) request to a fresh app in order; returns [(status, body)]
+def call(*requests, token=None):
+    async def run():
+        async with TestClient(TestServer(create_app(workers=2))) as client:
+            responses = []
+            headers = {"Authorization": f"Bearer {token}"} if token else {}
+            for method, path, body in requests:
+                response = await client.request(method, path, json=body, headers=headers)
+                responses.append((response.status, await response.json()))
+            return responses
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def iterations(monkeypatch):
+    monkeypatch.setenv("PHARMACY_AUTH_ITERATIONS", "1000")
+
+
+def login(user_type, username, password):
+    [(status, body)] = call(("POST", "/api/login", {"username": username, "password": password,
+                                                   "user_type": user_type}))
+    assert status == 200
+    return body["token"]
+
+
+def test_login_issues_a_token_the_other_routes_accept(conn, iterations):
+    token = login("Customer", "rg@example.com", "rg456")
+
+    [(status, drugs)] = call(("GET", "/api/drugs", None), token=token)
+    assert status == 200
+    assert {"D_ID", "D_name", "Rem_qty"} == set(drugs[0])
+    # A customer token does not open the manager routes
+    assert call(("GET", "/api/suppliers", None), token=token)[0][0] == 403
+    assert call(("GET", "/api/drugs", None))[0][0] == 401
+
+
+def test_wrong_password_is_unauthorized(conn, iterations):
+    assert call(("POST", "/api/login", {"username": "rg@example.com", "password": "nope"}))[0][0] == 401
+
+
+@pytest.mark.parametrize("body", [
+    {"username": "rg@example.com", "password": "rg456", "user_type": ["Customer"]},
+    {"username": "rg@example.com", "password": "rg456", "user_type": {"a": 1}},
+    {"username": ["rg@example.com"], "password": "rg456"},
+    {"username": "rg@example.com", "password": 456},
+    {"username": "rg@example.com", "password": "rg456", "user_type": "Admin"},
+    ["rg@example.com", "rg456"],
+])
+def test_malformed_logins_are_bad_requests(conn, iterations, body):
+    status, response = call(("POST", "/api/login", body))[0]
+    assert status == 400
+    assert response["error"]
+
+
+def test_supplier_fields_must_be_strings(conn, iterations):
+    token = login("Manager", "David Warner", "davidpass")
+    suppliers = query(conn, "SELECT COUNT(*) FROM Supplier")[0][0]
+
+    responses = call(("POST", "/api/suppliers", {"S_name": "Acme", "S_phone": ["555-123-4567"]}),
+                     ("POST", "/api/suppliers", {"S_name": 7}),
+                     ("PATCH", "/api/suppliers/1", {"S_phone": 5551234567}),
+                     ("POST", "/api/suppliers", {"S_name": "Acme", "S_address": "1 Main St"}),
+                     token=token)
+
+    assert [status for status, _ in responses] == [400, 400, 400, 201]
+    assert query(conn, "SELECT COUNT(*) FROM Supplier")[0][0] == suppliers + 1
+
+
+def test_bad_query_parameters_are_bad_requests(conn, iterations):
+    token = login("Manager", "David Warner", "davidpass")
+
+    responses = call(("GET", "/api/inventory?page_size=0", None), ("GET", "/api/inventory?sort=Price", None),
+                     ("GET", "/api/inventory?after=garbage", None), ("GET", "/api/stock", None), token=token)
+
+    assert [status for status, _ in responses] == [400, 400, 400, 400]
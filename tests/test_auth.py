@@ -0,0 +1,81 @@
+import pytest
+
+from auth import ALGORITHM, Authenticator, hash_password, verify_password
+from conftest import query
+
+# Cheap hashes keep the tests fast; the cost is stored in each hash, so nothing else changes
+ITERATIONS = 1000
+
+
+def test_hash_round_trip():
+    stored = hash_password("s3cret", ITERATIONS)
+    assert stored.startswith(f"{ALGORITHM}${ITERATIONS}$")
+    assert verify_password("s3cret", stored, ITERATIONS) == (True, False)
+    assert verify_password("S3cret", stored, ITERATIONS) == (False, False)
+    # Salted: the same password hashes differently each time
+    assert hash_password("s3cret", ITERATIONS) != stored
+
+
+def test_weaker_and_plain_text_passwords_need_a_rehash():
+    assert verify_password("s3cret", hash_password("s3cret", ITERATIONS), ITERATIONS * 2) == (True, True)
+    assert verify_password("s3cret", "s3cret", ITERATIONS) == (True, True)
+    assert verify_password("other", "s3cret", ITERATIONS) == (False, True)
+    assert verify_password("s3cret", None, ITERATIONS) == (False, False)
+
+
+@pytest.mark.parametrize("stored", [
+    f"{ALGORITHM}$0$c2FsdA$ZGlnZXN0",
+    f"{ALGORITHM}$-5$c2FsdA$ZGlnZXN0",
+    f"{ALGORITHM}$many$c2FsdA$ZGlnZXN0",
+    f"{ALGORITHM}$1000$c2FsdA",
+    f"{ALGORITHM}$1000$c2FsdA$ZGlnZXN0$extra",
+    f"{ALGORITHM}$1000$c2Fsd%$ZGlnZXN0",
+])
+def test_malformed_hashes_match_nothing(stored):
+    assert verify_password("s3cret", stored, ITERATIONS) == (False, False)
+
+
+def test_token_round_trip():
+    authenticator = Authenticator(ITERATIONS, secret=b"k" * 32)
+    token = authenticator.issue_token("Customer", 7)
+    assert authenticator.verify_token(token) == ("Customer", 7)
+    assert Authenticator(ITERATIONS, secret=b"k" * 32).verify_token(token) == ("Customer", 7)
+
+
+def test_tampered_and_foreign_tokens_are_rejected():
+    authenticator = Authenticator(ITERATIONS, secret=b"k" * 32)
+    token = authenticator.issue_token("Customer", 7)
+    payload, signature = token.split(".")
+    forged = authenticator.issue_token("Manager", 1).split(".")[0]
+
+    assert authenticator.verify_token(f"{forged}.{signature}") is None
+    assert authenticator.verify_token(f"{payload}.{signature[:-2]}{'AB' if signature[-2:] != 'AB' else 'CD'}") is None
+    assert authenticator.verify_token(f"{payload[:-1]}.{signature}") is None
+    assert Authenticator(ITERATIONS, secret=b"x" * 32).verify_token(token) is None
+
+
+@pytest.mark.parametrize("token", [None, "", "no-dot", "a.b.c", "é.abc", "abc.é", "!!.??"])
+def test_garbage_tokens_are_rejected(token):
+    assert Authenticator(ITERATIONS, secret=b"k" * 32).verify_token(token) is None
+
+
+def test_tokens_expire():
+    now = [1_000_000.0]
+    authenticator = Authenticator(ITERATIONS, secret=b"k" * 32, session_ttl=60, clock=lambda: now[0])
+    token = authenticator.issue_token("Manager", 1)
+    now[0] += 59
+    assert authenticator.verify_token(token) == ("Manager", 1)
+    now[0] += 2
+    assert authenticator.verify_token(token) is None
+
+
+def test_login_rehashes_plain_text_password(conn):
+    authenticator = Authenticator(ITERATIONS)
+    # The schema's sample customers still hold plain-text passwords
+    assert authenticator.authenticate(conn, "rg@example.com", "wrong", "Customer") is None
+    assert authenticator.authenticate(conn, "rg@example.com", "rg456", "Customer") == 2
+
+    stored = query(conn, "SELECT Pwd FROM Customer WHERE C_ID = 2")[0][0]
+    assert stored.startswith(f"{ALGORITHM}${ITERATIONS}$")
+    assert authenticator.authenticate(conn, "rg@example.com", "rg456", "Customer") == 2
+    assert authenticator.stats() == {"logins": 2, "failures": 1, "rehashed": 1}
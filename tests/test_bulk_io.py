@@ -0,0 +1,106 @@
+import csv
+
+import pytest
+
+from bulk_io import import_file
+from conftest import query
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return str(path)
+
+
+def read_rejects(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return [(row[0], row[-1]) for row in list(csv.reader(f))[1:]]
+
+
+def quiet(*args):
+    pass
+
+
+def test_invalid_suppliers_are_rejected_with_a_reason(conn, tmp_path):
+    source = write_csv(tmp_path / "suppliers.csv", [
+        ["S_name", "S_address", "S_phone", "M_ID"],
+        ["Good Pharma", "1 Main St", "9876543210", "1"],
+        ["Bad Phone", "2 Main St", "12-34", "1"],
+        ["", "3 Main St", "9876543210", "1"],
+        ["Too Wide", "4 Main St", "9876543210", "1", "surplus", "fields"],
+        ["Bad Manager", "5 Main St", "", "99"],
+        ["Bad ID", "6 Main St", "", "one"],
+    ])
+    suppliers = query(conn, "SELECT COUNT(*) FROM Supplier")[0][0]
+
+    result = import_file(conn, "suppliers", source, rejects=str(tmp_path / "rejects.csv"), log=quiet)
+
+    assert (result.rows, result.imported, result.rejected) == (6, 1, 5)
+    assert query(conn, "SELECT COUNT(*) FROM Supplier")[0][0] == suppliers + 1
+    assert query(conn, "SELECT S_phone, M_ID FROM Supplier WHERE S_name = 'Good Pharma'") == [("9876543210", 1)]
+    reasons = dict(read_rejects(tmp_path / "rejects.csv"))
+    assert reasons["2"].startswith("S_phone: Invalid phone number format")
+    assert reasons["3"] == "S_name is required"
+    assert reasons["4"] == "2 more fields than the header has columns"
+    assert reasons["5"] == "M_ID: no Manager row 99"
+    assert reasons["6"].startswith("M_ID: ")
+
+
+def test_rows_referencing_unknown_drugs_are_rejected(conn, tmp_path):
+    source = write_csv(tmp_path / "supplies.csv", [
+        ["D_ID", "S_ID", "Qty"],
+        ["1", "1", "20"],
+        ["999", "1", "20"],
+        ["2", "1", "-3"],
+    ])
+
+    result = import_file(conn, "supplies", source, rejects=str(tmp_path / "rejects.csv"), log=quiet)
+
+    assert (result.imported, result.rejected) == (1, 2)
+    assert query(conn, "SELECT D_ID, S_ID, Qty FROM Supplies") == [(1, 1, 20)]
+    reasons = dict(read_rejects(tmp_path / "rejects.csv"))
+    assert reasons["2"] == "D_ID: no Drugs row 999"
+    assert reasons["3"].startswith("Qty: ")
+
+
+def test_drugs_expiring_before_manufacture_are_rejected(conn, tmp_path):
+    source = write_csv(tmp_path / "drugs.csv", [
+        ["D_name", "Mnf_date", "Expiry_date"],
+        ["Backwards", "2025-06-01", "2025-01-01"],
+        ["Bad Date", "2025-13-01", ""],
+    ])
+
+    result = import_file(conn, "drugs", source, rejects=str(tmp_path / "rejects.csv"), log=quiet)
+
+    assert (result.imported, result.rejected) == (0, 2)
+    reasons = dict(read_rejects(tmp_path / "rejects.csv"))
+    assert reasons["1"] == "Expiry_date is before Mnf_date"
+    assert reasons["2"].startswith("Mnf_date: ")
+
+
+def test_restock_limited_to_one_store(conn, tmp_path):
+    source = write_csv(tmp_path / "inventory.csv", [
+        ["D_ID", "M_ID", "Qty", "Expiry_date"],
+        ["3", "1", "5", "2099-01-01"],
+        ["3", "2", "5", "2099-01-01"],
+    ])
+    before = dict(query(conn, "SELECT M_ID, Rem_qty FROM Inventory WHERE D_ID = 3"))
+
+    result = import_file(conn, "inventory", source, rejects=str(tmp_path / "rejects.csv"), store=1, log=quiet)
+
+    assert (result.imported, result.rejected) == (1, 1)
+    assert dict(query(conn, "SELECT M_ID, Rem_qty FROM Inventory WHERE D_ID = 3")) == {1: before[1] + 5}
+    assert read_rejects(tmp_path / "rejects.csv") == [("2", "M_ID: only store 1 can be restocked")]
+
+
+@pytest.mark.parametrize("header, message", [
+    (["S_address", "S_phone"], "missing: S_name"),
+    (["S_name", "Fax"], "unknown: Fax"),
+])
+def test_files_with_wrong_columns_are_refused(conn, tmp_path, header, message):
+    source = write_csv(tmp_path / "suppliers.csv", [header, ["a", "b"]])
+    suppliers = query(conn, "SELECT COUNT(*) FROM Supplier")[0][0]
+
+    with pytest.raises(ValueError, match=message):
+        import_file(conn, "suppliers", source, log=quiet)
+    assert query(conn, "SELECT COUNT(*) FROM Supplier")[0][0] == suppliers
@@ -0,0 +1,101 @@
+import pytest
+
+from chatbot_service import FALLBACK_REPLY, ChatService, ChatSession, StubChatBackend, normalize_prompt
+
+
+# Backend that streams nothing, or fails partway through a reply
+class BrokenBackend(StubChatBackend):
+    def __init__(self, fail=False):
+        super().__init__()
+        self.fail = fail
+
+    def stream(self, messages):
+        self.calls.append(list(messages))
+        if self.fail:
+            yield "Partial "
+            raise ConnectionError("backend went away")
+
+
+# Answers questions but cannot summarize
+class NoSummaryBackend(StubChatBackend):
+    def complete(self, prompt):
+        raise ConnectionError("backend went away")
+
+
+def test_normalize_prompt_ignores_case_punctuation_and_filler():
+    assert normalize_prompt("Hi! Could you PLEASE tell me your opening hours?") == "your opening hours"
+    assert normalize_prompt("what are your opening   hours") == "what are your opening hours"
+    # A prompt of nothing but filler keeps its words
+    assert normalize_prompt("Hello, thank you") == "hello thank you"
+
+
+def test_opening_questions_are_answered_from_the_cache():
+    backend = StubChatBackend({"opening hours": "9 to 5."})
+    service = ChatService(backend)
+
+    first = service.reply(ChatSession(), "Opening hours?")
+    again = service.reply(ChatSession(), "please, opening hours")
+
+    assert first == again == "9 to 5."
+    assert len(backend.calls) == 1
+    assert service.stats()["cache_hits"] == 1
+
+
+def test_follow_ups_and_questions_with_context_skip_the_cache():
+    backend = StubChatBackend({"opening hours": "9 to 5."})
+    service = ChatService(backend)
+    service.reply(ChatSession(), "opening hours")
+    session = ChatSession()
+    session.turns = [("user", "Is aspirin in stock?"), ("assistant", "Yes.")]
+
+    service.reply(session, "opening hours")
+    context_session = ChatSession()
+    service.reply(context_session, "opening hours", context="Aspirin: 5 units")
+
+    assert len(backend.calls) == 3
+    # The context goes to the backend, but the session records the question as asked
+    assert "Aspirin: 5 units" in backend.calls[-1][-1][1]
+    assert context_session.turns[0] == ("user", "opening hours")
+    assert session.turns[-2:] == [("user", "opening hours"), ("assistant", "9 to 5.")]
+
+
+def test_long_sessions_are_folded_into_a_summary():
+    backend = StubChatBackend()
+    service = ChatService(backend, max_turns=4, max_summary_chars=200)
+    session = ChatSession()
+
+    for number in range(5):
+        service.reply(session, f"question {number}")
+
+    # Each compaction keeps the newest two messages verbatim and summarizes the rest
+    assert session.turns == [("user", "question 4"), ("assistant", "You asked: question 4")]
+    assert 0 < len(session.summary) <= 200
+    assert service.stats()["summaries"] == 2
+    assert "Summary of the conversation so far" in backend.calls[-2][0][1]
+
+
+def test_failed_summaries_keep_the_newest_transcript():
+    service = ChatService(NoSummaryBackend(), max_turns=2, max_summary_chars=40)
+    session = ChatSession()
+
+    service.reply(session, "first question")
+    service.reply(session, "second question")
+
+    transcript = "User: first question\nAssistant: You asked: first question"
+    assert session.summary == transcript[-40:]
+
+
+def test_empty_and_failed_replies():
+    service = ChatService(BrokenBackend())
+    session = ChatSession()
+
+    assert service.reply(session, "hello?") == FALLBACK_REPLY
+    assert session.turns == [("user", "hello?"), ("assistant", FALLBACK_REPLY)]
+    # The fallback is not cached as the answer
+    assert service.stats()["cache_size"] == 0
+
+    service.backend = BrokenBackend(fail=True)
+    with pytest.raises(ConnectionError):
+        service.reply(session, "again?")
+    assert len(session.turns) == 2
+    assert service.stats()["errors"] == 1
@@ -0,0 +1,85 @@
+import json
+import threading
+
+import pytest
+
+from drug_interactions import (FixtureFetcher, InteractionLookupService, LabelStore, format_warnings,
+                               normalize_drug_name)
+
+LABEL = {"set_id": "abc", "version": "3", "warnings": ["Do not mix with alcohol. Ask a doctor if pregnant"],
+         "openfda": {"brand_name": ["Aspirin"]}}
+
+
+# Fetcher that blocks until released and counts its calls
+class GatedFetcher:
+    def __init__(self, label=None, error=None):
+        self.label = label or {}
+        self.error = error
+        self.calls = []
+        self.release = threading.Event()
+
+    def fetch(self, drug_name):
+        self.calls.append(drug_name)
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self.label
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LabelStore(str(tmp_path / "labels.db"))
+
+
+def test_fixture_fetcher_keeps_label_fields_only(tmp_path):
+    (tmp_path / "aspirin.json").write_text(json.dumps({"results": [LABEL]}), encoding="utf-8")
+    fetcher = FixtureFetcher(str(tmp_path))
+
+    assert fetcher.fetch("  ASPIRIN ") == {"set_id": "abc", "version": "3", "warnings": LABEL["warnings"]}
+    assert fetcher.fetch("Unknown") == {}
+
+
+def test_label_store_survives_reopening_and_expires(tmp_path, store):
+    store.put("aspirin", {"warnings": ["x"]})
+
+    reopened = LabelStore(str(tmp_path / "labels.db"))
+    assert reopened.get("aspirin", 60) == {"warnings": ["x"]}
+    assert reopened.get("aspirin", -1) is None
+    assert reopened.get("ibuprofen", 60) is None
+
+
+def test_concurrent_lookups_share_one_upstream_call(store):
+    fetcher = GatedFetcher(LABEL)
+    service = InteractionLookupService(fetcher, store)
+
+    futures = [service.get_label_async(name) for name in ("Aspirin", "aspirin ", "ASPIRIN")]
+    fetcher.release.set()
+
+    assert [future.result(5) for future in futures] == [LABEL] * 3
+    assert fetcher.calls == ["aspirin"]
+    assert service.stats()["upstream_calls"] == 1 and service.stats()["coalesced"] == 2
+    # Later lookups are memory hits, and a new service finds the label on disk
+    assert service.get_label("Aspirin") == LABEL
+    assert InteractionLookupService(fetcher, store).get_label("aspirin", wait=5) == LABEL
+    assert fetcher.calls == ["aspirin"]
+
+
+def test_lookup_returns_none_while_loading_and_reports_errors(store):
+    fetcher = GatedFetcher(error=RuntimeError("upstream down"))
+    service = InteractionLookupService(fetcher, store)
+    listened = []
+    service.label_listeners.append(lambda drug, label: listened.append(drug))
+
+    assert service.lookup("Aspirin", wait=0.05) is None
+    fetcher.release.set()
+
+    assert service.lookup("Aspirin", wait=5) == "❌ *Error fetching data: upstream down*"
+    assert service.stats()["errors"] >= 1
+    assert listened == []
+
+
+def test_format_warnings():
+    assert format_warnings("Aspirin", {}) == "✅ *No known harmful interactions for Aspirin.*"
+    assert format_warnings("Aspirin", LABEL) == ("⚠ *Warning for Aspirin:*\n\n• Do not mix with alcohol\n\n"
+                                                 "• Ask a doctor if pregnant")
+    assert normalize_drug_name(" Vitamin\tC  ") == "vitamin c"
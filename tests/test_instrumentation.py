@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+import instrumentation
+from instrumentation import Instrumentation, traced, traced_connection
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    instance = Instrumentation(enabled=False)
+    monkeypatch.setattr(instrumentation, "_instrumentation", instance)
+    return instance
+
+
+@traced("test.double")
+def double(value):
+    if value < 0:
+        raise ValueError("negative")
+    return value * 2
+
+
+def test_disabled_instrumentation_records_nothing(metrics):
+    metrics.begin_rerun("Home")
+
+    assert double(2) == 4
+    with metrics.span("block"):
+        pass
+
+    assert metrics.end_rerun() is None
+    assert "test.double" not in metrics.prometheus_text()
+
+
+def test_a_rerun_can_switch_recording_on_for_its_own_thread(metrics):
+    other = []
+
+    def other_thread():
+        metrics.begin_rerun("Other")
+        double(1)
+        other.append(metrics.end_rerun())
+
+    metrics.begin_rerun("Inventory", enabled=True)
+    with metrics.span("page"):
+        double(1)
+        with pytest.raises(ValueError):
+            double(-1)
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    trace = metrics.end_rerun()
+
+    assert other == [None]
+    assert [(name, depth, error) for name, _, _, depth, error in trace.spans] == [
+        ("test.double", 1, False), ("test.double", 1, True), ("page", 0, False)]
+    assert trace.totals()["test.double"][0] == 2
+    assert trace.duration >= 0
+    # The override ends with the rerun
+    assert not metrics.active()
+
+
+def test_spans_per_rerun_are_capped(metrics, monkeypatch):
+    monkeypatch.setattr(instrumentation, "MAX_SPANS_PER_RERUN", 3)
+    metrics.begin_rerun("Home", enabled=True)
+    for _ in range(5):
+        double(1)
+    trace = metrics.end_rerun()
+
+    assert (len(trace.spans), trace.dropped) == (3, 2)
+    # The histograms still count every call
+    assert 'pharmacy_span_seconds_count{span="test.double"} 5' in metrics.prometheus_text()
+
+
+def test_prometheus_text(metrics):
+    metrics.record("db.execute", 0.003)
+    metrics.record("db.execute", 0.2, error=True)
+    metrics.record('odd "name"', 20.0)
+    metrics.begin_rerun("Sales", enabled=True)
+    metrics.end_rerun()
+
+    lines = metrics.prometheus_text().splitlines()
+
+    assert 'pharmacy_span_seconds_bucket{span="db.execute",le="0.001"} 0' in lines
+    assert 'pharmacy_span_seconds_bucket{span="db.execute",le="0.005"} 1' in lines
+    assert 'pharmacy_span_seconds_bucket{span="db.execute",le="0.25"} 2' in lines
+    assert 'pharmacy_span_seconds_bucket{span="db.execute",le="+Inf"} 2' in lines
+    assert 'pharmacy_span_seconds_sum{span="db.execute"} 0.203000' in lines
+    assert 'pharmacy_span_errors_total{span="db.execute"} 1' in lines
+    assert 'pharmacy_span_seconds_bucket{span="odd \\"name\\"",le="10.0"} 0' in lines
+    assert 'pharmacy_rerun_seconds_count{page="Sales"} 1' in lines
+
+
+def test_traced_connections_record_statements(conn, metrics):
+    assert traced_connection(conn) is conn
+
+    metrics.begin_rerun("Home", enabled=True)
+    traced = traced_connection(conn)
+    cursor = traced.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Drugs")
+    assert cursor.fetchone() == (5,)
+    cursor.close()
+    traced.commit()
+    trace = metrics.end_rerun()
+
+    assert [span[0] for span in trace.spans] == ["db.execute", "db.commit"]
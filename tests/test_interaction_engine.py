@@ -0,0 +1,80 @@
+import pytest
+
+from conftest import query
+from interaction_engine import InteractionIndex, format_interaction, pair_key
+
+WARFARIN_LABEL = {
+    "set_id": "w-1", "version": 2,
+    "drug_interactions": ["Aspirin may increase the risk of bleeding. Monitor patients taking IBUPROFEN closely. "
+                          "Store below 25C."],
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return InteractionIndex(str(tmp_path / "interactions.db"))
+
+
+def test_drugs_added_after_the_first_lookup_are_resolved(conn, tmp_path):
+    index = InteractionIndex(str(tmp_path / "interactions.db"))
+    index.add_interactions([("Paracetamol", "Newprofen", "major", "Do not combine.", "test")])
+    assert index.resolve([1]) == ["paracetamol"]
+
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Drugs (D_name) VALUES ('Newprofen')")
+    conn.commit()
+    drug_id = cursor.lastrowid
+    cursor.close()
+
+    assert index.resolve([drug_id, 999]) == ["newprofen"]
+    assert [interaction.severity for interaction in index.check_basket([1, drug_id])] == ["major"]
+    assert query(conn, "SELECT D_name FROM Drugs WHERE D_ID = %s", (drug_id,)) == [("Newprofen",)]
+
+
+def test_pairs_are_unordered_and_persisted(tmp_path, index):
+    assert index.add_interactions([("Aspirin", "Warfarin", "major", "Bleeding.", "test"),
+                                   ("Aspirin", " ASPIRIN", "minor", "Same drug.", "test")]) == 1
+    assert pair_key("Warfarin", "aspirin") == ("aspirin", "warfarin")
+
+    assert InteractionIndex(str(tmp_path / "interactions.db")).check_basket(["warfarin", "Aspirin", "Soap"]) == \
+        index.check_basket(["Aspirin", "Warfarin"])
+    assert len(index.check_basket(["Warfarin", "Aspirin"])) == 1
+    assert format_interaction(index.check_basket(["Aspirin", "Warfarin"])[0]) == \
+        "⚠ *Aspirin + Warfarin* (major): Bleeding."
+
+
+def test_import_csv(tmp_path, index):
+    path = tmp_path / "pairs.csv"
+    path.write_text("drug_a,drug_b,severity,description\nAspirin,Warfarin,major,Bleeding.\n"
+                    "Ibuprofen,Aspirin,,Less effect.\n", encoding="utf-8")
+
+    assert index.import_csv(str(path)) == 2
+    assert sorted((i.drug_a, i.drug_b, i.severity, i.source) for i in index.check_basket(
+        ["Aspirin", "Warfarin", "Ibuprofen"])) == [("aspirin", "ibuprofen", "unknown", "pairs.csv"),
+                                                   ("aspirin", "warfarin", "major", "pairs.csv")]
+
+
+def test_each_label_version_is_imported_once(conn, index):
+    index.add_interactions([("Warfarin", "Ibuprofen", "major", "Curated.", "csv")])
+
+    # Aspirin comes from the Drugs table; the curated ibuprofen pair is kept
+    assert index.import_label("Warfarin", WARFARIN_LABEL) == 1
+    assert {(i.drug_b, i.severity, i.description) for i in index.check_basket(["Warfarin", 2, 4])} == {
+        ("warfarin", "label", "Aspirin may increase the risk of bleeding."), ("warfarin", "major", "Curated.")}
+
+    assert index.import_label("Warfarin", WARFARIN_LABEL) == 0
+    index.add_interactions([("Paracetamol", "Cetirizine", "minor", "Drowsy.", "csv")])
+    newer = dict(WARFARIN_LABEL, version=3, drug_interactions=["Paracetamol raises the INR."])
+    assert index.import_label("Warfarin", newer) == 1
+    assert index.import_label("Warfarin", {"set_id": "x"}) == 0
+
+
+def test_check_customer_includes_earlier_orders(conn, index):
+    index.add_interactions([("Warfarin", "Aspirin", "major", "Bleeding.", "csv"),
+                            ("Warfarin", "Cetirizine", "minor", "Drowsy.", "csv"),
+                            ("Warfarin", "Vitamin K", "moderate", "Less effect.", "csv")])
+
+    # Customer 2 ordered Aspirin and Amoxicillin; Cetirizine was customer 1's
+    found = index.check_customer(2, ["Warfarin", "Vitamin K"])
+
+    assert sorted((i.drug_a, i.drug_b) for i in found) == [("aspirin", "warfarin"), ("vitamin k", "warfarin")]
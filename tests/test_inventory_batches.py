@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+from conftest import query
+from inventory_batches import ExpiredStockError, allocate_fefo, restock
+
+TODAY = datetime.date.today()
+LATER = TODAY + datetime.timedelta(days=365)
+
+
+def new_drug(conn, name="Testamol"):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Drugs (D_name) VALUES (%s)", (name,))
+    conn.commit()
+    drug_id = cursor.lastrowid
+    cursor.close()
+    return drug_id
+
+
+def test_allocate_fefo_takes_first_expiring_unexpired_lots(conn):
+    drug_id = new_drug(conn)
+    for days, qty in ((-1, 50), (90, 4), (30, 3), (60, 2), (30, 1)):
+        restock(conn, drug_id, 1, qty, TODAY + datetime.timedelta(days=days))
+    batches = {(expiry, qty): batch_id for batch_id, expiry, qty in
+               query(conn, "SELECT Batch_ID, Expiry_date, Qty FROM InventoryBatch WHERE D_ID = %s", (drug_id,))}
+
+    def batch(days, qty):
+        return batches[(str(TODAY + datetime.timedelta(days=days)), qty)]
+
+    conn.begin()
+    cursor = conn.cursor()
+    # fetch=2 makes the allocation read several pages of lots
+    taken = allocate_fefo(conn, cursor, drug_id, 1, 8, fetch=2)
+    conn.rollback()
+    cursor.close()
+
+    assert taken == [(batch(30, 3), 3), (batch(30, 1), 1), (batch(60, 2), 2), (batch(90, 4), 2)]
+
+
+def test_allocate_fefo_raises_when_only_expired_lots_are_left(conn):
+    drug_id = new_drug(conn)
+    restock(conn, drug_id, 1, 5, TODAY - datetime.timedelta(days=1))
+    restock(conn, drug_id, 1, 2, LATER)
+
+    conn.begin()
+    cursor = conn.cursor()
+    try:
+        with pytest.raises(ExpiredStockError) as error:
+            allocate_fefo(conn, cursor, drug_id, 1, 3)
+    finally:
+        conn.rollback()
+        cursor.close()
+    assert (error.value.drug_id, error.value.manager_id, error.value.quantity) == (drug_id, 1, 3)
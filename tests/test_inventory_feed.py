@@ -0,0 +1,108 @@
+import datetime
+
+import pytest
+
+import inventory_feed
+from conftest import query
+from db_pool import upsert_sql
+from inventory_feed import (consume, consumer_offset, latest_event_id, read_events, record_events, recent_events,
+                            replay)
+
+
+def add_events(conn, events, created_at=None):
+    cursor = conn.cursor()
+    record_events(cursor, events, created_at)
+    conn.commit()
+    last_id = latest_event_id(cursor)
+    cursor.close()
+    return last_id
+
+
+def offset(conn, name):
+    cursor = conn.cursor()
+    last_id = consumer_offset(cursor, name)
+    cursor.close()
+    return last_id
+
+
+def test_consume_delivers_new_events_in_batches_once(conn):
+    replay(conn, "test", add_events(conn, [(1, 1, 5, 15, "restock")]))
+    last_id = add_events(conn, [(1, 1, -2, 13, "order"), (2, 2, 4, 54, "restock"), (3, 1, -1, 74, "order")])
+    batches = []
+
+    assert consume(conn, "test", batches.append, batch_size=2) == 3
+
+    assert [[(event.D_ID, event.Delta) for event in batch] for batch in batches] == [[(1, -2), (2, 4)], [(3, -1)]]
+    assert offset(conn, "test") == last_id
+    assert consume(conn, "test", batches.append) == 0
+    assert len(batches) == 2
+
+
+def test_a_failed_batch_is_redelivered_with_its_writes_undone(conn):
+    replay(conn, "test", latest_event_id(conn.cursor()))
+    add_events(conn, [(1, 1, -2, 8, "order"), (2, 2, 4, 54, "restock")])
+    alerts = query(conn, "SELECT COUNT(*) FROM AlertLog")[0][0]
+    crash = [True]
+
+    def handler(events):
+        cursor = conn.cursor()
+        for event in events:
+            cursor.execute("INSERT INTO AlertLog (D_ID, M_ID, Rem_qty, Sent_at) VALUES (%s, %s, %s, "
+                           "'2025-01-01 10:00:00')", (event.D_ID, event.M_ID, event.Rem_qty))
+        cursor.close()
+        if crash[0] and events[-1].D_ID == 2:
+            raise RuntimeError("handler crashed")
+
+    with pytest.raises(RuntimeError):
+        consume(conn, "test", handler, batch_size=1)
+
+    # The first batch's alert and offset were committed; the crashed batch left neither behind
+    assert [event.D_ID for event in read_events(conn.cursor(), offset(conn, "test"))] == [2]
+    assert query(conn, "SELECT COUNT(*) FROM AlertLog")[0][0] == alerts + 1
+    crash[0] = False
+    assert consume(conn, "test", handler) == 1
+    assert query(conn, "SELECT COUNT(*) FROM AlertLog")[0][0] == alerts + 2
+
+
+def test_replay_rewinds_a_consumer(conn):
+    first = add_events(conn, [(1, 1, 1, 11, "restock"), (1, 1, 1, 12, "restock")])
+    seen = []
+    consume(conn, "test", lambda events: seen.extend(event.Event_ID for event in events))
+
+    replay(conn, "test", first - 1)
+    seen.clear()
+
+    assert consume(conn, "test", lambda events: seen.extend(event.Event_ID for event in events)) == 1
+    assert seen == [first]
+
+
+def test_settle_window_holds_back_recent_events(conn):
+    start = latest_event_id(conn.cursor())
+    old = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(seconds=30)
+    add_events(conn, [(1, 1, 1, 11, "restock")], old)
+    add_events(conn, [(2, 2, 1, 51, "restock")])
+    cursor = conn.cursor()
+
+    assert [event.D_ID for event in read_events(cursor, start)] == [1, 2]
+    assert [event.D_ID for event in read_events(cursor, start, settle=10)] == [1]
+    cursor.close()
+
+
+def test_mysql_consumers_wait_for_the_settle_window(conn, monkeypatch):
+    replay(conn, "test", latest_event_id(conn.cursor()))
+    add_events(conn, [(2, 2, 1, 51, "restock")])
+    monkeypatch.setattr(conn, "backend", "mysql")
+    monkeypatch.setattr(inventory_feed, "upsert_sql", lambda backend, *args: upsert_sql("sqlite", *args))
+    monkeypatch.setattr(inventory_feed, "MYSQL_SETTLE_SECONDS", 60.0)
+
+    assert consume(conn, "test", lambda events: None) == 0
+    monkeypatch.setattr(inventory_feed, "MYSQL_SETTLE_SECONDS", 0.0)
+    assert consume(conn, "test", lambda events: None) == 1
+
+
+def test_recent_events_newest_first_per_store(conn):
+    add_events(conn, [(1, 1, 1, 11, "restock"), (2, 2, 1, 51, "restock"), (3, 1, -1, 74, "order")])
+
+    assert [(event.D_ID, event.Reason) for event in recent_events(conn, 1, limit=2)] == [(3, "order"),
+                                                                                     (1, "restock")]
+    assert [event.M_ID for event in recent_events(conn, limit=3)] == [1, 2, 1]
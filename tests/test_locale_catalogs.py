@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+import locale_catalogs
+from locale_catalogs import build_catalogs, catalog_path, ensure_catalog, load_catalog, lookup, write_catalog
+from translation_cache import StubTranslatorBackend, TranslationCache, TranslationStore
+
+STRINGS = ("Basket", "Orders", "Next Page")
+
+
+@pytest.fixture
+def catalogs(tmp_path, monkeypatch):
+    monkeypatch.setattr(locale_catalogs, "_built", set())
+    load_catalog.cache_clear()
+    yield str(tmp_path / "locales")
+    load_catalog.cache_clear()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranslationCache(StubTranslatorBackend({("Basket", "fr"): "Panier"}),
+                            TranslationStore(str(tmp_path / "translations.db")))
+
+
+def read(catalogs, lang):
+    with open(catalog_path(lang, catalogs), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_lookup_reads_the_catalog_and_never_translates(catalogs):
+    write_catalog("fr", ["Basket"], {"Basket": "Panier"}, catalogs)
+
+    assert lookup("Basket", "fr", catalogs) == "Panier"
+    # Not in the catalog: the caller falls back to the translation cache
+    assert lookup("Orders", "fr", catalogs) is None
+    assert lookup("Orders", "de", catalogs) is None
+    assert lookup("Orders", "en", catalogs) == "Orders"
+
+
+def test_ensure_catalog_adds_missing_strings_once(catalogs, cache):
+    write_catalog("fr", ["Basket", "Old label"], {"Basket": "Panier (checked)", "Old label": "Ancien"}, catalogs)
+
+    ensure_catalog("fr", STRINGS, cache, catalogs)
+
+    # Existing translations are kept, new strings added in one batch and removed ones dropped
+    assert read(catalogs, "fr") == {"lang": "fr", "strings": {
+        "Basket": "Panier (checked)", "Orders": "[fr] Orders", "Next Page": "[fr] Next Page"}}
+    assert cache.backend.calls == 1
+    assert lookup("Orders", "fr", catalogs) == "[fr] Orders"
+
+    ensure_catalog("fr", STRINGS + ("Added later",), cache, catalogs)
+    ensure_catalog("en", STRINGS, cache, catalogs)
+    assert cache.backend.calls == 1
+    assert not [name for name in os.listdir(catalogs) if name.endswith(".tmp")]
+
+
+def test_ensure_catalog_builds_a_new_language(catalogs, cache):
+    ensure_catalog("kn", STRINGS, cache, catalogs)
+
+    assert read(catalogs, "kn")["strings"] == {text: f"[kn] {text}" for text in STRINGS}
+
+
+def test_offline_and_failing_translators_leave_the_catalog_alone(tmp_path, catalogs, cache, capsys):
+    cache.offline = True
+    ensure_catalog("de", STRINGS, cache, catalogs)
+    assert load_catalog("de", catalogs) == {}
+
+    class BrokenBackend(StubTranslatorBackend):
+        def translate_batch(self, texts, dest):
+            raise ConnectionError("translator down")
+
+    broken = TranslationCache(BrokenBackend(), TranslationStore(str(tmp_path / "broken.db")))
+    ensure_catalog("hi", STRINGS, broken, catalogs)
+
+    assert load_catalog("hi", catalogs) == {}
+    assert "Could not build the hi catalog: translator down" in capsys.readouterr().out
+
+
+def test_build_catalogs_writes_every_language(tmp_path, catalogs, monkeypatch):
+    monkeypatch.setenv("PHARMACY_TRANSLATION_CACHE", str(tmp_path / "translations.db"))
+    source = tmp_path / "page.py"
+    source.write_text('translate_text("Basket", lang)\ntranslate_text("Orders", lang)\n', encoding="utf-8")
+
+    build_catalogs(str(source), catalogs, ["es", "en", "ta"], StubTranslatorBackend())
+
+    assert lookup("Orders", "ta", catalogs) == "[ta] Orders"
+    assert read(catalogs, "es")["strings"] == {"Basket": "[es] Basket", "Orders": "[es] Orders"}
+    assert not (tmp_path / "locales" / "en.json").exists()
@@ -0,0 +1,115 @@
+import datetime
+
+import pytest
+
+from conftest import query
+from inventory_batches import restock
+from order_pipeline import InsufficientStockError, OrderLine, submit_order
+
+TODAY = datetime.date.today()
+LATER = TODAY + datetime.timedelta(days=365)
+
+
+def new_drug(conn, name="Testamol"):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Drugs (D_name) VALUES (%s)", (name,))
+    conn.commit()
+    drug_id = cursor.lastrowid
+    cursor.close()
+    return drug_id
+
+
+def rem_qty(conn, drug_id, store_id):
+    return query(conn, "SELECT Rem_qty FROM Inventory WHERE D_ID = %s AND M_ID = %s", (drug_id, store_id))[0][0]
+
+
+def order_count(conn):
+    return query(conn, "SELECT COUNT(*) FROM Orders")[0][0]
+
+
+def test_submit_order_decrements_stock_and_oldest_batch(conn):
+    drug_id = new_drug(conn)
+    restock(conn, drug_id, 1, 5, LATER + datetime.timedelta(days=30))
+    restock(conn, drug_id, 1, 5, LATER)
+    orders = order_count(conn)
+
+    # Repeated drugs are merged into one line of 7
+    allocations = submit_order(conn, 1, [OrderLine(drug_id, "Testamol", 3), OrderLine(drug_id, "Testamol", 4)],
+                               store_id=1)
+
+    assert allocations == [(OrderLine(drug_id, "Testamol", 7), 1)]
+    assert rem_qty(conn, drug_id, 1) == 3
+    assert query(conn, "SELECT Expiry_date, Qty FROM InventoryBatch WHERE D_ID = %s ORDER BY Expiry_date",
+                 (drug_id,)) == [(str(LATER), 0), (str(LATER + datetime.timedelta(days=30)), 3)]
+    assert order_count(conn) == orders + 1
+    assert query(conn, "SELECT Delta, Rem_qty, Reason FROM InventoryEvent WHERE D_ID = %s ORDER BY Event_ID DESC "
+                       "LIMIT 1", (drug_id,)) == [(-7, 3, "order")]
+
+
+def test_submit_order_picks_a_store_with_enough_stock(conn):
+    drug_id = new_drug(conn)
+    restock(conn, drug_id, 1, 2, LATER)
+    restock(conn, drug_id, 2, 6, LATER)
+
+    assert submit_order(conn, 1, [OrderLine(drug_id, "Testamol", 4)]) == [(OrderLine(drug_id, "Testamol", 4), 2)]
+    assert (rem_qty(conn, drug_id, 1), rem_qty(conn, drug_id, 2)) == (2, 2)
+
+
+def test_insufficient_stock_changes_nothing(conn):
+    drug_id = new_drug(conn)
+    other_id = new_drug(conn, "Otherol")
+    restock(conn, drug_id, 1, 5, LATER)
+    restock(conn, other_id, 1, 1, LATER)
+    orders = order_count(conn)
+
+    with pytest.raises(InsufficientStockError) as error:
+        submit_order(conn, 1, [OrderLine(drug_id, "Testamol", 2), OrderLine(other_id, "Otherol", 2)], store_id=1)
+
+    assert error.value.drug_name == "Otherol"
+    # The first line's decrement is rolled back with the rest of the order
+    assert (rem_qty(conn, drug_id, 1), rem_qty(conn, other_id, 1)) == (5, 1)
+    assert order_count(conn) == orders
+
+
+def test_expired_stock_is_not_sold(conn):
+    drug_id = new_drug(conn)
+    restock(conn, drug_id, 1, 5, TODAY - datetime.timedelta(days=1))
+    orders = order_count(conn)
+
+    with pytest.raises(InsufficientStockError):
+        submit_order(conn, 1, [OrderLine(drug_id, "Testamol", 1)], store_id=1)
+
+    assert rem_qty(conn, drug_id, 1) == 5
+    assert order_count(conn) == orders
+
+
+def test_non_positive_quantity_is_rejected(conn):
+    with pytest.raises(ValueError):
+        submit_order(conn, 1, [OrderLine(1, "Paracetamol", 0)], store_id=1)
+
+
+def test_store_is_picked_by_unexpired_stock(conn):
+    drug_id = new_drug(conn)
+    restock(conn, drug_id, 1, 50, TODAY - datetime.timedelta(days=1))
+    restock(conn, drug_id, 2, 5, LATER)
+
+    # Store 1 has the most Rem_qty, but all of it expired
+    assert submit_order(conn, 1, [OrderLine(drug_id, "Testamol", 3)]) == [(OrderLine(drug_id, "Testamol", 3), 2)]
+    assert (rem_qty(conn, drug_id, 1), rem_qty(conn, drug_id, 2)) == (50, 2)
+
+
+def test_split_order_skips_stores_with_only_expired_stock(conn):
+    from stores import get_store_registry
+
+    drug_id = new_drug(conn)
+    other_id = new_drug(conn, "Otherol")
+    restock(conn, drug_id, 1, 50, TODAY - datetime.timedelta(days=1))
+    restock(conn, drug_id, 2, 5, LATER)
+    restock(conn, other_id, 1, 5, LATER)
+
+    # No store has both drugs, so each line is served by its own store
+    store_id, allocations = get_store_registry().route_order(
+        conn, 1, [OrderLine(drug_id, "Testamol", 3), OrderLine(other_id, "Otherol", 2)])
+
+    assert store_id is None
+    assert allocations == [(OrderLine(drug_id, "Testamol", 3), 2), (OrderLine(other_id, "Otherol", 2), 1)]
@@ -0,0 +1,30 @@
+import pytest
+
+from paged_queries import SALES_SORTS, fetch_sales_page
+
+
+def add_sales(conn, dates):
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO Sales (Total_amt, Date, Time, M_ID) VALUES (%s, %s, '12:00:00', 1)",
+                       [(10 + i, date) for i, date in enumerate(dates)])
+    conn.commit()
+    cursor.close()
+
+
+# Undated sales sort first ascending and last descending, and paging must neither skip nor repeat them
+@pytest.mark.parametrize("sort", SALES_SORTS)
+@pytest.mark.parametrize("page_size", [1, 2, 3])
+def test_pages_cover_sales_without_dates(conn, sort, page_size):
+    add_sales(conn, [None, "2025-02-24", None, "2025-01-01", None])
+    expected = fetch_sales_page(conn, page_size=1000, sort=sort).rows
+
+    rows, after = [], None
+    while True:
+        page = fetch_sales_page(conn, after, page_size, sort=sort)
+        rows += page.rows
+        if page.next_after is None:
+            break
+        after = page.next_after
+
+    assert rows == expected
+    assert len({row[0] for row in rows}) == len(rows) == 10
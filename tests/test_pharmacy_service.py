@@ -0,0 +1,90 @@
+import datetime
+import decimal
+
+import pytest
+
+import pharmacy_service as service
+from conftest import query
+
+LATER = datetime.date.today() + datetime.timedelta(days=365)
+
+
+def test_cursor_round_trip_keeps_value_types():
+    cursors = {"default": (datetime.date(2025, 2, 1), decimal.Decimal("12.50"), 7, "Aspirin"),
+               "store-2": (datetime.datetime(2025, 2, 1, 9, 30), decimal.Decimal("0"), 1, None)}
+
+    token = service.encode_cursor(cursors)
+
+    assert "=" not in token
+    assert service.decode_cursor(token, 4) == cursors
+    assert service.encode_cursor(None) is None and service.decode_cursor("", 4) is None
+
+
+@pytest.mark.parametrize("token", ["garbage", "W10", service.encode_cursor({"default": (1, 2)})])
+def test_bad_cursors_are_value_errors(token):
+    with pytest.raises(ValueError):
+        service.decode_cursor(token, 3)
+
+
+def test_place_order_names_unknown_drugs(conn):
+    with pytest.raises(service.NotFoundError) as error:
+        service.place_order(conn, 2, [(1, 1), (999, 1), (998, 2)])
+    assert str(error.value) == "Unknown drug: 998, 999"
+
+    with pytest.raises(ValueError):
+        service.place_order(conn, 2, [])
+
+
+def stock_of(conn, drug_id):
+    return {d_id: rem_qty for d_id, _, rem_qty in service.drug_stock(conn)}.get(drug_id, 0)
+
+
+def test_restock_and_orders_refresh_the_cached_drug_stock(conn):
+    # The sample batches have all expired, so only the new batch counts as stock
+    assert stock_of(conn, 1) == 0
+
+    assert service.restock_store(conn, 1, 1, 20, LATER) == 30
+    assert stock_of(conn, 1) == 20
+
+    assert service.place_order(conn, 2, [(1, 5)])[0] == 1
+    assert stock_of(conn, 1) == 15
+
+
+def test_supplier_changes_show_in_the_cached_list(conn):
+    supplier_id = service.add_supplier(conn, "Acme", "1 Main St", "5551234567")
+    assert (supplier_id, "Acme", "1 Main St", "5551234567") in service.list_suppliers(conn)
+
+    # Empty fields keep their current value
+    assert service.update_supplier(conn, supplier_id, name="Acme Ltd", address="") is True
+    assert service.update_supplier(conn, supplier_id, name="Acme Ltd") is False
+    assert (supplier_id, "Acme Ltd", "1 Main St", "5551234567") in service.list_suppliers(conn)
+
+    assert service.delete_supplier(conn, supplier_id) == "Acme Ltd"
+    assert supplier_id not in [row[0] for row in service.list_suppliers(conn)]
+    assert query(conn, "SELECT COUNT(*) FROM Supplier WHERE S_ID = %s", (supplier_id,))[0][0] == 0
+
+
+def test_supplier_input_is_checked(conn):
+    with pytest.raises(ValueError):
+        service.add_supplier(conn, "", None, None)
+    with pytest.raises(ValueError):
+        service.add_supplier(conn, "Acme", None, "not a phone")
+    with pytest.raises(service.NotFoundError):
+        service.update_supplier(conn, 999, name="Acme")
+    with pytest.raises(service.NotFoundError):
+        service.delete_supplier(conn, 999)
+
+
+def test_expiring_batches_are_sorted_soonest_first(conn):
+    soon = datetime.date.today() + datetime.timedelta(days=3)
+    service.restock_store(conn, 2, 3, 4, LATER)
+    service.restock_store(conn, 2, 3, 6, soon + datetime.timedelta(days=2))
+    service.restock_store(conn, 1, 2, 5, soon)
+
+    rows = service.expiring_batches(conn, 30)
+
+    assert [(row[1], row[3], row[4], row[5]) for row in rows
+            if row[4] >= str(datetime.date.today())] == [(2, 1, str(soon), 5),
+                                                        (3, 2, str(soon + datetime.timedelta(days=2)), 6)]
+    with pytest.raises(ValueError):
+        service.expiring_batches(conn, -1)
@@ -0,0 +1,90 @@
+import datetime
+import io
+import zipfile
+
+import pytest
+
+import qr_lookup
+from generate_qr_codes import generate_labels, label_payload, render_label
+from inventory_batches import restock
+from qr_lookup import QRScanner, parse_payload
+
+LATER = datetime.date.today() + datetime.timedelta(days=365)
+
+
+@pytest.mark.parametrize("payload, drug_id", [
+    (label_payload(12, "Aspirin"), 12),
+    (" 7 ", 7),
+    ("D_ID=42", 42),
+    ("drug #5", 5),
+    ("https://example.com/aspirin", None),
+    ("", None),
+])
+def test_parse_payload(payload, drug_id):
+    assert parse_payload(payload) == drug_id
+
+
+def test_rendered_labels_decode_to_their_drug():
+    pytest.importorskip("pyzbar.pyzbar", exc_type=ImportError)  # needs the zbar library
+    from PIL import Image
+
+    _, png = render_label((12, label_payload(12, "Aspirin")))
+    # A large photo is decoded downscaled first
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(png)).resize((3000, 3000)).save(buffer, format="PNG")
+
+    assert qr_lookup.decode_image(png) == [label_payload(12, "Aspirin")]
+    assert qr_lookup.decode_image(buffer.getvalue()) == [label_payload(12, "Aspirin")]
+
+
+def test_scan_resolves_payloads_and_caches_decodes(conn, monkeypatch):
+    decoded = []
+
+    def decode_image(data):
+        decoded.append(data)
+        return [label_payload(2, "Aspirin"), "not a label", "Medicine ID: 999"]
+
+    monkeypatch.setattr(qr_lookup, "decode_image", decode_image)
+    scanner = QRScanner()
+    restock(conn, 2, 1, 4, LATER)
+
+    results = scanner.scan(conn, b"image")
+    scanner.scan(conn, b"image")
+
+    assert [(result.drug_id, result.details and result.details["D_name"]) for result in results] == [
+        (2, "Aspirin"), (None, None), (999, None)]
+    # The sample stock of aspirin has expired; only the new batch counts
+    assert results[0].details["Stock"] == 4
+    assert len(decoded) == 1
+    assert scanner.stats()["decodes"] == 1 and scanner.stats()["decode_hits"] == 1
+
+
+def test_drug_details_are_cached_until_the_ttl(conn):
+    scanner = QRScanner(details_ttl=0)
+    cached = QRScanner()
+    assert cached.drug_details(conn, [1])[1]["Stock"] == 0
+
+    restock(conn, 1, 2, 6, LATER)
+
+    assert cached.drug_details(conn, [1])[1]["Stock"] == 0
+    assert scanner.drug_details(conn, [1, 999]) == {1: cached.drug_details(conn, [1])[1] | {"Stock": 6}}
+
+
+def test_generate_labels_renders_only_changed_drugs(conn, tmp_path):
+    output, manifest = str(tmp_path / "labels.zip"), str(tmp_path / "labels.json")
+    drugs = 5
+
+    assert generate_labels(conn, output, manifest, workers=1, log=lambda *args: None) == (drugs, 0, 0)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE Drugs SET D_name = 'Acetaminophen' WHERE D_ID = 1")
+    cursor.execute("DELETE FROM Drugs WHERE D_ID = 5")
+    cursor.execute("INSERT INTO Drugs (D_name) VALUES ('Newprofen')")
+    conn.commit()
+    cursor.close()
+
+    assert generate_labels(conn, output, manifest, workers=1, log=lambda *args: None) == (2, 3, 1)
+    with zipfile.ZipFile(output) as archive:
+        assert sorted(archive.namelist()) == ["D_1.png", "D_2.png", "D_3.png", "D_4.png", "D_6.png"]
+        assert archive.read("D_1.png") == render_label((1, label_payload(1, "Acetaminophen")))[1]
+    assert generate_labels(conn, output, manifest, workers=1, incremental=False,
+                           log=lambda *args: None) == (drugs, 0, 0)
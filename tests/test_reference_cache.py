@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from pharmacy_service import add_supplier
+from reference_cache import ReferenceCache, ReferenceStore, get_reference_cache
+
+
+# A query that counts how often it runs
+class CountingQuery:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, conn):
+        self.calls += 1
+        return [(1, "Acme", datetime.date(2025, 1, 1))]
+
+
+@pytest.fixture
+def clock():
+    return [1_000.0]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReferenceStore(str(tmp_path / "reference.db"))
+
+
+def cache(store, clock, query, ttl=60):
+    return ReferenceCache(store, ttl=ttl, queries={"suppliers": query}, clock=lambda: clock[0])
+
+
+def test_rows_are_cached_and_shared_through_the_store(store, clock):
+    query = CountingQuery()
+    first, second = cache(store, clock, query), cache(store, clock, query)
+
+    assert first.get(None, "suppliers") == [(1, "Acme", datetime.date(2025, 1, 1))]
+    assert first.get(None, "suppliers") is first.get(None, "suppliers")
+    # Another process reads the stored copy; values come back as JSON text
+    assert second.get(None, "suppliers") == [(1, "Acme", "2025-01-01")]
+    assert query.calls == 1
+    assert first.stats()["suppliers"]["hits"] == 2 and second.stats()["suppliers"]["shared_hits"] == 1
+
+
+def test_invalidate_bumps_the_version_for_every_process(store, clock):
+    query = CountingQuery()
+    first, second = cache(store, clock, query), cache(store, clock, query)
+    first.get(None, "suppliers")
+    second.get(None, "suppliers")
+
+    second.invalidate("suppliers")
+
+    assert store.version("suppliers") == 1
+    first.get(None, "suppliers")
+    second.get(None, "suppliers")
+    assert query.calls == 2
+    # Entries of older versions are dropped from the store
+    assert store.get("suppliers", 0) is None
+    assert first.stats()["suppliers"]["loads"] == 2 and second.stats()["suppliers"]["invalidations"] == 1
+
+
+def test_entries_expire_after_the_ttl(store, clock):
+    query = CountingQuery()
+    first = cache(store, clock, query)
+    first.get(None, "suppliers")
+
+    clock[0] += 59
+    cache(store, clock, query).get(None, "suppliers")
+    first.get(None, "suppliers")
+    assert query.calls == 1
+    # A shared copy only lives out what remains of its TTL
+    clock[0] += 2
+    cache(store, clock, query).get(None, "suppliers")
+    assert query.calls == 2
+
+    stats = first.stats()["suppliers"]
+    assert stats["max_age_seconds"] == 59 and stats["hit_ratio"] == 0.5
+
+
+def test_sql_datasets_read_the_database(conn):
+    suppliers = get_reference_cache().get(conn, "suppliers")
+    supplier_id = add_supplier(conn, "Acme", None, None)
+
+    assert [row[0] for row in get_reference_cache().get(conn, "suppliers")] == [row[0] for row in suppliers] + [
+        supplier_id]
+    assert get_reference_cache().get(conn, "managers")[0] == (1, "David Warner")
@@ -0,0 +1,79 @@
+import datetime
+
+import numpy as np
+
+from inventory_batches import restock
+from inventory_feed import record_events
+from reorder_forecast import (build_demand_matrix, by_supplier, demand_statistics, load_demand_history,
+                              reorder_quantities, suggest_reorders)
+from stores import get_store_registry
+
+END = datetime.date(2025, 3, 31)
+
+
+def record_orders(conn, orders):
+    cursor = conn.cursor()
+    for drug_id, store_id, units, day in orders:
+        record_events(cursor, [(drug_id, store_id, -units, 0, "order")], datetime.datetime.combine(
+            day, datetime.time(12)))
+    conn.commit()
+    cursor.close()
+
+
+def test_demand_matrix_adds_up_repeated_entries():
+    matrix = build_demand_matrix(np.array([0, 1, 0]), np.array([2, 0, 2]), np.array([3.0, 1.0, 4.0]), 2, 3)
+    assert matrix.tolist() == [[0, 0, 7], [1, 0, 0]]
+
+
+def test_demand_statistics_weigh_recent_days_more():
+    rate, std = demand_statistics(np.array([[5.0] * 10, [0.0] * 9 + [10.0], [10.0] + [0.0] * 9]), half_life=2)
+
+    assert np.allclose(rate[0], 5) and np.allclose(std[0], 0, atol=1e-6)
+    # The same ten units count far more yesterday than ten days ago
+    assert rate[1] > 2 > rate[2] > 0
+    assert std[1] > 0
+
+
+def test_reorder_quantities():
+    days_of_cover, reorder_point, quantity = reorder_quantities(
+        np.array([2.0, 2.0, 0.0]), np.array([0.0, 0.0, 0.0]), np.array([10.0, 30.0, 0.0]), lead_time=7,
+        review_period=7)
+
+    assert days_of_cover.tolist() == [5, 15, np.inf]
+    assert reorder_point.tolist() == [14, 14, 0]
+    # Only the first drug is at or below its reorder point; it is topped up to two weeks of demand
+    assert quantity.tolist() == [18, 0, 0]
+
+
+def test_history_spans_store_databases(sharded_conn):
+    conn = sharded_conn
+    registry = get_store_registry()
+    record_orders(conn, [(1, 1, 2, END), (1, 1, 1, END - datetime.timedelta(days=1))])
+    registry.move_store(conn, 2, log=lambda *args: None)
+    with registry.connection(2) as store_conn:
+        record_orders(store_conn, [(1, 2, 3, END), (2, 2, 4, END - datetime.timedelta(days=40))])
+
+    drug_ids, demand = load_demand_history(conn, days=30, end_date=END)
+
+    # The order 40 days back is outside the history
+    assert drug_ids.tolist() == [1]
+    assert demand.shape == (1, 30)
+    assert demand[0, -2:].tolist() == [1, 5]
+
+
+def test_suggestions_cover_demand_with_unexpired_stock(conn):
+    later = END + datetime.timedelta(days=3650)
+    restock(conn, 1, 1, 100, later)
+    restock(conn, 2, 1, 5, later)
+    record_orders(conn, [(drug_id, 1, 10, END - datetime.timedelta(days=day)) for day in range(28)
+                         for drug_id in (1, 2, 3)])
+
+    suggestions = suggest_reorders(conn, end_date=END)
+
+    # Older days weigh in, so the daily rate is about 5. Paracetamol's 100 units last past the reorder point;
+    # aspirin's 5 last a day, and cetirizine's only batch has expired.
+    assert suggestions["D_ID"].tolist() == [3, 2]
+    assert suggestions["Days of cover"].tolist() == [0.0, 1.0]
+    assert (suggestions["Suggested qty"] > suggestions["Daily demand"] * 13).all()
+    summary = by_supplier(suggestions)
+    assert summary["Units"].sum() == suggestions["Suggested qty"].sum()
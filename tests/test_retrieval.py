@@ -0,0 +1,116 @@
+import datetime
+
+from inventory_batches import restock
+from retrieval import PharmacyRetriever, TermIndex, tokenize
+from stores import get_store_registry
+
+LATER = datetime.date.today() + datetime.timedelta(days=365)
+
+
+def execute(conn, sql, params=()):
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    conn.commit()
+    row_id = cursor.lastrowid
+    cursor.close()
+    return row_id
+
+
+def test_tokenize_drops_stop_words_and_single_letters():
+    assert tokenize("What is the dose of Vitamin C for a 5yo?") == ["dose", "vitamin", "5yo"]
+
+
+def test_term_index_ranks_replaces_and_removes():
+    index = TermIndex()
+    index.put("a", "aspirin pain relief", "A")
+    index.put("b", "ibuprofen pain fever", "B")
+    index.put("c", "cetirizine allergy", "C")
+
+    assert [key for _, key, _ in index.search("aspirin pain")] == ["a", "b"]
+    assert index.put("a", "aspirin pain relief", "A2") is False
+    assert index.search("aspirin")[0][2] == "A2"
+
+    assert index.put("a", "paracetamol fever", "A3") is True
+    assert index.search("aspirin") == []
+    assert [key for _, key, _ in index.search("fever", k=1)] in (["a"], ["b"])
+    index.remove("b")
+    index.remove("missing")
+    assert [key for _, key, _ in index.search("fever pain")] == ["a"]
+    assert sorted(index.keys()) == ["a", "c"]
+
+
+def test_term_index_compacts_dead_rows():
+    index = TermIndex()
+    for number in range(100):
+        index.put(number, f"drug{number} common", str(number))
+    for number in range(51):
+        index.remove(number)
+
+    # Compaction drops the dead rows once they outnumber the live ones; the rest still rank as before
+    assert len(index._keys) == len(index) == 49
+    assert [key for _, key, _ in index.search("drug75")] == [75]
+    assert len(index.search("common", k=100)) == 49
+
+
+def test_refresh_applies_changes_without_a_full_load(conn):
+    now = [0.0]
+    retriever = PharmacyRetriever(resync_interval=60, clock=lambda: now[0])
+    assert "(out of stock)" in retriever.search(conn, "aspirin")[0]
+
+    # Stock changes come from the feed, new drugs by key, and app edits through mark_changed
+    restock(conn, 2, 1, 9, LATER)
+    drug_id = execute(conn, "INSERT INTO Drugs (D_name, D_use) VALUES ('Newprofen', 'Headache')")
+    execute(conn, "UPDATE Supplier SET S_name = 'Renamed Pharma' WHERE S_ID = 1")
+    retriever.mark_changed("supplier", 1)
+    execute(conn, "DELETE FROM Drugs WHERE D_ID = 5")
+    retriever.mark_changed("drug", 5)
+
+    assert "In stock: 9 units in 1 stores." in retriever.search(conn, "aspirin")[0]
+    assert retriever.search(conn, "newprofen headache")[0].startswith(f"Drug Newprofen (ID {drug_id})")
+    assert retriever.search(conn, "renamed pharma")[0].startswith("Supplier Renamed Pharma (ID 1)")
+    assert retriever.search(conn, "amoxicillin") == []
+    assert retriever.stats()["full_loads"] == 1
+
+    # Edits made outside the app show up at the next resync
+    execute(conn, "UPDATE Drugs SET D_use = 'Allergy relief' WHERE D_ID = 3")
+    assert "Allergy relief" not in "".join(retriever.search(conn, "cetirizine"))
+    now[0] = 60
+    assert "Allergy relief" in retriever.search(conn, "cetirizine")[0]
+    assert retriever.stats()["full_loads"] == 2
+
+
+def test_customer_orders_are_searched_across_store_databases(sharded_conn):
+    conn = sharded_conn
+    registry = get_store_registry()
+    registry.move_store(conn, 2, log=lambda *args: None)
+    with registry.connection(2) as store_conn:
+        execute(store_conn, "INSERT INTO Orders (C_ID, Qty, Item) VALUES (2, 4, 'Aspirin')")
+    retriever = PharmacyRetriever()
+
+    assert retriever.search(conn, "aspirin", customer_id=2)[-1] == \
+        "Your orders: Aspirin ordered 2 time(s), 5 units in total."
+    # A question about orders that names no item lists the customer's orders
+    assert sorted(retriever.search(conn, "my last orders", customer_id=2)) == [
+        "Your orders: Amoxicillin ordered 1 time(s), 3 units in total.",
+        "Your orders: Aspirin ordered 2 time(s), 5 units in total."]
+
+
+def test_full_load_keeps_the_feed_offset_of_a_failed_database(sharded_conn, monkeypatch):
+    registry = get_store_registry()
+    retriever = PharmacyRetriever(resync_interval=0)
+    retriever.refresh(sharded_conn)
+    offsets = dict(retriever._event_ids)
+    assert set(offsets) == {"default", "store-2"}
+
+    run = registry._run
+
+    def fail_store(fn, group, conn):
+        if group.pool_name == "store-2":
+            raise RuntimeError("store database down")
+        return run(fn, group, conn)
+
+    monkeypatch.setattr(registry, "_run", fail_store)
+    retriever._event_ids["store-2"] = 7
+    retriever.refresh(sharded_conn)
+
+    assert retriever._event_ids == {"default": offsets["default"], "store-2": 7}
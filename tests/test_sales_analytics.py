@@ -0,0 +1,85 @@
+import pytest
+
+import sales_analytics
+from conftest import query
+from sales_analytics import ALL_STORES, backfill, refresh_rollups, refresh_rollups_if_due, revenue_trend
+
+
+def add_sales(conn, sales):
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO Sales (Total_amt, Date, Time, M_ID) VALUES (%s, %s, '12:00:00', %s)", sales)
+    conn.commit()
+    cursor.close()
+
+
+def monthly(conn, manager_id=ALL_STORES):
+    trend = revenue_trend(conn, "month", manager_id, periods=12)
+    return {str(start.date()): (round(revenue, 2), count)
+            for start, revenue, count in trend.itertuples(index=False)}
+
+
+def test_refresh_folds_in_only_new_sales(conn):
+    # The schema's sample sales: February 2025, three at store 1 and two at store 2
+    assert refresh_rollups(conn) == 5
+    assert monthly(conn) == {"2025-02-01": (900.0, 5)}
+
+    add_sales(conn, [(10, "2025-02-10", 1), (20, "2025-03-01", 2)])
+    assert refresh_rollups(conn) == 2
+    assert refresh_rollups(conn) == 0
+    assert monthly(conn) == {"2025-02-01": (910.0, 6), "2025-03-01": (20.0, 1)}
+    assert monthly(conn, 2) == {"2025-02-01": (450.0, 2), "2025-03-01": (20.0, 1)}
+
+
+def test_failed_backfill_keeps_the_previous_totals(conn, monkeypatch):
+    refresh_rollups(conn)
+    before = query(conn, "SELECT * FROM SalesRollup ORDER BY Period, M_ID, Period_start")
+
+    def fail(rows):
+        raise RuntimeError("aggregation failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(sales_analytics, "aggregate_sales", fail)
+        with pytest.raises(RuntimeError):
+            backfill(conn)
+
+    assert query(conn, "SELECT * FROM SalesRollup ORDER BY Period, M_ID, Period_start") == before
+    assert query(conn, "SELECT Last_ID FROM RollupState WHERE Name = 'sales'") == [(5,)]
+    assert backfill(conn) == 5
+    assert query(conn, "SELECT * FROM SalesRollup ORDER BY Period, M_ID, Period_start") == before
+
+
+def test_mysql_refresh_waits_for_sales_to_settle(conn, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(sales_analytics.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(sales_analytics, "_seen_sale_ids", {})
+
+    class MySQLConnection:
+        backend = "mysql"
+
+    cursor = conn.cursor()
+
+    def settled():
+        return sales_analytics._settled_sale_id(MySQLConnection(), cursor, "default")
+
+    # Nothing noted long enough ago yet
+    assert settled() is None
+    add_sales(conn, [(10, "2025-03-01", 1)])
+    clock[0] += sales_analytics.MYSQL_SETTLE_SECONDS
+    # Sale 6 may have been preceded by a sale that has not committed yet; only the first noted ID is settled
+    assert settled() == 5
+    clock[0] += sales_analytics.MYSQL_SETTLE_SECONDS
+    assert settled() == 6
+    cursor.close()
+
+
+def test_dashboard_refreshes_are_throttled(conn, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(sales_analytics.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(sales_analytics, "_last_refresh", None)
+
+    assert refresh_rollups_if_due(conn, 60) == 5
+    add_sales(conn, [(10, "2025-03-01", 1)])
+    clock[0] += 59
+    assert refresh_rollups_if_due(conn, 60) == 0
+    clock[0] += 1
+    assert refresh_rollups_if_due(conn, 60) == 1
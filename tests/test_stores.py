@@ -0,0 +1,107 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from conftest import query
+from inventory_batches import restock
+from order_pipeline import OrderLine
+from stores import MOVED_TABLES, get_store_registry
+
+LATER = datetime.date.today() + datetime.timedelta(days=365)
+
+
+def store_rows(conn, store_id):
+    return {table: sorted(query(conn, f"SELECT * FROM {table} WHERE {where}", (store_id,)))
+            for table, (_, where) in MOVED_TABLES.items()}
+
+
+def test_move_store_copies_then_deletes_its_rows(sharded_conn):
+    conn = sharded_conn
+    registry = get_store_registry()
+    restock(conn, 2, 2, 8, LATER)
+    restock(conn, 3, 1, 4, LATER)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO AlertLog (D_ID, M_ID, Rem_qty, Sent_at) VALUES (4, 2, 1, '2025-01-01 10:00:00')")
+    conn.commit()
+    cursor.close()
+    before = store_rows(conn, 2)
+    other_store = store_rows(conn, 1)
+    stock = sorted(registry.unexpired_stock(conn).rows)
+    sales = query(conn, "SELECT COUNT(*), SUM(Total_amt) FROM Sales")[0]
+
+    # Page size 1 makes every table take several pages
+    moved = registry.move_store(conn, 2, page_size=1, log=lambda *args: None)
+
+    assert moved == {table: len(rows) for table, rows in before.items()}
+    assert moved["Inventory"] and moved["Sales"] and moved["AlertLog"]
+    assert all(not rows for rows in store_rows(conn, 2).values())
+    assert store_rows(conn, 1) == other_store
+    with registry.connection(2) as store_conn:
+        assert store_rows(store_conn, 2) == before
+        assert [row[0] for row in query(store_conn, "SELECT M_ID FROM StoreShard")] == [2]
+    # Reads that span the databases see the same data as before
+    assert sorted(registry.unexpired_stock(conn).rows) == stock
+    total = registry.fan_out(lambda store_conn, group: query(store_conn, "SELECT COUNT(*), SUM(Total_amt) FROM Sales"),
+                             conn=conn).rows
+    assert (sum(row[0] for row in total), round(sum(row[1] for row in total), 2)) == (sales[0], round(sales[1], 2))
+
+
+def test_orders_for_a_moved_store_go_to_its_database(sharded_conn):
+    conn = sharded_conn
+    registry = get_store_registry()
+    restock(conn, 2, 2, 8, LATER)
+    registry.move_store(conn, 2, log=lambda *args: None)
+    orders = query(conn, "SELECT COUNT(*) FROM Orders")[0][0]
+
+    store_id, allocations = registry.route_order(conn, 1, [OrderLine(2, "Aspirin", 3)])
+
+    assert (store_id, allocations) == (2, [(OrderLine(2, "Aspirin", 3), 2)])
+    assert query(conn, "SELECT COUNT(*) FROM Orders")[0][0] == orders
+    with registry.connection(2) as store_conn:
+        assert query(store_conn, "SELECT C_ID, Qty, Item FROM Orders") == [(1, 3, "Aspirin")]
+        assert query(store_conn, "SELECT Rem_qty FROM Inventory WHERE D_ID = 2 AND M_ID = 2")[0][0] == 55
+
+
+def test_move_store_needs_a_store_database(sharded_conn):
+    with pytest.raises(ValueError):
+        get_store_registry().move_store(sharded_conn, 1, log=lambda *args: None)
+
+
+def slow_shards(delays):
+    calls = {}
+
+    def fn(store_conn, group):
+        calls[group.pool_name] = (threading.get_ident(), store_conn)
+        time.sleep(delays[group.pool_name])
+        return [group.pool_name]
+
+    return fn, calls
+
+
+def test_fan_out_reports_a_slow_primary_as_timed_out(sharded_conn):
+    registry = get_store_registry()
+    registry.fan_out_timeout = 0.2
+    fn, calls = slow_shards({"default": 1.0, "store-2": 0})
+
+    start = time.perf_counter()
+    result = registry.fan_out(fn)
+
+    assert time.perf_counter() - start < 0.9
+    assert (result.rows, result.failed) == (["store-2"], ["default"])
+    # Without a caller connection the primary is read on a connection of its own
+    assert calls["default"][0] != threading.get_ident()
+
+
+def test_fan_out_uses_the_callers_connection_on_the_callers_thread_only(sharded_conn):
+    registry = get_store_registry()
+    registry.fan_out_timeout = 0.2
+    fn, calls = slow_shards({"default": 0.4, "store-2": 1.0})
+
+    result = registry.fan_out(fn, conn=sharded_conn)
+
+    # The primary outlasted the timeout but was still read, since the caller waited for it on its own thread
+    assert (result.rows, result.failed) == (["default"], ["store-2"])
+    assert calls["default"] == (threading.get_ident(), sharded_conn)
+    assert calls["store-2"][1] is not sharded_conn
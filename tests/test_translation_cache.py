@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from translation_cache import StubTranslatorBackend, TranslationCache, TranslationStore, extract_static_strings
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TranslationStore(str(tmp_path / "translations.db"))
+
+
+def test_lookups_go_memory_then_disk_then_translator(store):
+    backend = StubTranslatorBackend({("Basket", "fr"): "Panier"})
+    cache = TranslationCache(backend, store, batch_size=2)
+
+    assert cache.translate_many(["Basket", "Next Page", "Basket", "Orders"], "fr") == {
+        "Basket": "Panier", "Next Page": "[fr] Next Page", "Orders": "[fr] Orders"}
+    assert backend.calls == 2
+    assert cache.translate("Basket", "fr") == "Panier"
+
+    # A new process finds the translations on disk
+    restarted = TranslationCache(backend, store)
+    assert restarted.translate("Orders", "fr") == "[fr] Orders"
+    assert restarted.translate("Orders", "fr") == "[fr] Orders"
+    assert backend.calls == 2
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["memory_hits"] == 1
+    assert cache.translate("Basket", "en") == "Basket"
+
+
+def test_offline_cache_serves_cached_text_only(store):
+    TranslationCache(StubTranslatorBackend(), store).translate("Basket", "de")
+    backend = StubTranslatorBackend()
+    cache = TranslationCache(backend, store, offline=True)
+
+    assert cache.translate_many(["Basket", "Orders"], "de") == {"Basket": "[de] Basket", "Orders": "Orders"}
+    assert backend.calls == 0
+    assert cache.stats()["offline_misses"] == 1
+
+
+def test_prefetch_translates_a_language_once(store):
+    started = threading.Event()
+    release = threading.Event()
+
+    class SlowBackend(StubTranslatorBackend):
+        def translate_batch(self, texts, dest):
+            started.set()
+            release.wait(5)
+            return super().translate_batch(texts, dest)
+
+    backend = SlowBackend()
+    cache = TranslationCache(backend, store)
+    first = threading.Thread(target=cache.prefetch, args=(["Basket", "Orders"], "hi"))
+    first.start()
+    started.wait(5)
+    # A second session picking the language while the first is still translating does not translate it again
+    cache.prefetch(["Basket", "Orders"], "hi")
+    release.set()
+    first.join()
+    cache.prefetch(["Basket", "Orders"], "hi")
+    cache.prefetch(["Basket"], "en")
+
+    assert backend.calls == 1
+    assert cache.translate("Orders", "hi") == "[hi] Orders"
+
+
+def test_a_failing_prefetch_is_not_retried(store, capsys):
+    class BrokenBackend(StubTranslatorBackend):
+        def translate_batch(self, texts, dest):
+            self.calls += 1
+            raise ConnectionError("translator down")
+
+    backend = BrokenBackend()
+    cache = TranslationCache(backend, store)
+    cache.prefetch(["Basket"], "ta")
+    cache.prefetch(["Basket"], "ta")
+
+    assert backend.calls == 1
+    assert "Translation prefetch failed for ta: translator down" in capsys.readouterr().out
+
+
+def test_extract_static_strings(tmp_path):
+    source = tmp_path / "page.py"
+    source.write_text('translate_text("Basket", lang)\n'
+                      'translate_text(f"Hello {name}", lang)\n'
+                      'other("Ignored")\n'
+                      'translate_text("Orders")\n'
+                      'translate_text("Basket")\n', encoding="utf-8")
+
+    assert extract_static_strings(str(source)) == ("Basket", "Orders")
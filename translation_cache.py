@@ -0,0 +1,211 @@
+import ast
+import functools
+import os
+import sqlite3
+import threading
+
+from cache_utils import LRUCache
+
+SOURCE_LANGUAGE = "en"
+
+
+# Translator backed by googletrans; the client is only created on first use
+class GoogleTranslatorBackend:
+    def __init__(self):
+        self._translator = None
+
+    def translate_batch(self, texts, dest):
+        if self._translator is None:
+            from googletrans import Translator
+            self._translator = Translator()
+        results = self._translator.translate(list(texts), dest=dest)
+        return [result.text for result in results]
+
+
+# Offline stand-in for tests and local development: tags text with the language code
+class StubTranslatorBackend:
+    def __init__(self, translations=None):
+        self.translations = translations or {}
+        self.calls = 0
+
+    def translate_batch(self, texts, dest):
+        self.calls += 1
+        return [self.translations.get((text, dest), f"[{dest}] {text}") for text in texts]
+
+
+TRANSLATOR_BACKENDS = {
+    "google": GoogleTranslatorBackend,
+    "stub": StubTranslatorBackend,
+}
+
+
+# On-disk translation store keyed by (text, language)
+class TranslationStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "text TEXT NOT NULL, lang TEXT NOT NULL, translated TEXT NOT NULL, "
+            "PRIMARY KEY (text, lang))"
+        )
+        self._conn.commit()
+
+    def get_many(self, texts, lang):
+        texts = list(texts)
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(texts), 500):
+                chunk = texts[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows = self._conn.execute(
+                    f"SELECT text, translated FROM translations WHERE lang = ? AND text IN ({placeholders})",
+                    [lang, *chunk],
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, translations, lang):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (text, lang, translated) VALUES (?, ?, ?)",
+                [(text, lang, translated) for text, translated in translations.items()],
+            )
+            self._conn.commit()
+
+
+# Two-tier cache (in-process LRU, then the on-disk store) in front of a translator backend
+class TranslationCache:
+    def __init__(self, backend, store, lru_size=4096, offline=False, batch_size=50):
+        self.backend = backend
+        self.store = store
+        self.offline = offline
+        self.batch_size = batch_size
+        self._memory = LRUCache(lru_size)
+        self._warmed = set()
+        self._lock = threading.Lock()
+        self._stats = {"disk_hits": 0, "misses": 0, "offline_misses": 0, "translator_calls": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _remember(self, translations, lang, persist=True):
+        for text, translated in translations.items():
+            self._memory.put((text, lang), translated)
+        if persist and translations:
+            self.store.put_many(translations, lang)
+
+    def _call_backend(self, texts, lang):
+        translations = {}
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            self._count("translator_calls")
+            translations.update(zip(batch, self.backend.translate_batch(batch, lang)))
+        self._remember(translations, lang)
+        return translations
+
+    def translate_many(self, texts, lang):
+        texts = list(dict.fromkeys(texts))
+        if lang == SOURCE_LANGUAGE:
+            return {text: text for text in texts}
+
+        result = {}
+        missing = []
+        for text in texts:
+            translated = self._memory.get((text, lang))
+            if translated is None:
+                missing.append(text)
+            else:
+                result[text] = translated
+        if not missing:
+            return result
+
+        from_disk = self.store.get_many(missing, lang)
+        self._count("disk_hits", len(from_disk))
+        self._remember(from_disk, lang, persist=False)
+        result.update(from_disk)
+        missing = [text for text in missing if text not in from_disk]
+        if not missing:
+            return result
+
+        self._count("misses", len(missing))
+        if self.offline:
+            # Offline mode only serves what is already cached; show the source text otherwise
+            self._count("offline_misses", len(missing))
+            result.update({text: text for text in missing})
+            return result
+
+        result.update(self._call_backend(missing, lang))
+        return result
+
+    def translate(self, text, lang):
+        return self.translate_many([text], lang)[text]
+
+    # Translate all static UI strings for a language in a few batched calls, once per process
+    def prefetch(self, texts, lang):
+        if lang == SOURCE_LANGUAGE:
+            return
+        # Mark the language first so a failing translator is not retried on every rerun, and so concurrent
+        # sessions picking the same language translate it once
+        with self._lock:
+            if lang in self._warmed:
+                return
+            self._warmed.add(lang)
+        try:
+            self.translate_many(texts, lang)
+        except Exception as e:
+            print(f"Translation prefetch failed for {lang}: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["memory_hits"] = self._memory.hits
+        stats["memory_size"] = len(self._memory)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        return stats
+
+
+# Collect the string literals passed to translate_text() in a source file
+@functools.lru_cache(maxsize=None)
+def extract_static_strings(path, function_name="translate_text"):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    strings = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id == function_name
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+        ):
+            strings.append(node.args[0].value)
+    return tuple(dict.fromkeys(strings))
+
+
+def translation_cache_from_env():
+    env = os.environ
+    backend = TRANSLATOR_BACKENDS[env.get("PHARMACY_TRANSLATOR", "google").lower()]()
+    store = TranslationStore(env.get("PHARMACY_TRANSLATION_CACHE", "translation_cache.db"))
+    return TranslationCache(
+        backend,
+        store,
+        lru_size=int(env.get("PHARMACY_TRANSLATION_LRU_SIZE", "4096")),
+        offline=env.get("PHARMACY_TRANSLATION_OFFLINE", "0") == "1",
+    )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_translation_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = translation_cache_from_env()
+        return _cache
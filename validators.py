@@ -0,0 +1,30 @@
+import re
+
+# Field checks shared by the signup form and bulk imports; each returns (valid, error message)
+
+
+# Validate Email Format
+def validate_email(email):
+    if not re.match(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$", email):
+        return False, "Invalid email format. Please enter a valid email address."
+    return True, ""
+
+# Validate Password
+def validate_password(password):
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters long."
+    if not re.search(r"[a-z]", password):
+        return False, "Password must contain at least one lowercase letter."
+    if not re.search(r"[A-Z]", password):
+        return False, "Password must contain at least one uppercase letter."
+    if not re.search(r"[0-9]", password):
+        return False, "Password must contain at least one digit."
+    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+        return False, "Password must contain at least one special character."
+    return True, ""
+
+# Validate Phone Number (10 digits)
+def validate_phone(phone):
+    if not re.match(r"^\d{10}$", phone):
+        return False, "Invalid phone number format. It must contain exactly 10 digits."
+    return True, ""